@@ -0,0 +1,232 @@
+import argparse
+import datetime
+import functools
+import logging
+import threading
+import time
+
+from data_pull_classes import MultiYearDataPull
+from fetch_scheduler import get_scheduler
+from main import find_pull, pull_tasks
+from pipeline import Pipeline
+from pybaseball import cache
+from utils import configure_logging, load_config
+
+# Requests a unit of the pull makes, the other pulls make one request per unit
+REQUESTS_PER_UNIT = {'draft.amateur_draft': 40, #One per round
+                     'statcast.statcast_outs_above_average': 7, #One per position
+                     'baseball_reference.schedule_and_record': 30} #One per team
+
+
+def requests_per_unit(pull: MultiYearDataPull) -> int:
+
+    return REQUESTS_PER_UNIT.get(f"{pull.schema}.{pull.name}", 1)
+
+def format_seconds(seconds: float) -> str:
+    """Formats seconds as h:mm:ss, ex: 3725.2 -> 1:02:05"""
+
+    return str(datetime.timedelta(seconds=round(seconds)))
+
+
+class Progress():
+    """Counts the units backfilled from each source, and estimates the time left
+
+    Until a source has finished a unit, its time left is its requests divided by its rate in the
+    fetch scheduler. After that, it is its requests left at the pace it has had so far, which
+    includes the time spent parsing and writing. Sources are pulled at the same time,
+    so the backfill finishes with its slowest source.
+    """
+
+    def __init__(self, plan: dict) -> None:
+        self.requests = {} #{source: requests planned}
+        self.finished = {} #{source: requests finished}
+        for pull, units in plan.values():
+            self.requests[pull.source] = self.requests.get(pull.source, 0) + len(units)*requests_per_unit(pull)
+            self.finished[pull.source] = 0
+        self.units = sum(len(units) for _, units in plan.values())
+        self.units_finished = 0
+        self.failed = []
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def seconds_left(self) -> dict:
+        """Estimates the seconds left for each source
+
+        Ex Output:
+            {'savant': 5400.0, 'fangraphs': 1810.5, 'baseball_reference': 2940.0}
+        """
+
+        elapsed = time.monotonic() - self.started
+        rates = get_scheduler().rates
+        seconds = {}
+        for source, requests in self.requests.items():
+            left = requests - self.finished[source]
+            if self.finished[source] > 0:
+                seconds[source] = left * elapsed/self.finished[source]
+            else:
+                seconds[source] = left / rates.get(source, {}).get('rate', 1)
+
+        return seconds
+
+    def eta(self) -> str:
+        """Describes the time left, ex: ETA 1:30:00 (savant is the slowest source)"""
+
+        seconds = self.seconds_left()
+        if not seconds:
+            return 'ETA 0:00:00'
+        slowest = max(seconds, key=seconds.get)
+
+        return f"ETA {format_seconds(seconds[slowest])} ({slowest} is the slowest source)"
+
+    def finish_unit(self, pull: MultiYearDataPull, unit, succeeded: bool) -> None:
+
+        with self.lock:
+            self.finished[pull.source] += requests_per_unit(pull)
+            self.units_finished += 1
+            if not succeeded:
+                self.failed.append(f"{pull.schema}.{pull.name} {unit}")
+            logging.info(f"Backfilled {self.units_finished} of {self.units} units, {self.eta()}")
+
+        return None
+
+
+def find_pulls(tables: list=None) -> tuple:
+    """Finds the year and month pulls that write the tables
+
+    Args:
+        tables (list): Tables in tables_config.yaml, ex: ['statcast.statcast', 'fangraphs.batting_stats'].
+            (default is None, every table that is pulled by year or month)
+
+    Returns:
+        pulls (dict): {pull name: pull}, ex: {'statcast.statcast': StatcastDataPull}
+        tasks (dict): {pull name: (func, dependencies)} of every pull, see main.pull_tasks
+
+    Raises:
+        ValueError: If a table is not in tables_config.yaml or is not pulled by year or month
+    """
+
+    config = load_config()
+    tasks = {name: (func, dependencies) for name, func, dependencies in pull_tasks()}
+
+    explicit = tables is not None
+    if not explicit:
+        tables = [f"{schema}.{table}" for schema, schema_config in config.items() for table in schema_config]
+
+    pulls = {}
+    for table_name in tables:
+        schema, _, table = table_name.partition('.')
+        table_config = config.get(schema, {}).get(table)
+        if table_config is None:
+            raise ValueError(f"{table_name} is not in tables_config.yaml")
+        name = find_pull(schema, table, table_config, set(tasks))
+        #Year and month pulls are run through their update_table method
+        pull = getattr(tasks[name][0], '__self__', None) if name else None
+        if isinstance(pull, MultiYearDataPull):
+            pulls[name] = pull
+        elif explicit:
+            raise ValueError(f"{table_name} is not pulled by year or month, it can not be backfilled")
+
+    return pulls, tasks
+
+def plan_backfill(pulls: dict, start_year: int=None, end_year: int=None) -> dict:
+    """Finds the units of each pull that are not covered yet, ignoring the limit of the pull
+
+    Units that were interrupted are pulled again, and the most recent data is not refreshed,
+    see MultiYearDataPull.update_table
+
+    Args:
+        pulls (dict): {pull name: pull}, see find_pulls
+        start_year (int): First year to backfill. (default is None, the min_year of each pull)
+        end_year (int): Last year to backfill. (default is None, the current year)
+
+    Returns:
+        plan (dict): {pull name: (pull, units)}, ex: {'fangraphs.batting_stats': (MultiYearDataPull, [2002, 2001, 2000])}
+    """
+
+    plan = {}
+    for name, pull in pulls.items():
+        pull._create_directory()
+        pull.potential_coverage = pull._find_potential_coverage()
+        pull.coverage = pull._find_coverage() - pull._find_interrupted()
+        units = [unit for unit in pull._find_outstanding()
+                 if (start_year is None or int(str(unit)[:4]) >= start_year)
+                 and (end_year is None or int(str(unit)[:4]) <= end_year)]
+        logging.info(f"There are {len(units)} units to backfill for {name}")
+        plan[name] = (pull, units)
+
+    return plan
+
+def backfill_table(pull: MultiYearDataPull, units: list, progress: Progress) -> None:
+    """Pulls every unit of a table, each unit is recorded in the checkpoint of the pull, see checkpoint.Checkpoint"""
+
+    pull.checkpoint.start_run(pull.resume)
+    for unit in units:
+        succeeded = pull.checkpoint.run(unit, functools.partial(pull._pull_unit, unit))
+        progress.finish_unit(pull, unit, succeeded)
+    pull.checkpoint.finish_run()
+
+    return None
+
+def create_pipeline(plan: dict, tasks: dict, progress: Progress) -> Pipeline:
+    """Creates a pipeline that backfills every planned table at the same time
+
+    Each source is limited to its rate by the fetch scheduler, so running every table at once
+    keeps each source at its highest allowed rate. Pulls that the backfilled tables depend on,
+    ex: baseball_reference.bwar_bat for the team index, are run first as usual.
+    """
+
+    included = {}
+    def include(name):
+        if name in included:
+            return
+        func, dependencies = tasks[name]
+        if name in plan:
+            func = functools.partial(backfill_table, *plan[name], progress)
+        included[name] = (func, dependencies)
+        for dependency in dependencies:
+            include(dependency)
+
+    for name in plan:
+        include(name)
+
+    pipeline = Pipeline(max_workers=max(1, len(included)))
+    for name, (func, dependencies) in included.items():
+        pipeline.add(f"pull:{name}", func, [f"pull:{d}" for d in dependencies])
+
+    return pipeline
+
+def main(tables: list=None, start_year: int=None, end_year: int=None) -> None:
+    """Pulls every outstanding year and month of the tables, without the limit of each pull
+
+    Used to stand up a new database in one session, see README.md
+
+    Args:
+        tables (list): Tables in tables_config.yaml, ex: ['statcast.statcast']. (default is None, every table pulled by year or month)
+        start_year (int): First year to backfill. (default is None, the min_year of each pull)
+        end_year (int): Last year to backfill. (default is None, the current year)
+    """
+
+    cache.enable()
+    pulls, tasks = find_pulls(tables)
+    plan = plan_backfill(pulls, start_year, end_year)
+    progress = Progress(plan)
+    logging.info(f"Begining to backfill {progress.units} units of {len(plan)} tables, {progress.eta()}")
+
+    try:
+        create_pipeline(plan, tasks, progress).run()
+    finally:
+        elapsed = format_seconds(time.monotonic() - progress.started)
+        logging.info(f"Backfilled {progress.units_finished} of {progress.units} units in {elapsed}")
+        if progress.failed:
+            logging.error(f"Could not backfill {len(progress.failed)} units, they are retried by the next run: {progress.failed}")
+
+    return None
+
+if __name__ == "__main__":
+    configure_logging()
+    parser = argparse.ArgumentParser(description='Pulls every outstanding year and month of the tables, without the limit of each pull')
+    parser.add_argument('tables', nargs='*', help='Tables in tables_config.yaml, ex: statcast.statcast. Default is every table pulled by year or month')
+    parser.add_argument('--start-year', type=int, default=None)
+    parser.add_argument('--end-year', type=int, default=None)
+    args = parser.parse_args()
+    main(args.tables or None, args.start_year, args.end_year)
@@ -0,0 +1,329 @@
+import datetime
+import functools
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import psycopg2
+import psycopg2.extensions
+import update_db
+import yaml
+from data_pull_classes import MultiYearDataPull, StatcastDataPull
+from fetch_scheduler import TokenBucket, get_scheduler
+from storage import file_key, is_data_file, write_frame
+from type_inference import infer_file_types
+from utils import configure_logging, create_db_pool, load_secrets
+
+RESULTS_PATH = 'data/benchmarks.jsonl'
+REGRESSION_THRESHOLD = 1.2 #A benchmark this many times slower than its previous run is logged as a regression
+SCHEMA = 'benchmark'
+SOURCE = 'benchmark' #Fake host of the stubbed pulls, it is not rate limited
+
+# Columns of the synthetic files, about the width of the real tables
+STATCAST_COLUMNS = {'int': 12, 'float': 62, 'text': 16}
+FANGRAPHS_COLUMNS = {'int': 60, 'float': 240, 'text': 4}
+TEXT_VALUES = ['FF', 'SL', 'CH', 'CU', 'SI', 'FC', 'KC', 'FS', 'ball', 'called_strike', 'swinging_strike', 'foul', 'hit_into_play']
+
+# Synthetic tables, registered in the config of the benchmark workspace
+TABLES_CONFIG = {SCHEMA: {'statcast': {'table_type': 'partitioned',
+                                       'directory': 'statcast_dir',
+                                       'iterator': 'month',
+                                       'partitioned_by': 'game_date',
+                                       'indexes': [['pitcher']]},
+                          'statcast_parquet': {'table_type': 'partitioned',
+                                               'directory': 'statcast_parquet_dir',
+                                               'iterator': 'month',
+                                               'partitioned_by': 'game_date',
+                                               'format': 'parquet',
+                                               'copy_format': 'binary',
+                                               'indexes': [['pitcher']]},
+                          'batting_stats': {'table_type': 'partitioned',
+                                            'directory': 'batting_stats_dir',
+                                            'iterator': 'year',
+                                            'partitioned_by': 'season'}}}
+
+
+def make_frame(rows: int, widths: dict, seed: int) -> pd.DataFrame:
+    """Creates random columns with a few percent of nulls, like the pulled tables
+
+    Args:
+        rows (int): Number of rows
+        widths (dict): Number of int, float and text columns, ex: STATCAST_COLUMNS
+        seed (int): Seed of the random values
+
+    Returns:
+        df (pd.DataFrame)
+    """
+
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for i in range(widths['int']):
+        columns[f"int_{i}"] = rng.integers(0, 10**(i % 6 + 1), rows)
+    for i in range(widths['float']):
+        values = rng.normal(50, 20, rows).round(i % 4 + 1)
+        values[rng.random(rows) < 0.05] = np.nan
+        columns[f"float_{i}"] = values
+    for i in range(widths['text']):
+        values = pd.Series(rng.choice(TEXT_VALUES, rows))
+        columns[f"text_{i}"] = values.where(rng.random(rows) > 0.05)
+
+    return pd.DataFrame(columns)
+
+def fake_statcast(start_dt: str, end_dt: str, rows: int=50000) -> pd.DataFrame:
+    """Stands in for pybaseball.statcast, returns a month of statcast width pitches"""
+
+    days = pd.date_range(start_dt, end_dt)
+    df = make_frame(rows, STATCAST_COLUMNS, seed=days[0].year*100 + days[0].month)
+    df.insert(0, 'game_date', np.sort(np.random.default_rng(0).choice(days, rows)))
+    df.insert(1, 'game_pk', np.arange(rows) // 300)
+    df.insert(2, 'at_bat_number', np.arange(rows) % 300 // 5)
+    df.insert(3, 'pitch_number', np.arange(rows) % 5 + 1)
+    df.insert(4, 'pitcher', np.random.default_rng(1).integers(400000, 700000, rows))
+
+    return df
+
+def fake_batting_stats(season: int, rows: int=1500, **kwargs) -> pd.DataFrame:
+    """Stands in for pybaseball.batting_stats, returns a season of fangraphs width player rows"""
+
+    df = make_frame(rows, FANGRAPHS_COLUMNS, seed=season)
+    df.insert(0, 'Season', season)
+
+    return df
+
+
+class Benchmark():
+    """Times the hot paths of a nightly run on synthetic data in a throwaway workspace
+
+    The pulls run with pybaseball replaced by local fakes, in a temporary directory with its
+    own tables_config.yaml, and the loads run against a temporary database that is dropped
+    afterwards, so the real data and database are never touched. Results are appended to
+    RESULTS_PATH and compared with the previous run of each benchmark.
+    """
+
+    def __init__(self, months: int=4, seasons: int=10, results_path: str=RESULTS_PATH) -> None:
+        self.months = months
+        self.seasons = seasons
+        self.results_path = os.path.abspath(results_path)
+        self.secrets_path = os.path.abspath('secrets.yaml')
+        self.directory = None
+        self.database = None
+        self.results = []
+
+    def _time(self, name: str, func, rows: int=None) -> float:
+        """Runs func and records the seconds it took"""
+
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        logging.info(f"{name}: {seconds:.2f}s")
+        self.results.append({'benchmark': name, 'seconds': round(seconds, 4), 'rows': rows})
+
+        return seconds
+
+    def _create_workspace(self) -> None:
+        """Creates the temporary directory the benchmark runs in, with the synthetic tables in its config"""
+
+        self.directory = tempfile.mkdtemp(prefix='baseball_db_benchmark_')
+        os.makedirs(f"{self.directory}/scripts")
+        os.makedirs(f"{self.directory}/data/{SCHEMA}")
+        with open(f"{self.directory}/scripts/tables_config.yaml", 'w') as f:
+            yaml.safe_dump(TABLES_CONFIG, f)
+        os.chdir(self.directory)
+
+        #The fakes return immediately, so the rate limit would be most of the time
+        get_scheduler().buckets[SOURCE] = TokenBucket(rate=10**6, capacity=10**6)
+
+        return None
+
+    def _create_database(self) -> None:
+        """Creates a temporary database on the configured server, and points the workspace's secrets at it"""
+
+        load_secrets(self.secrets_path)
+        dsn = os.getenv('db_access')
+        self.database = f"benchmark_{os.getpid()}"
+
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"create database {self.database}")
+        conn.close()
+
+        secrets = {'secrets': {'db_access': psycopg2.extensions.make_dsn(dsn, dbname=self.database)}}
+        with open('secrets.yaml', 'w') as f:
+            yaml.safe_dump(secrets, f)
+
+        return None
+
+    def _drop_database(self) -> None:
+
+        load_secrets(self.secrets_path)
+        conn = psycopg2.connect(os.getenv('db_access'))
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"drop database if exists {self.database}")
+        conn.close()
+
+        return None
+
+    def bench_pulls(self) -> None:
+        """Times the statcast and fangraphs pulls, which write the files every later benchmark reads"""
+
+        for name in ['statcast', 'statcast_parquet']:
+            pull = StatcastDataPull(name=name, schema=SCHEMA, func=fake_statcast, min_year=2015, limit=self.months)
+            pull.source = SOURCE
+            self._time(f"pull_{name}", pull.update_table)
+
+        pull = MultiYearDataPull(name='batting_stats', schema=SCHEMA, func=fake_batting_stats, min_year=2000,
+                                 limit=self.seasons, source=SOURCE)
+        self._time('pull_batting_stats', pull.update_table)
+
+        return None
+
+    def bench_writes(self) -> None:
+        """Times writing one statcast month in each storage format"""
+
+        df = fake_statcast('2021-04-01', '2021-04-30')
+        for extension in ['.tsv.gz', '.parquet']:
+            path = f"write{extension}"
+            self._time(f"write{extension.replace('.', '_')}", lambda: write_frame(df, path), rows=len(df))
+            os.remove(path)
+
+        return None
+
+    def bench_inference(self) -> None:
+        """Times inferring the types of a statcast month and a fangraphs season"""
+
+        for name in ['statcast', 'statcast_parquet', 'batting_stats']:
+            directory = f"data/{SCHEMA}/{name}_dir/"
+            path = directory + sorted(f for f in os.listdir(directory) if is_data_file(f))[-1]
+            self._time(f"infer_{name}", lambda: infer_file_types(path))
+
+        return None
+
+    def bench_aggregate(self) -> None:
+        """Times concatenating the fangraphs seasons into one file"""
+
+        pull = MultiYearDataPull(name='batting_stats', schema=SCHEMA, func=fake_batting_stats, min_year=2000,
+                                 source=SOURCE)
+        self._time('aggregate_batting_stats', pull._aggregate_data)
+
+        return None
+
+    def bench_loads(self) -> None:
+        """Times loading every synthetic table into the temporary database, then reloading one changed partition"""
+
+        pool = create_db_pool(update_db.MAX_WORKERS + 1)
+        conn = pool.getconn()
+        with conn.cursor() as cur:
+            cur.execute(f"create schema {SCHEMA}")
+            update_db.ensure_manifest_table(conn, cur)
+        pool.putconn(conn)
+
+        try:
+            with ThreadPoolExecutor(max_workers=update_db.MAX_WORKERS) as executor:
+                for table, table_config in TABLES_CONFIG[SCHEMA].items():
+                    load = functools.partial(update_db.load_table, SCHEMA, table, table_config, pool, executor,
+                                             copy_from='stdin')
+                    self._time(f"load_{table}", load)
+
+                #Rewriting the newest month makes the next load an incremental reload of that partition
+                directory = f"data/{SCHEMA}/statcast_dir/"
+                newest = directory + sorted(f for f in os.listdir(directory) if is_data_file(f))[-1]
+                month = pd.Timestamp(f"{file_key(newest)}-01")
+                write_frame(fake_statcast(month, month + pd.offsets.MonthEnd(0), rows=50500), newest)
+                load = functools.partial(update_db.load_table, SCHEMA, 'statcast', TABLES_CONFIG[SCHEMA]['statcast'],
+                                         pool, executor, copy_from='stdin')
+                self._time('reload_statcast_partition', load)
+        finally:
+            pool.closeall()
+
+        return None
+
+    def _commit(self) -> str:
+        """Gets the git commit of the code being benchmarked, None outside of a git checkout"""
+
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(self.results_path),
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _previous_results(self) -> dict:
+        """Gets the most recent result of each benchmark from RESULTS_PATH, from runs over as many months and seasons"""
+
+        previous = {}
+        if os.path.exists(self.results_path):
+            with open(self.results_path) as f:
+                for line in f:
+                    result = json.loads(line)
+                    if (result['months'], result['seasons']) == (self.months, self.seasons):
+                        previous[result['benchmark']] = result
+
+        return previous
+
+    def _record(self) -> None:
+        """Appends the results to RESULTS_PATH, and logs the benchmarks that got slower"""
+
+        previous = self._previous_results()
+        run = {'run_at': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': self._commit(),
+               'months': self.months, 'seasons': self.seasons}
+
+        with open(self.results_path, 'a') as f:
+            for result in self.results:
+                last = previous.get(result['benchmark'])
+                if last and result['seconds'] > last['seconds']*REGRESSION_THRESHOLD:
+                    logging.warning(f"{result['benchmark']} took {result['seconds']:.2f}s, "
+                                    f"{result['seconds']/last['seconds']:.2f}x the {last['seconds']:.2f}s of {last['commit']}")
+                f.write(json.dumps({**run, **result}) + '\n')
+
+        logging.info(f"Wrote {len(self.results)} results to {self.results_path}")
+
+        return None
+
+    def run(self, load: bool=True) -> list:
+        """Runs every benchmark and records the results
+
+        Args:
+            load (bool): Whether to run the load benchmarks, which need a postgres server. (default is True)
+
+        Returns:
+            results (list): [{'benchmark': name, 'seconds': seconds, 'rows': rows}]
+        """
+
+        cwd = os.getcwd()
+        self._create_workspace()
+        try:
+            self.bench_pulls()
+            self.bench_writes()
+            self.bench_inference()
+            self.bench_aggregate()
+            if load:
+                self._create_database()
+                try:
+                    self.bench_loads()
+                finally:
+                    self._drop_database()
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(self.directory)
+
+        self._record()
+
+        return self.results
+
+def main(load: bool=True) -> list:
+    """Runs the benchmark suite, python scripts/benchmark.py [--no-load]"""
+
+    return Benchmark().run(load=load)
+
+if __name__ == "__main__":
+    configure_logging()
+    main(load='--no-load' not in sys.argv[1:])
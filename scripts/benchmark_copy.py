@@ -0,0 +1,90 @@
+import logging
+import os
+import sys
+import time
+
+from storage import get_format, is_data_file, read_columns, read_frame
+from type_inference import infer_file_types
+from update_db import (copy_file, create_column_list, create_stdin_copy_statement,
+                       normalize_column, postgres_type)
+from utils import configure_logging, create_db_connection
+
+STATCAST_DIRECTORY = 'data/statcast/statcast_dir/'
+
+
+def time_copy(conn, cur, path: str, column_types: dict, copy_format: str) -> float:
+    """Copies a file into an empty temporary table and returns the seconds it took
+
+    copy_format is program (the server decompresses a tsv with COPY ... FROM PROGRAM, the default
+    load of _partition_copy_statement), csv or binary (streamed from this machine with COPY ... FROM STDIN)
+    """
+
+    columns = read_columns(path)
+    schema_string = ', '.join(f"{normalize_column(c)} {column_types[c]}" for c in columns)
+    cur.execute(f"drop table if exists benchmark_copy; create temporary table benchmark_copy ({schema_string})")
+    conn.commit()
+
+    start = time.perf_counter()
+    if copy_format == 'program':
+        copy_statement = f'''copy benchmark_copy {create_column_list(columns)}
+                            from program 'gzip -dc {os.path.abspath(path)}'
+                            CSV Header DELIMITER E'\t';'''
+        copy_file(cur, copy_statement, path, 'gzip', 'program')
+    else:
+        copy_file(cur, create_stdin_copy_statement('benchmark_copy', columns, copy_format), path, 'gzip', 'stdin',
+                  column_types=column_types if copy_format == 'binary' else None)
+    conn.commit()
+
+    return time.perf_counter() - start
+
+def main(path: str=None, repeats: int=3) -> dict:
+    """Times the server side COPY ... FROM PROGRAM load against the csv and binary COPY ... FROM STDIN paths on a partition file
+
+    The program copy is the baseline, the load of partitions without copy_from: stdin. It needs
+    the database on this machine and can only read tsv, so a parquet file is written to a temporary
+    tsv.gz first, the same data the table held as tsv before it was switched to parquet.
+
+    Args:
+        path (str): The file to copy. (default is the newest statcast month)
+        repeats (int): Number of copies of each format, the fastest is kept. (default is 3)
+
+    Returns:
+        results (dict): {format: seconds}, ex: {'program': 9.1, 'csv': 8.4, 'binary': 4.7}
+    """
+
+    if path is None:
+        files = sorted(f for f in os.listdir(STATCAST_DIRECTORY) if is_data_file(f))
+        path = f"{STATCAST_DIRECTORY}{files[-1]}"
+
+    column_types = {c: postgres_type(t) for c, t in infer_file_types(path).items()}
+    conn, cur = create_db_connection()
+
+    #Written next to the file, where the server can read it
+    tsv_path = path
+    if get_format(path) == 'parquet':
+        tsv_path = f"{path}.benchmark.tsv.gz"
+        read_frame(path).to_csv(tsv_path, index=False, sep='\t', compression='gzip')
+
+    results = {}
+    try:
+        for copy_format in ['program', 'csv', 'binary']:
+            copy_path = tsv_path if copy_format == 'program' else path
+            results[copy_format] = min(time_copy(conn, cur, copy_path, column_types, copy_format) for _ in range(repeats))
+            logging.info(f"{copy_format} copy of {copy_path} ({get_format(copy_path)}): {results[copy_format]:.2f}s")
+    finally:
+        if tsv_path != path:
+            os.remove(tsv_path)
+
+    cur.execute("select count(*) from benchmark_copy")
+    rows = cur.fetchone()[0]
+    cur.close()
+    conn.close()
+
+    logging.info(f"{rows} rows, binary copy is {results['program']/results['binary']:.2f}x the speed of the program copy "
+                 f"and {results['csv']/results['binary']:.2f}x the speed of the csv copy")
+
+    return results
+
+if __name__ == "__main__":
+    configure_logging()
+    main(*sys.argv[1:2])
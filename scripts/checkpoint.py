@@ -0,0 +1,164 @@
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable
+
+import requests
+from metrics import stage
+from storage import write_json
+
+CHECKPOINT_DIRECTORY = 'data/.checkpoints/'
+MAX_ATTEMPTS = 3 #Attempts of a unit within a run, only transient errors are retried within the run
+BACKOFF_SECONDS = 30 #Wait before the first retry within a run, doubled after each attempt
+RUN_BACKOFF_SECONDS = 6*60*60 #Wait before a unit that failed a run is tried in another run, doubled after each failed run
+MAX_RUN_BACKOFF_SECONDS = 7*24*60*60
+TRANSIENT_STATUS_CODES = [429, 500, 502, 503, 504]
+
+
+def is_transient(error: Exception) -> bool:
+    """Checks if an error may not happen again if the request is retried, ex: a dropped connection or a 503
+
+    Other errors, ex: a season that has no data yet, fail every attempt, so they are only retried in a later run
+    """
+
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in TRANSIENT_STATUS_CODES
+
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError))
+
+
+class Checkpoint():
+    """Journal of the units (years or months) a pull attempted, and which of them succeeded or failed
+
+    A unit is marked attempted before it is pulled and succeeded once its file is written,
+    so a unit still marked attempted was interrupted, and its file can not be trusted.
+    Failed units are retried with exponential backoff, first within the run if the error is transient and then across runs.
+    The journal is written to a temporary file and renamed after every change, so it survives a crash.
+    """
+
+    def __init__(self, table: str, directory: str=CHECKPOINT_DIRECTORY) -> None:
+        self.table = table
+        self.path = f"{directory}{table}.json"
+        self.lock = threading.Lock()
+        journal = self._load()
+        self.run_id = journal['run_id']
+        self.finished = journal['finished']
+        self.units = journal['units']
+
+    def _load(self) -> dict:
+        """Loads the journal from self.path, an empty journal if it does not exist yet"""
+
+        if not os.path.exists(self.path):
+            return {'run_id': None, 'finished': True, 'units': {}}
+
+        with open(self.path) as f:
+            return json.load(f)
+
+    def _save(self) -> None:
+        """Writes the journal atomically, see storage.write_json"""
+
+        write_json({'run_id': self.run_id, 'finished': self.finished, 'units': self.units}, self.path, indent=2)
+
+        return None
+
+    def start_run(self, resume: bool=True) -> bool:
+        """Starts a run of the pull, or continues the last run if it was interrupted
+
+        Args:
+            resume (bool): Whether to continue the last run if it did not finish. (default is True)
+
+        Returns:
+            resumed (bool): Whether the last run is being continued
+        """
+
+        with self.lock:
+            resumed = resume and not self.finished
+            if resumed:
+                logging.info(f"Resuming the interrupted run {self.run_id} of {self.table}")
+            else:
+                self.run_id = datetime.datetime.now().strftime('%Y%m%dT%H%M%S')
+            self.finished = False
+            self._save()
+
+        return resumed
+
+    def finish_run(self) -> None:
+
+        with self.lock:
+            self.finished = True
+            self._save()
+
+        return None
+
+    def _update(self, unit, **fields) -> dict:
+
+        with self.lock:
+            entry = self.units.setdefault(str(unit), {'status': None, 'attempts': 0, 'failed_runs': 0})
+            entry.update(fields, run_id=self.run_id, updated_at=time.time())
+            self._save()
+
+        return entry
+
+    def interrupted(self) -> set:
+        """Gets the units that were being pulled when a run stopped, their files may be truncated"""
+
+        with self.lock:
+            return {unit for unit, entry in self.units.items() if entry['status'] == 'attempted'}
+
+    def unfinished(self) -> set:
+        """Gets the units that were interrupted or failed"""
+
+        with self.lock:
+            return {unit for unit, entry in self.units.items() if entry['status'] in ('attempted', 'failed')}
+
+    def succeeded_this_run(self) -> set:
+        """Gets the units that succeeded in the current run, including the part of it before a resume"""
+
+        with self.lock:
+            return {unit for unit, entry in self.units.items()
+                    if entry['status'] == 'succeeded' and entry['run_id'] == self.run_id}
+
+    def is_due(self, unit) -> bool:
+        """Checks if a unit can be pulled, False while a unit that failed is backing off"""
+
+        with self.lock:
+            entry = self.units.get(str(unit))
+
+        return entry is None or entry['status'] != 'failed' or time.time() >= entry['retry_at']
+
+    def run(self, unit, func: Callable, attempts: int=MAX_ATTEMPTS) -> bool:
+        """Pulls a unit, retrying transient errors with exponential backoff, and records the outcome
+
+        Args:
+            unit: The year or month being pulled, ex: 2021 or 2021-04
+            func (func): Called with no arguments, pulls and writes the unit
+            attempts (int): Maximum number of attempts. (default is MAX_ATTEMPTS)
+
+        Returns:
+            succeeded (bool)
+        """
+
+        with stage('unit', table=self.table, unit=str(unit)) as s:
+            for attempt in range(1, attempts + 1):
+                entry = self._update(unit, status='attempted', attempts=attempt)
+                try:
+                    func()
+                    self._update(unit, status='succeeded', error=None, failed_runs=0)
+                    return True
+                except Exception as e:
+                    error = repr(e)
+                    logging.warning(f"Attempt {attempt} of {attempts} to pull {unit} for {self.table} failed: {error}")
+                    if attempt == attempts or not is_transient(e):
+                        break
+                    s.retries += 1
+                    time.sleep(BACKOFF_SECONDS * 2**(attempt - 1))
+
+            failed_runs = entry['failed_runs'] + 1
+            backoff = min(RUN_BACKOFF_SECONDS * 2**(failed_runs - 1), MAX_RUN_BACKOFF_SECONDS)
+            self._update(unit, status='failed', error=error, failed_runs=failed_runs, retry_at=time.time() + backoff)
+            logging.error(f"Could not pull {unit} for {self.table}, it will be retried after {backoff/3600:.0f} hours")
+
+        return False
@@ -0,0 +1,143 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from lake import Lake
+from storage import read_frame, write_frame
+from utils import configure_logging, file_fingerprint, load_config
+
+REGISTER_TABLE = 'chadwick.chadwick_register'
+CROSSWALK_TABLE = 'chadwick.player_crosswalk'
+# ID of each source: statcast (mlbam), retrosheet, baseball reference and lahman (bbref), fangraphs
+KEY_COLUMNS = ['key_mlbam', 'key_retro', 'key_bbref', 'key_fangraphs']
+NUMERIC_KEYS = ['key_mlbam', 'key_fangraphs'] #Stored as bigint, the other keys are varchar
+NAME_COLUMNS = ['name_first', 'name_last', 'mlb_played_first', 'mlb_played_last']
+
+
+def clean_register(register: pd.DataFrame) -> pd.DataFrame:
+    """Keeps the people of the register with at least one source ID, with missing IDs as nulls
+
+    Rows are sorted by their IDs, so new players are numbered in the same order on every machine
+    """
+
+    register = register[[c for c in KEY_COLUMNS + NAME_COLUMNS if c in register.columns]].copy()
+    for column in KEY_COLUMNS:
+        if column in NUMERIC_KEYS:
+            #The register uses -1 for a missing fangraphs ID
+            keys = pd.to_numeric(register[column], errors='coerce')
+            register[column] = keys.where(keys > 0).astype('Int64')
+        else:
+            register[column] = register[column].where(register[column].astype(str).str.strip() != '')
+
+    register = register.dropna(subset=KEY_COLUMNS, how='all')
+
+    return register.sort_values(KEY_COLUMNS, na_position='last').reset_index(drop=True)
+
+def assign_player_ids(register: pd.DataFrame, previous: pd.DataFrame=None) -> pd.DataFrame:
+    """Gives every person in the register a stable integer player_id
+
+    A person keeps the player_id of the row in the previous crosswalk that shares any of its IDs,
+    so IDs added to the register later, ex: a key_mlbam once a player debuts, never change the key.
+    New people are numbered after the highest player_id ever assigned, and people removed from the
+    register keep their row, so a player_id is never reused. A removed row loses the IDs that a person
+    in the register now holds, ex: after the register merges two people, so every ID maps to one player_id.
+
+    Args:
+        register (pd.DataFrame): See clean_register
+        previous (pd.DataFrame): The last crosswalk. (default is None, numbers every person from 1)
+
+    Returns:
+        crosswalk (pd.DataFrame): player_id and the columns of the register
+    """
+
+    player_ids = pd.Series(np.nan, index=register.index)
+    if previous is not None and len(previous) > 0:
+        for column in KEY_COLUMNS:
+            known = previous.dropna(subset=[column]).drop_duplicates(column).set_index(column)['player_id']
+            player_ids = player_ids.fillna(register[column].map(known).astype(float))
+        #A person split in two by the register keeps the player_id once, the other is new
+        player_ids[player_ids.duplicated() & player_ids.notna()] = np.nan
+        start = int(previous['player_id'].max())
+    else:
+        start = 0
+
+    new = player_ids.isna()
+    player_ids[new] = np.arange(start + 1, start + 1 + new.sum())
+    crosswalk = register.assign(player_id=player_ids.astype(np.int64))
+
+    if previous is not None and len(previous) > 0:
+        removed = previous[~previous['player_id'].isin(crosswalk['player_id'])].copy()
+        if len(removed) > 0:
+            logging.info(f"{len(removed)} players are no longer in the register, keeping their player_id")
+            for column in KEY_COLUMNS:
+                held = removed[column].isin(crosswalk[column].dropna())
+                removed[column] = removed[column].mask(held)
+            crosswalk = pd.concat([crosswalk, removed], ignore_index=True)
+    logging.info(f"Assigned {new.sum()} new player_ids, {len(crosswalk)} players in the crosswalk")
+
+    return crosswalk[['player_id'] + [c for c in crosswalk.columns if c != 'player_id']]
+
+def check_unique_keys(crosswalk: pd.DataFrame) -> None:
+    """Checks that every ID maps to one player_id, the keys of a table are filled by a join on each ID
+
+    Raises:
+        ValueError: If an ID is held by more than one row of the crosswalk
+    """
+
+    for column in KEY_COLUMNS:
+        keys = crosswalk[column].dropna()
+        duplicates = keys[keys.duplicated()].unique()
+        if len(duplicates) > 0:
+            raise ValueError(f"{column} is not unique in the crosswalk, ex: {list(duplicates[:5])}")
+
+    return None
+
+def update_crosswalk(config: dict=None) -> bool:
+    """Builds the crosswalk from the chadwick register, keeping the player_id of every known player
+
+    Returns:
+        written (bool): False if the crosswalk did not change, see storage.write_frame
+    """
+
+    lake = Lake(config or load_config())
+    path = lake.files(CROSSWALK_TABLE)[0]
+    previous = None
+    if os.path.exists(path):
+        previous = read_frame(path)
+        for column in NUMERIC_KEYS:
+            previous[column] = previous[column].astype('Int64')
+
+    crosswalk = assign_player_ids(clean_register(lake.scan(REGISTER_TABLE)), previous)
+    check_unique_keys(crosswalk)
+    written = write_frame(crosswalk, path)
+    if written:
+        logging.info(f"Wrote the crosswalk of {len(crosswalk)} players to {path}")
+
+    return written
+
+def crosswalk_version(config: dict=None) -> str:
+    """Gets the md5 of the crosswalk file, tables keyed from another version are reloaded, None if it was not built yet"""
+
+    path = Lake(config or load_config()).files(CROSSWALK_TABLE)[0]
+    if not os.path.exists(path):
+        return None
+
+    return file_fingerprint(path)['md5']
+
+def tasks() -> list:
+    """Gets the transforms as (name, func, dependencies), the dependencies are pulls, see main.create_pipeline"""
+
+    return [(CROSSWALK_TABLE, update_crosswalk, [REGISTER_TABLE])]
+
+def find_transform(schema: str, table: str):
+    """Finds the transform that writes a table's files, None if the table is pulled"""
+
+    if f"{schema}.{table}" == CROSSWALK_TABLE:
+        return CROSSWALK_TABLE
+
+    return None
+
+if __name__ == "__main__":
+    configure_logging()
+    update_crosswalk()
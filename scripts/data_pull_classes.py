@@ -1,26 +1,45 @@
 import datetime
+import functools
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable
 
 import numpy as np
 import pandas as pd
+from checkpoint import Checkpoint
+from fetch_scheduler import get_source
 from pybaseball import amateur_draft, statcast, schedule_and_record
 from pybaseball.statcast_fielding import statcast_outs_above_average
-from utils import configure_logging, sleep_random
+from response_cache import get_cache, season_end
+from storage import (concat_files, file_key, get_extension, get_table_format,
+                     is_data_file, read_columns, read_frame, write_frame)
+from team_index import get_team_index
+from utils import configure_logging, load_config
+
+PITCH_KEY = ['game_pk', 'at_bat_number', 'pitch_number'] #Uniquely identifies a statcast pitch
+MAX_TEAM_FETCHES = 4 #Team schedules of a year requested at the same time, still rate limited per host
 
 
 class MultiYearDataPull:
 
-    def __init__(self, name, schema, func, min_year, limit: int=10, add_year: bool=False, current_year: bool=False, kwargs: dict={}):
+    def __init__(self, name, schema, func, min_year, limit: int=10, add_year: bool=False, current_year: bool=False, kwargs: dict={}, source: str=None,
+                 resume: bool=True):
         self.name = name
         self.schema = schema
+        self.source = source or get_source(schema) #Host used for rate limiting
         self.func = func
         self.min_year = min_year
         self.limit = limit
         self.add_year = add_year
         self.current_year = current_year
         self.kwargs = kwargs
+        self.resume = resume #Continue the last run if it was interrupted, instead of refreshing the most recent data again
+        self.checkpoint = Checkpoint(f"{schema}.{name}")
+
+        #Storage format is set per table in tables_config.yaml, default is gzip tsv
+        self.file_format = get_table_format(load_config(), schema, name)
+        self.extension = get_extension(self.file_format)
 
         #Paths
         self.table_path = f'data/{schema}/{name}.tsv.gz'
@@ -58,93 +77,133 @@ class MultiYearDataPull:
             coverage (set): set of years that have already been pulled
         """
 
-        #Assumes files are in yyyy.tsv.gz format
-        coverage = {int(f.split('.')[0]) for f in os.listdir(self.directory_path) if 'tsv' in f}
+        #Assumes files are in yyyy.tsv.gz or yyyy.parquet format
+        coverage = {int(file_key(f)) for f in os.listdir(self.directory_path) if is_data_file(f)}
 
         return coverage
 
+    def _fetch(self, year: int, func: Callable, *args, **kwargs):
+        """Calls func(*args, **kwargs) through the response cache, responses fetched after the season never expire"""
+
+        return get_cache().fetch(self.source, func, args, kwargs, final_at=season_end(year))
+
+    def _fetch_team_schedule(self, year: int, team: str) -> pd.DataFrame:
+        """Pulls the schedule and record of a single team"""
+
+        team_df = self._fetch(year, schedule_and_record, season=year, team=team)
+        team_df['orig_scheduled'] = team_df['Orig. Scheduled']
+
+        return team_df.drop(columns='Orig. Scheduled')
+
+    def _order_outstanding(self, outstanding: list) -> list:
+        """Orders the units to pull, units that were interrupted or failed are pulled first
+
+        Units that failed and are still backing off are left out, see checkpoint.Checkpoint
+
+        Args:
+            outstanding (list): The units that are not covered, newest first
+
+        Returns:
+            outstanding (list)
+        """
+
+        due = [unit for unit in outstanding if self.checkpoint.is_due(unit)]
+        if len(due) < len(outstanding):
+            logging.info(f"Waiting to retry {len(outstanding) - len(due)} units of {self.name} that failed")
+        unfinished = self.checkpoint.unfinished()
+
+        return sorted(due, key=lambda unit: str(unit) not in unfinished)
+
+    def _pull_year(self, year: int) -> None:
+        """Pulls a year using self.func, and writes a file in self.file_format to self.directory_path/year.tsv.gz (or year.parquet)"""
+
+        year_path = f"{self.directory_path}{year}{self.extension}"
+
+        #This is amateur draft specifc
+        if self.func==amateur_draft:
+            _round = 1
+            df = []
+            while _round <=100: #Max 100 rounds
+                try:
+                    round_df = self._fetch(year, self.func, year, _round, **self.kwargs)
+                    logging.info(f"Pulled data from the draft, year={year}, round={_round}")
+                    round_df['round'] = _round
+                    df.append(round_df)
+                    _round += 1
+                except ImportError: #Now the draft is over, can move on
+                    break
+        #statcast_outs_above_average specific
+        elif self.func==statcast_outs_above_average:
+            df = []
+            for pos in range(3,10):
+                pos_df = self._fetch(year, statcast_outs_above_average, year, pos, **self.kwargs)
+                df.append(pos_df)
+        
+        elif self.func == schedule_and_record:
+            teams = get_team_index().get_teams(year)
+            with ThreadPoolExecutor(max_workers=MAX_TEAM_FETCHES) as executor:
+                df = list(executor.map(lambda t: self._fetch_team_schedule(year, t), teams))
+        else:
+            df = self._fetch(year, self.func, year, **self.kwargs)
+
+        #For standings and amateur draft, returns list of dfs
+        if isinstance(df,list):
+            df = pd.concat(df)
+        if self.add_year:
+            df['year'] = year
+
+        #Remove The weird date empty string from 2016
+        if self.schema=='retrosheet' and self.name=='schedules':
+            df = df.loc[df['date'].str.len() >1]
+
+        if write_frame(df, year_path):
+            logging.info(f"Wrote data to {year_path}")
+
+        return None
+
+    def _find_outstanding(self) -> list:
+        """Finds the years that are not covered, in the order they are pulled, see self._order_outstanding"""
+
+        return self._order_outstanding(sorted(self.potential_coverage - self.coverage, reverse=True))
+
+    def _pull_unit(self, unit) -> None:
+        """Pulls a unit of the table, a year"""
+
+        return self._pull_year(unit)
+
     def _pull_data(self) -> None:
-        """Pulls the data based on years that are currently uncovered using self.func.
-           Writes a gzip tsv to self.directory_path/year.tsv.gz
+        """Pulls the data based on years that are currently uncovered using self.func, see self._pull_year
+
+        Each year is recorded in self.checkpoint, and retried with backoff if it fails
         """
 
-        outstanding_years = sorted(self.potential_coverage - self.coverage, reverse=True)
+        outstanding_years = self._find_outstanding()
         logging.info(f"There are {len(outstanding_years)} years to pull, pulling {min([self.limit,len(outstanding_years)])} now")
 
         for year in outstanding_years[:self.limit]:
-            sleep_random(min_seconds=5, max_seconds=10)
-            year_path = f"{self.directory_path}{year}.tsv.gz"
-
-            try:
-                #This is amateur draft specifc
-                if self.func==amateur_draft:
-                    _round = 1
-                    df = []
-                    while _round <=100: #Max 100 rounds
-                        sleep_random(min_seconds=1, max_seconds=2)
-                        try:
-                            round_df = self.func(year,_round, **self.kwargs)
-                            logging.info(f"Pulled data from the draft, year={year}, round={_round}")
-                            round_df['round'] = _round
-                            df.append(round_df)
-                            _round += 1
-                        except ImportError: #Now the draft is over, can move on
-                            break
-                #statcast_outs_above_average specific
-                elif self.func==statcast_outs_above_average:
-                    df = []
-                    for pos in range(3,10):
-                        pos_df = statcast_outs_above_average(year, pos, **self.kwargs)
-                        df.append(pos_df)
-                
-                elif self.func == schedule_and_record:
-                    bwar_bat_path = 'data/baseball_reference/bwar_bat.tsv.gz'
-                    bwar_bat = pd.read_csv('data/baseball_reference/bwar_bat.tsv.gz', sep='\t')
-                    teams = bwar_bat.loc[bwar_bat['year_ID']==year, 'team_ID'].unique()
-                    df = []
-                    for t in teams:
-                        sleep_random(min_seconds=.5, max_seconds=1)
-                        team_df = schedule_and_record(season=year, team=t)
-                        team_df['orig_scheduled'] = team_df['Orig. Scheduled']
-                        team_df = team_df.drop(columns='Orig. Scheduled')
-                        df.append(team_df)
-                else:
-                    df = self.func(year, **self.kwargs)
-
-                #For standings and amateur draft, returns list of dfs
-                if isinstance(df,list):
-                    df = pd.concat(df)
-                if self.add_year:
-                    df['year'] = year
-
-                #Remove The weird date empty string from 2016
-                if self.schema=='retrosheet' and self.name=='schedules':
-                    df = df.loc[df['date'].str.len() >1]
-
-                df.to_csv(year_path, index=False, sep='\t', compression='gzip')
-
-                logging.info(f"Wrote data to {year_path}")
-            except:
-                logging.info(f"Could not pull data for {self.name} from {year}")
-                if year==2019:
-                    df = self.func(year, **self.kwargs)
-
+            self.checkpoint.run(year, functools.partial(self._pull_year, year))
 
     def _aggregate_data(self) -> None:
         """ (DEPRECATED) Aggregates all data in the self.directory_path and writes it to self.path"""
 
         logging.info(f"Begining to aggreate data and refresh {self.table_path}")
-        files = [f for f in os.listdir(self.directory_path) if 'tsv' in f]
-        dfs = [pd.read_csv(self.directory_path+f,sep='\t', compression='gzip') for f in files if 'tsv' in f]
-        df = pd.concat(dfs)
-        df.to_csv(self.table_path, sep='\t', index=False, compression='gzip')
+        files = sorted(self.directory_path+f for f in os.listdir(self.directory_path) if is_data_file(f))
+        concat_files(files, self.table_path, drop_columns=['index'])
         logging.info(f"Finished aggregating data and refreshing {self.table_path}")
 
-    def _remove_most_recent_data(self) -> None:
-        """Removes the most recent data in self.directory_path to refresh"""
+    def _find_most_recent_data(self) -> set:
+        """Finds the most recent year in self.directory_path, which is pulled again to refresh it
+
+        The file is kept, and only rewritten if the pulled data changed, see storage.write_frame.
+        Files of the year in another storage format than self.file_format are removed,
+        since the refreshed year is written in self.file_format.
+
+        Returns:
+            refresh (set): The years to pull again, empty if there is no data
+        """
 
         #Test to see if there there any files that are not in yyyy format
-        bad_format = [f for f in os.listdir(self.directory_path) if 'tsv' and len(f.split('.')[0])>4]
+        bad_format = [f for f in os.listdir(self.directory_path) if 'tsv' and len(file_key(f))>4]
         
         if len(bad_format)>0:
             for bad_file in bad_format:
@@ -153,51 +212,76 @@ class MultiYearDataPull:
                 os.remove(bad_file_path)
 
 
-        coverage = {int(f.split('.')[0]) for f in os.listdir(self.directory_path) if 'tsv' in f}
-        if coverage != set():
-            max_year = max(coverage)
-            most_recent_path = f"{self.directory_path}{max_year}.tsv.gz"
-            os.remove(most_recent_path)
+        files = [f for f in os.listdir(self.directory_path) if is_data_file(f)]
+        coverage = {int(file_key(f)) for f in files}
+        if coverage == set():
+            logging.info('There is no data to refresh')
+            return set()
 
-            logging.info(f"Just removed {most_recent_path} to refresh data for {self.name}")
-        else:
-            logging.info('There is no data to remove')
+        max_year = max(coverage)
+        for f in files:
+            if int(file_key(f)) == max_year and not f.endswith(self.extension):
+                os.remove(f"{self.directory_path}{f}")
+        logging.info(f"Refreshing {max_year} for {self.name}")
 
+        return {max_year}
+
+
+    def _find_interrupted(self) -> set:
+        """Finds the covered units that were being pulled when a run stopped, their files may be truncated"""
+
+        interrupted = {unit for unit in self._find_coverage() if str(unit) in self.checkpoint.interrupted()}
+        if interrupted:
+            logging.info(f"Pulling {sorted(interrupted)} again for {self.name}, their pulls were interrupted")
+
+        return interrupted
 
     def update_table(self):
         """Updates the table
 
            Steps
             - check if there is a directory
-            - remove the most recent data
-            - determine current coverage
-            - pull data
-            - aggregate the data in the directory to the self.path
+            - start a run in the checkpoint, or resume the last run if it was interrupted
+            - determine current coverage, without the most recent data so it is pulled again,
+              unless the resumed run already refreshed it, and without units that were interrupted
+            - pull data, files whose data did not change are not rewritten
         """
 
         logging.info(f"Begining to pull update the data for {self.name}")
 
         self._create_directory()
-
-        #Remove Most Recent Data
-        self._remove_most_recent_data()
+        resumed = self.checkpoint.start_run(self.resume)
 
         #Coverage
         self.potential_coverage = self._find_potential_coverage()
-        self.coverage = self._find_coverage()
+        refresh = self._find_most_recent_data()
+        if resumed:
+            refresh = {unit for unit in refresh if str(unit) not in self.checkpoint.succeeded_this_run()}
+        self.coverage = self._find_coverage() - refresh - self._find_interrupted()
 
         self._pull_data()
+        self.checkpoint.finish_run()
 
         logging.info(f"Finished updating the data for {self.name}")
 
 class StatcastDataPull(MultiYearDataPull):
 
-    def __init__(self, name: str='statcast', schema: str='statcast', func=statcast, min_year: int=2008, limit: int=4):
+    def __init__(self, name: str='statcast', schema: str='statcast', func=statcast, min_year: int=2008, limit: int=4,
+                 incremental: bool=False, lookback_days: int=3, resume: bool=True):
         self.name = name
         self.schema = schema
+        self.source = get_source(schema)
         self.func = func
         self.min_year = min_year
         self.limit = limit
+        self.incremental = incremental #Pull the days since the last game_date instead of re-pulling the last two months
+        self.lookback_days = lookback_days #Days before the last game_date that are re-pulled to pick up corrections
+        self.resume = resume #Continue the last run if it was interrupted, instead of refreshing the most recent data again
+        self.checkpoint = Checkpoint(f"{schema}.{name}")
+
+        #Storage format is set per table in tables_config.yaml, default is gzip tsv
+        self.file_format = get_table_format(load_config(), schema, name)
+        self.extension = get_extension(self.file_format)
 
         #Paths
         self.table_path = f'data/{schema}/{name}.tsv.gz'
@@ -240,48 +324,73 @@ class StatcastDataPull(MultiYearDataPull):
             coverage (set): set of years that have already been pulled
         """
 
-        #Assumes files are in yyyy.tsv.gz format
-        coverage = {(f.split('.')[0]) for f in os.listdir(self.directory_path) if 'tsv' in f}
+        #Assumes files are in yyyy-mm.tsv.gz or yyyy-mm.parquet format
+        coverage = {file_key(f) for f in os.listdir(self.directory_path) if is_data_file(f)}
 
         return coverage
 
+    def _pull_month(self, month: str) -> None:
+        """Pulls a month using self.func, and writes a file in self.file_format to self.directory_path/yyyy-mm.tsv.gz (or yyyy-mm.parquet)"""
+
+        month_path = f"{self.directory_path}{month}{self.extension}"
+        month_start = self.month_start_end.get(month)['start']
+        month_end = self.month_start_end.get(month)['end']
+        logging.info(f"Pulling data for {month}, month_start={month_start}, month_end={month_end}")
+        #Statcast is corrected for a few weeks after the games, older months will not change
+        final_at = (pd.Timestamp(month_end) + pd.Timedelta(days=30)).to_pydatetime()
+        df = get_cache().fetch(self.source, self.func, kwargs={'start_dt': month_start, 'end_dt': month_end},
+                               final_at=final_at)
+        if write_frame(df, month_path):
+            logging.info(f"Wrote data to {month_path}")
+
+        return None
+
+    def _find_outstanding(self) -> list:
+        """Finds the months that are not covered, in the order they are pulled, see self._order_outstanding
+
+        Months without games are left out, ex: 2020-04
+        """
+
+        outstanding = self.potential_coverage - self.coverage
+
+        return self._order_outstanding(sorted((m for m in outstanding if m in self.month_start_end), reverse=True))
+
+    def _pull_unit(self, unit) -> None:
+        """Pulls a unit of the table, a month"""
+
+        return self._pull_month(unit)
+
     def _pull_data(self) -> None:
-        """Pulls the data based on years that are currently uncovered using self.func.
-           Writes a gzip tsv to self.directory_path/year.tsv.gz
+        """Pulls the data based on months that are currently uncovered using self.func, see self._pull_month
+
+        Each month is recorded in self.checkpoint, and retried with backoff if it fails
         """
 
-        outstanding_months = sorted(self.potential_coverage - self.coverage, reverse=True)
+        outstanding_months = self._find_outstanding()
         logging.info(f"There are {len(outstanding_months)} months to pull, pulling {min([self.limit,len(outstanding_months)])} now")
 
         for month in outstanding_months[:self.limit]:
-            sleep_random()
-            try:
-                month_path = f"{self.directory_path}{month}.tsv.gz"
-                month_start = self.month_start_end.get(month)['start']
-                month_end = self.month_start_end.get(month)['end']
-                logging.info(f"Pulling data for {month}, month_start={month_start}, month_end={month_end}")
-                df = self.func(start_dt=month_start, end_dt=month_end)
-                df.to_csv(month_path, index=False, sep='\t', compression='gzip')
-
-                logging.info(f"Wrote data to {month_path}")
-            except:
-                logging.info(f"Could not pull data for {self.name} from {month}")
+            self.checkpoint.run(month, functools.partial(self._pull_month, month))
 
     def _aggregate_data(self) -> None:
         """ (DEPRECATED) Aggregates all data in the self.directory_path and writes it to self.path"""
 
         logging.info(f"Begining to aggreate data and refresh {self.table_path}")
-        files = [f for f in os.listdir(self.directory_path) if 'tsv' in f]
-        dfs = [pd.read_csv(self.directory_path+f,sep='\t', compression='gzip').drop(columns=['index']) for f in files]
-        df = pd.concat(dfs)
-        df.to_csv(self.table_path, sep='\t', index=False, compression='gzip')
+        files = sorted(self.directory_path+f for f in os.listdir(self.directory_path) if is_data_file(f))
+        concat_files(files, self.table_path, drop_columns=['index'])
         logging.info(f"Finished aggregating data and refreshing {self.table_path}")
 
-    def _remove_most_recent_data(self) -> None:
-        """Removes the most recent data in self.directory_path to refresh"""
+    def _find_most_recent_data(self) -> set:
+        """Finds the two most recent months in self.directory_path, which are pulled again to refresh them
+
+        The files are kept, and only rewritten if the pulled data changed, see MultiYearDataPull._find_most_recent_data
+
+        Returns:
+            refresh (set): The months to pull again, ex: {'2021-08', '2021-09'}
+        """
 
         #Test to see if there there any files that are not in yyyy format
-        bad_format = [f for f in os.listdir(self.directory_path) if 'tsv' and len(f.split('.')[0])>7]
+        bad_format = [f for f in os.listdir(self.directory_path) if 'tsv' and len(file_key(f))>7]
         
         if len(bad_format)>0:
             for bad_file in bad_format:
@@ -290,20 +399,140 @@ class StatcastDataPull(MultiYearDataPull):
                 os.remove(bad_file_path)
 
 
-        coverage = {(f.split('.')[0]) for f in os.listdir(self.directory_path) if 'tsv' in f}
-        max_date = max(coverage)
-        most_recent_path = f"{self.directory_path}{max_date}.tsv.gz"
-        os.remove(most_recent_path)
-        logging.info(f"Just removed {most_recent_path} to refresh data for {self.name}")
+        files = [f for f in os.listdir(self.directory_path) if is_data_file(f)]
+        coverage = {file_key(f) for f in files}
+        most_recent_dates = set(sorted(coverage)[-2:])
+        for f in files:
+            if file_key(f) in most_recent_dates and not f.endswith(self.extension):
+                os.remove(f"{self.directory_path}{f}")
+        logging.info(f"Refreshing {sorted(most_recent_dates)} for {self.name}")
+
+        return most_recent_dates
+
+    def _month_files(self, month: str) -> list:
+        """Finds the files of a month in any storage format, ex: 2021-04 -> [data/statcast/statcast_dir/2021-04.parquet]"""
+
+        return [f"{self.directory_path}{f}" for f in os.listdir(self.directory_path)
+                if is_data_file(f) and file_key(f) == month]
+
+    def _find_max_game_date(self):
+        """Finds the most recent game_date that has been pulled
+
+        Returns:
+            max_date (datetime.date): None if no data has been pulled
+        """
+
+        files = sorted((f"{self.directory_path}{f}" for f in os.listdir(self.directory_path) if is_data_file(f)),
+                       key=file_key, reverse=True)
+
+        #The newest months can be empty, ex: the month after the current one
+        for path in files:
+            if 'game_date' not in read_columns(path):
+                continue
+            game_dates = pd.to_datetime(read_frame(path, columns=['game_date'])['game_date'])
+            if game_dates.notna().any():
+                return game_dates.max().date()
 
-        next_max_date = max(coverage - {max_date})
-        next_most_recent_path = f"{self.directory_path}{next_max_date}.tsv.gz"
-        os.remove(next_most_recent_path)
-        logging.info(f"Just removed {next_most_recent_path} to refresh data for {self.name}")
+        return None
+
+    def _merge_month(self, month: str, new_df: pd.DataFrame, window_start: pd.Timestamp) -> None:
+        """Merges newly pulled days into a month file
+
+        Rows of the existing file on or after window_start are replaced by the new pull, and
+        the result is deduplicated on PITCH_KEY, keeping the newly pulled row
+
+        Args:
+            month (str): The month, ex: 2021-04
+            new_df (pd.DataFrame): The pulled rows of the month
+            window_start (pd.Timestamp): First day of the pull
+        """
+
+        month_files = self._month_files(month)
+        dfs = []
+        for path in month_files:
+            existing = read_frame(path)
+            if 'game_date' in existing.columns:
+                existing = existing.loc[pd.to_datetime(existing['game_date']) < window_start]
+            dfs.append(existing)
+        dfs.append(new_df)
+
+        df = pd.concat(dfs, ignore_index=True)
+        df['game_date'] = pd.to_datetime(df['game_date'])
+        df = df.drop(columns=['index'], errors='ignore')
+        df = df.drop_duplicates(subset=PITCH_KEY, keep='last').sort_values(['game_date'] + PITCH_KEY)
+
+        month_path = f"{self.directory_path}{month}{self.extension}"
+        write_frame(df, month_path)
+        for path in month_files:
+            if path != month_path:
+                os.remove(path)
+
+        logging.info(f"Merged {len(new_df)} pulled rows into {month_path}, it now has {len(df)} rows")
+
+        return None
+
+    def _pull_recent_days(self, max_date: datetime.date) -> None:
+        """Pulls every day from lookback_days before max_date through today and merges them into their month files
+
+        Args:
+            max_date (datetime.date): The most recent game_date that has been pulled
+        """
+
+        start_dt = max_date - datetime.timedelta(days=self.lookback_days)
+        end_dt = datetime.datetime.today().date()
+        logging.info(f"Pulling statcast days from {start_dt} to {end_dt}")
+
+        df = get_cache().fetch(self.source, self.func,
+                               kwargs={'start_dt': start_dt.strftime('%Y-%m-%d'), 'end_dt': end_dt.strftime('%Y-%m-%d')})
+        if df is None or len(df) == 0:
+            logging.info(f"There is no new statcast data from {start_dt} to {end_dt}")
+            return None
+
+        df['game_date'] = pd.to_datetime(df['game_date'])
+        for month, month_df in df.groupby(df['game_date'].dt.strftime('%Y-%m')):
+            self._merge_month(month, month_df, pd.Timestamp(start_dt))
+
+        return None
+
+    def update_table(self):
+        """Updates the table
+
+           Steps when incremental
+            - check if there is a directory
+            - pull the days since the most recent game_date (minus lookback_days) and merge them into their months
+            - determine current coverage
+            - pull any months that are still uncovered
+
+           Otherwise the two most recent months are pulled again, see MultiYearDataPull.update_table
+        """
+
+        if not self.incremental:
+            return super().update_table()
+
+        self._create_directory()
+        max_date = self._find_max_game_date()
+        if max_date is None:
+            logging.info(f"There is no data for {self.name} yet, pulling whole months")
+            return super().update_table()
+
+        logging.info(f"Begining to incrementally update the data for {self.name}, the last game_date is {max_date}")
+        self.checkpoint.start_run(self.resume)
+        self._pull_recent_days(max_date)
+
+        #Coverage
+        self.potential_coverage = self._find_potential_coverage()
+        self.coverage = self._find_coverage() - self._find_interrupted()
+
+        self._pull_data()
+        self.checkpoint.finish_run()
+
+        logging.info(f"Finished updating the data for {self.name}")
 
 def pull_single_table(func: Callable[[],pd.DataFrame], path_prefix: str, kwargs=None) -> pd.DataFrame:
     """Pulls data from a pybaseball function that doesn't require an argument
-       and overwrites it to to the path_prefix+func.__name__.tsv.gz
+       and overwrites it to to the path_prefix+func.__name__.tsv.gz (or .parquet if configured)
+
+    The request goes through the response cache and is rate limited by the host of the schema in the path_prefix
 
     Args:
         func (func): The function that is pulling the data
@@ -317,11 +546,12 @@ def pull_single_table(func: Callable[[],pd.DataFrame], path_prefix: str, kwargs=
     logging.info(f"Begining to pull {func.__name__} from {source}")
 
     if kwargs is not None:
-        df = func(**kwargs)
+        df = get_cache().fetch(get_source(source), func, kwargs=kwargs)
     else:
-        df = func()
-    path = path_prefix+func.__name__+'.tsv.gz'
-    df.to_csv(path, index=False, sep='\t', compression='gzip')
+        df = get_cache().fetch(get_source(source), func)
+    file_format = get_table_format(load_config(), source, func.__name__)
+    path = path_prefix+func.__name__+get_extension(file_format)
+    write_frame(df, path)
 
     logging.info(f"Pulled {func.__name__} from {source} and wrote it to {path}")
 
@@ -0,0 +1,301 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from lake import Lake
+from storage import (file_key, get_extension, get_table_format, write_frame,
+                     write_json)
+from utils import configure_logging, load_config
+
+MANIFEST_PATH = 'data/.derived_manifest.json' #Stat of the inputs each derived file was computed from
+WOBA_SCALE = 'fangraphs.woba_scale'
+STATCAST_COLUMNS = ['game_pk', 'game_date', 'batter', 'pitcher', 'events', 'description', 'type',
+                    'launch_speed', 'release_speed', 'estimated_woba_using_speedangle']
+WEIGHT_COLUMNS = ['wBB', 'wHBP', 'w1B', 'w2B', 'w3B', 'wHR']
+
+# Derived tables in tables_config.yaml, game tables are partitioned by month and season tables by year
+GAME_TABLES = {'statcast.batter_game': 'batter', 'statcast.pitcher_game': 'pitcher'}
+SEASON_TABLES = {'statcast.batter_season': 'statcast.batter_game', 'statcast.pitcher_season': 'statcast.pitcher_game'}
+KEY_COLUMNS = ['game_pk', 'game_date', 'season', 'batter', 'pitcher']
+RATE_COLUMNS = ['woba', 'xwoba', 'avg_launch_speed', 'avg_release_speed', 'hard_hit_rate', 'whiff_rate', 'fip']
+
+# Events counted in each column, events that are not listed do not end a plate appearance with a count
+EVENT_COUNTS = {'singles': ['single'],
+                'doubles': ['double'],
+                'triples': ['triple'],
+                'home_runs': ['home_run'],
+                'walks': ['walk'],
+                'intentional_walks': ['intent_walk'],
+                'hit_by_pitch': ['hit_by_pitch'],
+                'strikeouts': ['strikeout', 'strikeout_double_play'],
+                'sac_flies': ['sac_fly', 'sac_fly_double_play'],
+                'sac_bunts': ['sac_bunt', 'sac_bunt_double_play'],
+                'catcher_interference': ['catcher_interf']}
+WEIGHT_EVENTS = {'w1B': 'singles', 'w2B': 'doubles', 'w3B': 'triples', 'wHR': 'home_runs', 'wBB': 'walks', 'wHBP': 'hit_by_pitch'}
+# Events that end an inning or a pitch without ending the plate appearance
+NON_PA_PREFIXES = ('caught_stealing', 'pickoff', 'stolen_base', 'other_advance', 'wild_pitch', 'passed_ball', 'game_advisory')
+OUTS_PER_EVENT = {'field_out': 1, 'force_out': 1, 'fielders_choice_out': 1, 'other_out': 1, 'strikeout': 1,
+                  'sac_fly': 1, 'sac_bunt': 1, 'double_play': 2, 'grounded_into_double_play': 2,
+                  'strikeout_double_play': 2, 'sac_fly_double_play': 2, 'sac_bunt_double_play': 2, 'triple_play': 3,
+                  'caught_stealing_2b': 1, 'caught_stealing_3b': 1, 'caught_stealing_home': 1,
+                  'pickoff_1b': 1, 'pickoff_2b': 1, 'pickoff_3b': 1, 'pickoff_caught_stealing_2b': 1,
+                  'pickoff_caught_stealing_3b': 1, 'pickoff_caught_stealing_home': 1}
+WHIFF_DESCRIPTIONS = ['swinging_strike', 'swinging_strike_blocked', 'foul_tip', 'missed_bunt']
+SWING_DESCRIPTIONS = WHIFF_DESCRIPTIONS + ['foul', 'foul_bunt', 'hit_into_play', 'hit_into_play_no_out', 'hit_into_play_score']
+HARD_HIT_SPEED = 95 #Exit velocity of a hard hit ball, mph
+
+
+def load_weights(lake: Lake) -> pd.DataFrame:
+    """Reads the linear weights and FIP constant of each season from fangraphs.woba_scale
+
+    Ex Output:
+        season   wBB  wHBP   w1B   w2B   w3B   wHR   cfip
+          2021 0.692 0.722 0.879 1.242 1.568 2.007  3.170
+    """
+
+    weights = lake.scan(WOBA_SCALE, columns=['Season', 'cFIP'] + WEIGHT_COLUMNS)
+
+    return weights.rename(columns={'Season': 'season', 'cFIP': 'cfip'}).drop_duplicates('season')
+
+def derive_pitches(df: pd.DataFrame, weights: pd.DataFrame) -> pd.DataFrame:
+    """Computes the counting columns of each pitch, joined with the linear weights of its season
+
+    wOBA follows the fangraphs definition, (w1B*1B + ... + wBB*uBB + wHBP*HBP) / (AB + uBB + SF + HBP),
+    xwOBA replaces the value of each batted ball with its estimated_woba_using_speedangle.
+
+    Args:
+        df (pd.DataFrame): Statcast pitches with STATCAST_COLUMNS
+        weights (pd.DataFrame): See load_weights
+
+    Returns:
+        pitches (pd.DataFrame): game_pk, game_date, season, batter, pitcher and one numeric column per count
+    """
+
+    events = df['events']
+    pitches = df[['game_pk', 'game_date', 'batter', 'pitcher']].copy()
+    pitches['game_date'] = pd.to_datetime(pitches['game_date'])
+    pitches['season'] = pitches['game_date'].dt.year
+    pitches = pitches.merge(weights, how='left', on='season')
+
+    pitches['pitches'] = 1
+    pitches['plate_appearances'] = (events.notna() & ~events.fillna('').str.startswith(NON_PA_PREFIXES)).to_numpy(dtype=np.int64)
+    for column, column_events in EVENT_COUNTS.items():
+        pitches[column] = events.isin(column_events).to_numpy(dtype=np.int64)
+    pitches['at_bats'] = pitches['plate_appearances'] - pitches[['walks', 'intentional_walks', 'hit_by_pitch', 'sac_flies',
+                                                                 'sac_bunts', 'catcher_interference']].sum(axis=1)
+    pitches['hits'] = pitches[['singles', 'doubles', 'triples', 'home_runs']].sum(axis=1)
+    pitches['outs'] = events.map(OUTS_PER_EVENT).fillna(0).to_numpy(dtype=np.int64)
+
+    pitches['woba_denom'] = pitches['at_bats'] + pitches['walks'] + pitches['sac_flies'] + pitches['hit_by_pitch']
+    pitches['woba_value'] = sum(pitches[w] * pitches[column] for w, column in WEIGHT_EVENTS.items())
+    batted = (df['type'] == 'X').to_numpy()
+    estimated = df['estimated_woba_using_speedangle'].to_numpy(dtype=np.float64)
+    in_denom = pitches['woba_denom'].to_numpy() > 0
+    pitches['xwoba_value'] = np.where(batted & in_denom & ~np.isnan(estimated), estimated, pitches['woba_value'])
+
+    pitches['batted_balls'] = batted.astype(np.int64)
+    launch_speed = df['launch_speed'].to_numpy(dtype=np.float64)
+    pitches['hard_hit'] = (batted & (launch_speed >= HARD_HIT_SPEED)).astype(np.int64)
+    pitches['launch_speed_total'] = np.where(batted, np.nan_to_num(launch_speed), 0)
+    pitches['launch_speed_count'] = (batted & ~np.isnan(launch_speed)).astype(np.int64)
+    release_speed = df['release_speed'].to_numpy(dtype=np.float64)
+    pitches['release_speed_total'] = np.nan_to_num(release_speed)
+    pitches['release_speed_count'] = (~np.isnan(release_speed)).astype(np.int64)
+    pitches['swings'] = df['description'].isin(SWING_DESCRIPTIONS).to_numpy(dtype=np.int64)
+    pitches['whiffs'] = df['description'].isin(WHIFF_DESCRIPTIONS).to_numpy(dtype=np.int64)
+
+    return pitches.drop(columns=['cfip'] + WEIGHT_COLUMNS)
+
+def _ratio(numerator: pd.Series, denominator: pd.Series) -> np.ndarray:
+    """Divides two columns, null where the denominator is 0"""
+
+    denominator = denominator.to_numpy(dtype=np.float64)
+
+    return np.divide(numerator.to_numpy(dtype=np.float64), denominator, out=np.full(len(denominator), np.nan),
+                     where=denominator > 0)
+
+def add_rates(summary: pd.DataFrame, weights: pd.DataFrame, pitcher: bool) -> pd.DataFrame:
+    """Computes the rates of a summary from its counts, so summaries can be summed and their rates computed again
+
+    FIP is only computed for pitchers, ((13*HR + 3*(uBB+HBP) - 2*K) / IP) + cFIP of the season
+    """
+
+    summary['woba'] = _ratio(summary['woba_value'], summary['woba_denom'])
+    summary['xwoba'] = _ratio(summary['xwoba_value'], summary['woba_denom'])
+    summary['avg_launch_speed'] = _ratio(summary['launch_speed_total'], summary['launch_speed_count'])
+    summary['avg_release_speed'] = _ratio(summary['release_speed_total'], summary['release_speed_count'])
+    summary['hard_hit_rate'] = _ratio(summary['hard_hit'], summary['batted_balls'])
+    summary['whiff_rate'] = _ratio(summary['whiffs'], summary['swings'])
+    if pitcher:
+        cfip = summary[['season']].merge(weights[['season', 'cfip']], how='left', on='season')['cfip'].to_numpy()
+        fip_numerator = 13*summary['home_runs'] + 3*(summary['walks'] + summary['hit_by_pitch']) - 2*summary['strikeouts']
+        summary['fip'] = _ratio(fip_numerator, summary['outs']/3) + cfip
+
+    return summary
+
+def summarize(pitches: pd.DataFrame, keys: list, weights: pd.DataFrame, pitcher: bool) -> pd.DataFrame:
+    """Sums the counts of each group, ex: keys=['game_pk', 'game_date', 'season', 'batter'], and computes its rates"""
+
+    counts = [c for c in pitches.columns if c not in KEY_COLUMNS + RATE_COLUMNS]
+    summary = pitches.groupby(keys, sort=False)[counts].sum().reset_index()
+
+    return add_rates(summary, weights, pitcher)
+
+
+class DerivedTables():
+    """Computes the derived statcast tables from the pulled files, one partition at a time
+
+    Each game table partition is computed from the statcast partition of the same month,
+    and each season table partition from the game table partitions of that year. A partition
+    is only computed again when one of its inputs changed since it was last computed, see MANIFEST_PATH.
+    The files are written with write_frame, so a partition whose data did not change is not reloaded.
+    """
+
+    def __init__(self, config: dict=None, data_directory: str='data/', manifest_path: str=MANIFEST_PATH) -> None:
+        self.config = config or load_config()
+        self.data_directory = data_directory
+        self.lake = Lake(self.config, data_directory)
+        self.manifest_path = manifest_path
+        self.manifest = self._load()
+
+    def _load(self) -> dict:
+        """Loads the manifest from self.manifest_path, an empty manifest if it does not exist yet"""
+
+        if not os.path.exists(self.manifest_path):
+            return {}
+
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _save(self) -> None:
+        """Writes the manifest atomically, see storage.write_json"""
+
+        write_json(self.manifest, self.manifest_path, indent=2)
+
+        return None
+
+    def _directory(self, table: str) -> str:
+        """Gets the directory of a derived table, creating it if it does not exist"""
+
+        schema, name = table.split('.')
+        directory = f"{self.data_directory}{schema}/{self.config[schema][name]['directory']}/"
+        os.makedirs(directory, exist_ok=True)
+
+        return directory
+
+    def _path(self, table: str, key: str) -> str:
+        """Gets the file of a partition of a derived table, ex: data/statcast/batter_game_dir/2021-04.parquet"""
+
+        schema, name = table.split('.')
+
+        return f"{self._directory(table)}{key}{get_extension(get_table_format(self.config, schema, name))}"
+
+    def _is_current(self, outputs: list, inputs: list) -> bool:
+        """Checks if every output exists and was computed from the inputs as they are now"""
+
+        signature = [[path, os.path.getsize(path), os.path.getmtime(path)] for path in sorted(inputs)]
+
+        return all(os.path.exists(path) and self.manifest.get(os.path.abspath(path)) == signature for path in outputs)
+
+    def _record(self, outputs: list, inputs: list) -> None:
+
+        signature = [[path, os.path.getsize(path), os.path.getmtime(path)] for path in sorted(inputs)]
+        for path in outputs:
+            self.manifest[os.path.abspath(path)] = signature
+        self._save()
+
+        return None
+
+    def update_game_tables(self, weights: pd.DataFrame) -> list:
+        """Computes the game table partitions of every statcast month that changed
+
+        Returns:
+            months (list): The months that were computed, ex: ['2021-09', '2021-10']
+        """
+
+        woba_scale_path = self.lake.files(WOBA_SCALE)[0]
+        months = []
+        for path in self.lake.files('statcast.statcast'):
+            month = file_key(path)
+            outputs = [self._path(table, month) for table in GAME_TABLES]
+            if self._is_current(outputs, [path, woba_scale_path]):
+                continue
+
+            _, df = next(self.lake.iter_partitions('statcast.statcast', STATCAST_COLUMNS, start=month, end=month))
+            pitches = derive_pitches(df, weights)
+            if pitches['woba_value'].isna().any():
+                logging.warning(f"{WOBA_SCALE} has no weights for some seasons in {month}, their wOBA is null")
+            for (table, player), output in zip(GAME_TABLES.items(), outputs):
+                summary = summarize(pitches, ['game_pk', 'game_date', 'season', player], weights, pitcher=player == 'pitcher')
+                if write_frame(summary, output):
+                    logging.info(f"Wrote {len(summary)} rows to {output}")
+            self._record(outputs, [path, woba_scale_path])
+            months.append(month)
+
+        return months
+
+    def update_season_tables(self, weights: pd.DataFrame) -> list:
+        """Computes the season table partitions of every year whose game table partitions changed
+
+        Returns:
+            seasons (list): The seasons that were computed, ex: ['2021']
+        """
+
+        seasons = set()
+        for table, game_table in SEASON_TABLES.items():
+            player = GAME_TABLES[game_table]
+            game_files = {}
+            for path in self.lake.files(game_table):
+                game_files.setdefault(file_key(path)[:4], []).append(path)
+
+            for season, inputs in sorted(game_files.items()):
+                output = self._path(table, season)
+                if self._is_current([output], inputs):
+                    continue
+                games = self.lake.scan(game_table, start=season, end=season)
+                summary = summarize(games, ['season', player], weights, pitcher=player == 'pitcher')
+                if write_frame(summary, output):
+                    logging.info(f"Wrote {len(summary)} rows to {output}")
+                self._record([output], inputs)
+                seasons.add(season)
+
+        return sorted(seasons)
+
+    def update(self) -> None:
+        """Computes every derived partition whose inputs changed, the game tables first"""
+
+        logging.info('Begining to update the derived statcast tables')
+        for table in list(GAME_TABLES) + list(SEASON_TABLES):
+            self._directory(table)
+        weights = load_weights(self.lake)
+        months = self.update_game_tables(weights)
+        seasons = self.update_season_tables(weights)
+        logging.info(f"Finished updating the derived statcast tables, computed months {months} and seasons {seasons}")
+
+        return None
+
+
+def update_derived_tables() -> None:
+
+    DerivedTables().update()
+
+    return None
+
+def tasks() -> list:
+    """Gets the transforms as (name, func, dependencies), the dependencies are pulls, see main.create_pipeline"""
+
+    return [('statcast.derived', update_derived_tables, ['statcast.statcast', 'fangraphs.woba_scale'])]
+
+def find_transform(schema: str, table: str):
+    """Finds the transform that writes a table's files, None if the table is pulled"""
+
+    if f"{schema}.{table}" in GAME_TABLES or f"{schema}.{table}" in SEASON_TABLES:
+        return 'statcast.derived'
+
+    return None
+
+if __name__ == "__main__":
+    configure_logging()
+    update_derived_tables()
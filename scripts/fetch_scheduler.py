@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+from typing import Callable
+
+from metrics import stage
+
+# Requests per second and burst size allowed against each host
+SOURCE_RATES = {'fangraphs': {'rate': 1/5, 'capacity': 1},
+                'baseball_reference': {'rate': 1/3.5, 'capacity': 1},
+                'savant': {'rate': 1/2, 'capacity': 2},
+                'retrosheet': {'rate': 1/2, 'capacity': 2},
+                'lahman': {'rate': 1, 'capacity': 2},
+                'chadwick': {'rate': 1, 'capacity': 2}}
+
+# The host that each schema in data/ is pulled from
+SCHEMA_SOURCES = {'fangraphs': 'fangraphs',
+                  'baseball_reference': 'baseball_reference',
+                  'draft': 'baseball_reference',
+                  'statcast': 'savant',
+                  'retrosheet': 'retrosheet',
+                  'lahman': 'lahman',
+                  'chadwick': 'chadwick'}
+
+
+class TokenBucket():
+
+    def __init__(self, rate: float, capacity: int=1) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Takes a token from the bucket, waiting until one is available
+
+        The token is reserved while holding the lock, so concurrent callers are
+        spaced out by 1/rate seconds instead of all waking up at once.
+
+        Returns:
+            wait (float): Number of seconds spent waiting
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated)*self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = max(0, -self.tokens/self.rate)
+
+        if wait > 0:
+            time.sleep(wait)
+
+        return wait
+
+
+class FetchScheduler():
+
+    def __init__(self, rates: dict=SOURCE_RATES) -> None:
+        self.rates = rates
+        self.buckets = {source: TokenBucket(**rate) for source, rate in rates.items()}
+        self.lock = threading.Lock()
+
+    def _get_bucket(self, source: str) -> TokenBucket:
+        """Gets the bucket for a source, sources without a configured rate get one request per second"""
+
+        with self.lock:
+            if source not in self.buckets:
+                logging.info(f"No rate configured for {source}, defaulting to one request per second")
+                self.buckets[source] = TokenBucket(rate=1)
+
+        return self.buckets[source]
+
+    def throttle(self, source: str) -> float:
+        """Waits until a request to the source is allowed
+
+        Args:
+            source (str): The host being requested, ex: fangraphs
+
+        Returns:
+            wait (float): Number of seconds spent waiting
+        """
+
+        return self._get_bucket(source).acquire()
+
+    def fetch(self, source: str, func: Callable, *args, **kwargs):
+        """Calls func(*args, **kwargs) once the rate limit for the source allows it
+
+        Args:
+            source (str): The host that func requests, ex: fangraphs
+            func (func): The function that is pulling the data
+
+        Returns:
+            The return value of func
+        """
+
+        with stage('throttle', source=source):
+            self.throttle(source)
+
+        with stage('fetch', source=source, func=getattr(func, '__name__', str(func))) as s:
+            result = func(*args, **kwargs)
+            if hasattr(result, 'shape'):
+                s.rows = len(result)
+            elif hasattr(result, 'content'):
+                s.bytes = len(result.content)
+
+        return result
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> FetchScheduler:
+    """Gets the scheduler shared by every pull in the process, so each host has a single rate limit"""
+
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FetchScheduler()
+
+    return _scheduler
+
+def get_source(schema: str) -> str:
+    """Gets the host a schema is pulled from, ex: statcast -> savant"""
+
+    return SCHEMA_SOURCES.get(schema, schema)
+
+def fetch(source: str, func: Callable, *args, **kwargs):
+    """Calls func(*args, **kwargs) through the shared scheduler, see FetchScheduler.fetch"""
+
+    return get_scheduler().fetch(source, func, *args, **kwargs)
@@ -0,0 +1,298 @@
+import logging
+import os
+import re
+
+import pandas as pd
+from storage import _import_pyarrow, file_key, get_format, is_data_file, iter_chunks
+from utils import load_config
+
+OPERATORS = ['=', '==', '!=', '<', '<=', '>', '>=', 'in']
+DATE_ITERATORS = ['month', 'year_date'] #Iterators whose partitioned_by column is a date
+
+
+def _import_duckdb():
+    """Imports duckdb, which is only needed to query the lake with sql"""
+
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError('duckdb is required to query the lake with sql, use Lake.scan instead') from e
+
+    return duckdb
+
+def partition_range(iterator: str, key: str) -> tuple:
+    """Gets the range of partitioned_by values a partition file holds, the same ranges as the postgres partitions
+
+    Args:
+        iterator (str): month, year, year_date or year_date_int
+        key (str): The partition key of the file, ex: 2021-04
+
+    Returns:
+        low, high: The range is low <= value < high
+
+    Ex Output:
+        partition_range('month', '2021-04') -> (Timestamp('2021-04-01'), Timestamp('2021-05-01'))
+    """
+
+    if iterator == 'month':
+        low = pd.Timestamp(f"{key}-01")
+        return low, low + pd.DateOffset(months=1)
+    if iterator == 'year':
+        return int(key), int(key) + 1
+    if iterator == 'year_date':
+        return pd.Timestamp(f"{key}-01-01"), pd.Timestamp(f"{int(key)+1}-01-01")
+    if iterator == 'year_date_int':
+        return int(f"{key}0101"), int(f"{int(key)+1}0101")
+
+    raise ValueError(f"Unknown iterator {iterator}")
+
+def _may_match(low, high, op: str, value) -> bool:
+    """Checks if any value in low <= x < high could satisfy x op value, when unsure the file is kept"""
+
+    if op == 'in':
+        return any(_may_match(low, high, '=', v) for v in value)
+    if isinstance(low, pd.Timestamp):
+        value = pd.Timestamp(value)
+    else:
+        value = int(value)
+
+    if op in ('=', '=='):
+        return low <= value < high
+    if op in ('>', '>='):
+        return value < high
+    if op == '<':
+        return low < value
+    if op == '<=':
+        return low <= value
+
+    return True
+
+def _apply_filters(df: pd.DataFrame, filters: list) -> pd.DataFrame:
+    """Keeps the rows of a DataFrame that match every (column, op, value) filter"""
+
+    for column, op, value in filters:
+        series = df[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            value = [pd.Timestamp(v) for v in value] if op == 'in' else pd.Timestamp(value)
+
+        if op == 'in':
+            mask = series.isin(value)
+        elif op in ('=', '=='):
+            mask = series == value
+        elif op == '!=':
+            mask = series != value
+        elif op == '<':
+            mask = series < value
+        elif op == '<=':
+            mask = series <= value
+        elif op == '>':
+            mask = series > value
+        else:
+            mask = series >= value
+        df = df[mask]
+
+    return df
+
+
+class Lake():
+    """Queries the files in data/ directly, without loading them into postgres
+
+    Every table in tables_config.yaml is read from its file, or the files of its partition directory.
+    Partitions are pruned by the range of partitioned_by values in their file name, only the
+    requested columns are read, and parquet files skip the row groups that can not match the filters.
+    """
+
+    def __init__(self, config: dict=None, data_directory: str='data/') -> None:
+        self.config = config or load_config()
+        self.data_directory = data_directory
+
+    def _table_config(self, table: str) -> tuple:
+        """Gets the schema, name and config of a table, ex: statcast.statcast"""
+
+        schema, name = table.split('.')
+        if name not in self.config.get(schema, {}):
+            raise KeyError(f"{table} is not in tables_config.yaml")
+
+        return schema, name, self.config[schema][name]
+
+    def files(self, table: str, filters: list=None) -> list:
+        """Gets the files of a table, pruning the partitions that can not match the filters
+
+        Args:
+            table (str): ex: statcast.statcast
+            filters (list): [(column, op, value)], ex: [('game_date', '>=', '2021-05-01')]. (default is None)
+
+        Returns:
+            paths (list): Sorted by partition
+        """
+
+        schema, _, table_config = self._table_config(table)
+        if table_config.get('table_type') != 'partitioned':
+            return [f"{self.data_directory}{schema}/{table_config['path']}"]
+
+        directory = f"{self.data_directory}{schema}/{table_config['directory']}/"
+        paths = sorted(directory + f for f in os.listdir(directory) if is_data_file(f))
+
+        partition_filters = [f for f in filters or [] if f[0] == table_config['partitioned_by']]
+        if not partition_filters:
+            return paths
+
+        pruned = []
+        for path in paths:
+            low, high = partition_range(table_config['iterator'], file_key(path))
+            if all(_may_match(low, high, op, value) for _, op, value in partition_filters):
+                pruned.append(path)
+        logging.info(f"Scanning {len(pruned)} of {len(paths)} partitions of {table}")
+
+        return pruned
+
+    def _scan_file(self, path: str, columns: list, filters: list, table_config: dict, dtype: dict=None) -> pd.DataFrame:
+        """Reads the columns of a file and the rows that match the filters"""
+
+        filter_columns = [f[0] for f in filters]
+        read_columns = None if columns is None else list(dict.fromkeys(columns + filter_columns))
+
+        if get_format(path) == 'parquet':
+            pa = _import_pyarrow()
+            schema = pa.parquet.read_schema(path)
+            #Filters are pushed down to the row group statistics
+            arrow_filters = []
+            for column, op, value in filters:
+                if pa.types.is_timestamp(schema.field(column).type):
+                    value = [pd.Timestamp(v) for v in value] if op == 'in' else pd.Timestamp(value)
+                arrow_filters.append((column, '==' if op == '=' else op, value))
+            table = pa.parquet.read_table(path, columns=read_columns, filters=arrow_filters or None, memory_map=True)
+            df = table.to_pandas()
+            if dtype:
+                df = df.astype({c: t for c, t in dtype.items() if c in df.columns})
+        else:
+            chunks = []
+            for chunk in iter_chunks(path, columns=read_columns, sep=table_config.get('sep', '\t'),
+                                     compression=table_config.get('compression', 'gzip'), dtype=dtype):
+                #Dates are text in tsv files, parsed so partitions in either format can be concatenated
+                if table_config.get('iterator') in DATE_ITERATORS and table_config['partitioned_by'] in chunk:
+                    chunk[table_config['partitioned_by']] = pd.to_datetime(chunk[table_config['partitioned_by']])
+                chunks.append(_apply_filters(chunk, filters))
+            df = pd.concat(chunks, ignore_index=True)
+
+        return df if columns is None else df[columns]
+
+    def iter_partitions(self, table: str, columns: list=None, start: str=None, end: str=None, dtype: dict=None,
+                        filters: list=None):
+        """Iterates over the partitions of a table one frame at a time, only one partition is held in memory
+
+        Args:
+            table (str): ex: statcast.statcast
+            columns (list): Only read these columns. (default is all columns)
+            start (str): First partition, a year or month, ex: 2015 or 2015-04. (default is the first partition)
+            end (str): Last partition, included, ex: 2021 or 2021-09. (default is the last partition)
+            dtype (dict): Types of columns, ex: {'release_speed': 'float32'}. (default is the inferred types)
+            filters (list): Only read rows matching every (column, op, value), see scan. (default is None)
+
+        Yields:
+            key, df: The partition key of the file, ex: 2021-04, and its rows
+        """
+
+        filters = filters or []
+        _, _, table_config = self._table_config(table)
+        if (start or end) and table_config.get('table_type') != 'partitioned':
+            raise ValueError(f"{table} is not partitioned, it can not be read by partition range")
+
+        for path in self.files(table, filters):
+            key = file_key(path)
+            #Keys are compared on the length of the bound, so a year bound covers all of its months
+            if start and key[:len(start)] < start or end and key[:len(end)] > end:
+                continue
+            yield key, self._scan_file(path, columns, filters, table_config, dtype)
+
+    def scan(self, table: str, columns: list=None, filters: list=None, start: str=None, end: str=None,
+             dtype: dict=None) -> pd.DataFrame:
+        """Reads a table from its files into one frame, use iter_partitions to stream a large table
+
+        Args:
+            table (str): ex: statcast.statcast
+            columns (list): Only read these columns. (default is all columns)
+            filters (list): Only read rows matching every (column, op, value), op is one of OPERATORS.
+                            Dates can be passed as strings, ex: [('game_date', '>=', '2021-05-01')]. (default is None)
+            start (str): First partition, ex: 2015 or 2015-04. (default is the first partition)
+            end (str): Last partition, included, ex: 2021 or 2021-09. (default is the last partition)
+            dtype (dict): Types of columns, ex: {'release_speed': 'float32'}. (default is the inferred types)
+
+        Returns:
+            df (pd.DataFrame)
+        """
+
+        frames = [df for _, df in self.iter_partitions(table, columns, start, end, dtype, filters)]
+
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+
+    def _create_view_statement(self, table: str, paths: list) -> str:
+        """Creates the duckdb view of a table over its files
+
+        Ex Output:
+            create or replace view statcast.statcast as
+            select * from read_parquet(['data/statcast/statcast_dir/2021-04.parquet', ...], union_by_name=true)
+        """
+
+        _, _, table_config = self._table_config(table)
+        parquet = [p for p in paths if get_format(p) == 'parquet']
+        tsv = [p for p in paths if get_format(p) != 'parquet']
+
+        selects = []
+        if parquet:
+            selects.append(f"select * from read_parquet({parquet}, union_by_name=true)")
+        if tsv:
+            sep = table_config.get('sep', '\t').replace('\t', '\\t')
+            selects.append(f"select * from read_csv({tsv}, delim='{sep}', header=true, union_by_name=true)")
+
+        return f"create or replace view {table} as {' union all by name '.join(selects)}"
+
+    def tables_in(self, sql: str) -> list:
+        """Finds the tables of tables_config.yaml that a sql query names as schema.table
+
+        Ex Output:
+            tables_in('select * from statcast.statcast s join chadwick.player_crosswalk c on ...')
+            -> ['statcast.statcast', 'chadwick.player_crosswalk']
+        """
+
+        names = {f"{schema}.{name}".lower(): f"{schema}.{name}"
+                 for schema, schema_config in self.config.items() for name in schema_config}
+        tables = []
+        for token in re.findall(r'\b(\w+\.\w+)\b', sql):
+            table = names.get(token.lower())
+            if table is not None and table not in tables:
+                tables.append(table)
+
+        return tables
+
+    def query(self, sql: str, filters: dict=None) -> pd.DataFrame:
+        """Runs a sql query with duckdb, each table the query names is a view over its files
+
+        Only the tables named as schema.table in the sql get a view, since duckdb reads the footer
+        or header of every file of a view when it is created. duckdb only reads the columns the query
+        uses and pushes its where clause down to the parquet row groups, but partitions are not pruned
+        by the where clause. Pass filters on partitioned_by to skip partition files before the query.
+
+        Args:
+            sql (str): ex: select pitcher, avg(release_speed) from statcast.statcast group by pitcher
+            filters (dict): {table: [(column, op, value)]}, ex: {'statcast.statcast': [('game_date', '>=', '2021-05-01')]}
+
+        Returns:
+            df (pd.DataFrame)
+        """
+
+        duckdb = _import_duckdb()
+        filters = filters or {}
+
+        with duckdb.connect() as conn:
+            for table in self.tables_in(sql):
+                #Tables that were not pulled yet have no view
+                try:
+                    paths = [p for p in self.files(table, filters.get(table)) if os.path.exists(p)]
+                except FileNotFoundError:
+                    continue
+                if paths:
+                    conn.execute(f"create schema if not exists {table.split('.')[0]}")
+                    conn.execute(self._create_view_statement(table, paths))
+
+            return conn.execute(sql).df()
@@ -1,7 +1,9 @@
+import functools
 import logging
-import os
+from concurrent.futures import ThreadPoolExecutor
 
-import pandas as pd
+import crosswalk
+import derived
 import pull_baseball_reference
 import pull_fangraphs
 import pull_lahman
@@ -9,27 +11,126 @@ import pull_retrosheet
 import pull_statcast
 import update_db
 from data_pull_classes import MultiYearDataPull, pull_single_table
-from pybaseball import amateur_draft, chadwick_register
-from utils import configure_logging
+from metrics import get_metrics
+from pipeline import Pipeline
+from pybaseball import amateur_draft, cache, chadwick_register
+from utils import configure_logging, create_db_connection, create_db_pool, load_config
 
 
-def main():
-    logging.info('Begining to update all the data')
-
-    pull_lahman.main()
-    pull_retrosheet.main()
-    pull_fangraphs.main()
-    pull_statcast.main()
-    pull_baseball_reference.main()
+def pull_chadwick():
 
     logging.info('Begining to pull chadwick data')
     pull_single_table(func=chadwick_register, path_prefix='data/chadwick/')
     logging.info('Finished pulling chadwick data')
 
+def pull_tasks() -> list:
+    """Gets the pull of every table as (name, func, dependencies)"""
+
     _draft = MultiYearDataPull(name='amateur_draft', schema ='draft', func=amateur_draft, min_year=1980, limit=4, current_year=True, add_year=True)
-    _draft.update_table()
 
-    update_db.main()
+    _tasks = []
+    for module in [pull_lahman, pull_retrosheet, pull_fangraphs, pull_statcast, pull_baseball_reference]:
+        _tasks += module.tasks()
+    _tasks += [('chadwick.chadwick_register', pull_chadwick, []),
+               ('draft.amateur_draft', _draft.update_table, [])]
+
+    return _tasks
+
+def transform_tasks() -> list:
+    """Gets the transform of every derived table as (name, func, dependencies), the dependencies are pulls"""
+
+    return derived.tasks() + crosswalk.tasks()
+
+def find_transform(schema: str, table: str):
+    """Finds the transform that writes a table's files, None if the table is pulled"""
+
+    for module in [derived, crosswalk]:
+        transform = module.find_transform(schema, table)
+        if transform is not None:
+            return transform
+
+    return None
+
+def find_pull(schema: str, table: str, table_config: dict, pull_names: set):
+    """Finds the pull that writes a table's files
+
+    Pulls are named after their directory or file, the same as storage.get_table_format
+
+    Returns:
+        name (str): ex: retrosheet.rosters for retrosheet.roster, None if no pull writes the table
+    """
+
+    directory = str(table_config.get('directory', ''))
+    candidates = [table, directory[:-len('_dir')] if directory.endswith('_dir') else directory,
+                  str(table_config.get('path', '')).split('.')[0]]
+    for candidate in candidates:
+        if f"{schema}.{candidate}" in pull_names:
+            return f"{schema}.{candidate}"
+
+    return None
+
+def create_pipeline(pool, load_executor, max_workers: int) -> Pipeline:
+    """Creates the pipeline of every pull, transform and load
+
+    Each table is loaded as soon as its pull, or the transform that derives it, finishes, while the other sources are still pulling.
+    The pulls of a source are rate limited per host by the fetch scheduler.
+
+    Args:
+        pool: psycopg2 connection pool used by the loads
+        load_executor (ThreadPoolExecutor): Runs the partition copies of every load
+        max_workers (int): Maximum number of pulls and loads running at the same time
+    """
+
+    pipeline = Pipeline(max_workers=max_workers)
+    for name, func, dependencies in pull_tasks():
+        pipeline.add(f"pull:{name}", func, [f"pull:{d}" for d in dependencies])
+    #Transforms compute derived tables from pulled files, between the pulls and the loads
+    for name, func, dependencies in transform_tasks():
+        pipeline.add(f"transform:{name}", func, [f"pull:{d}" for d in dependencies])
+
+    pull_names = {name[len('pull:'):] for name in pipeline.tasks if name.startswith('pull:')}
+    for schema, schema_config in load_config().items():
+        for table, table_config in schema_config.items():
+            pull = find_pull(schema, table, table_config, pull_names)
+            transform = find_transform(schema, table)
+            dependencies = [f"pull:{pull}"] if pull else [f"transform:{transform}"] if transform else []
+            #The player_id columns are joined on from the loaded crosswalk
+            if table_config.get('player_keys'):
+                dependencies.append(f"load:{crosswalk.CROSSWALK_TABLE}")
+            load = functools.partial(update_db.load_table, schema, table, table_config, pool, load_executor)
+            pipeline.add(f"load:{schema}.{table}", load, dependencies)
+
+    return pipeline
+
+def main(max_workers: int=16, load_workers: int=update_db.MAX_WORKERS, prometheus_path: str=None):
+    """Pulls and loads every table, see create_pipeline
+
+    Args:
+        max_workers (int): Maximum number of concurrent pipeline tasks. (default is 16)
+        load_workers (int): Maximum number of concurrent load jobs. (default is update_db.MAX_WORKERS)
+        prometheus_path (str): Where to write the run metrics as a Prometheus textfile. (default is None)
+    """
+
+    logging.info('Begining to update all the data')
+    cache.enable()
+
+    #The manifest table is created once up front, so concurrent loads do not race to create it
+    conn, cur = create_db_connection()
+    update_db.ensure_manifest_table(conn, cur)
+    cur.close()
+    conn.close()
+
+    #Loads hold a connection while preparing, and their copies each borrow another
+    pool = create_db_pool(load_workers + 1)
+    with ThreadPoolExecutor(max_workers=load_workers) as load_executor:
+        try:
+            create_pipeline(pool, load_executor, max_workers).run()
+        finally:
+            pool.closeall()
+            #Seconds are summed over threads, so they add up to more than the run took
+            logging.info(f"Seconds spent in each stage: {get_metrics().summary()}")
+            if prometheus_path is not None:
+                get_metrics().write_prometheus(prometheus_path)
 
     logging.info('Finished updating all the data')
 
@@ -0,0 +1,156 @@
+import contextlib
+import datetime
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+RUN_LOG_PATH = 'data/metrics/run_log.jsonl'
+PROMETHEUS_PREFIX = 'baseball_db'
+PROMETHEUS_LABELS = ['stage', 'status', 'task', 'source', 'table'] #Labels kept in the textfile, paths would make a series per file
+# Partition, shadow and staging suffixes, the textfile has a series per configured table and the run log has the rest
+TABLE_SUFFIX = re.compile(r'(__shadow|__staging|_\d{4}(_\d{2})?)+$')
+
+
+def configured_table(table: str) -> str:
+    """Gets the configured table a table is loaded through, ex: statcast.statcast__shadow_2021_04 -> statcast.statcast"""
+
+    return TABLE_SUFFIX.sub('', table)
+
+
+class Stage():
+    """A timed stage, the code inside the stage sets rows, bytes and retries as it goes"""
+
+    def __init__(self, name: str, labels: dict) -> None:
+        self.name = name
+        self.labels = labels
+        self.rows = None
+        self.bytes = None
+        self.retries = 0
+        self.started = time.monotonic()
+
+    def to_record(self, run_id: str, status: str) -> dict:
+        seconds = time.monotonic() - self.started
+        record = {'run_id': run_id, 'stage': self.name, **self.labels, 'status': status,
+                  'seconds': round(seconds, 4), 'rows': self.rows, 'bytes': self.bytes, 'retries': self.retries}
+        if self.rows is not None and seconds > 0:
+            record['rows_per_second'] = round(self.rows / seconds, 1)
+
+        return record
+
+
+class Metrics():
+    """Records the wall time, rows, bytes and retries of each stage of a run
+
+    Every stage is appended to a JSON-lines run log as soon as it finishes, so a run that
+    crashes still has its log, and the totals per stage can be written to a Prometheus textfile
+    for the node exporter's textfile collector.
+    """
+
+    def __init__(self, path: str=RUN_LOG_PATH) -> None:
+        self.path = path
+        self.run_id = datetime.datetime.now().strftime('%Y%m%dT%H%M%S')
+        self.lock = threading.Lock()
+        self.totals = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str, **labels):
+        """Times the code in a with block, ex: with get_metrics().stage('copy', table='lahman.batting') as stage:
+
+        Args:
+            name (str): The stage, ex: fetch, throttle, write, copy, index or analyze
+            **labels: What the stage ran on, ex: table='statcast.statcast_2021_04'
+
+        Yields:
+            stage (Stage): Set stage.rows, stage.bytes and stage.retries inside the block
+        """
+
+        stage = Stage(name, labels)
+        try:
+            yield stage
+        except BaseException:
+            self._record(stage.to_record(self.run_id, 'failed'))
+            raise
+        self._record(stage.to_record(self.run_id, 'finished'))
+
+    def _record(self, record: dict) -> None:
+        """Appends a stage to the run log and adds it to the totals of its stage, status and configured table"""
+
+        labels = {**record, 'table': configured_table(record['table'])} if 'table' in record else record
+        key = tuple((label, labels[label]) for label in PROMETHEUS_LABELS if label in labels)
+        with self.lock:
+            total = self.totals.setdefault(key, {'seconds': 0, 'rows': 0, 'bytes': 0, 'retries': 0, 'count': 0})
+            total['count'] += 1
+            for field in ['seconds', 'rows', 'bytes', 'retries']:
+                total[field] += record[field] or 0
+
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+        return None
+
+    def summary(self) -> dict:
+        """Gets the seconds spent in each stage so far, summed over every thread
+
+        Ex Output:
+            {'throttle': 812.4, 'fetch': 455.1, 'write': 61.9, 'copy': 240.3, 'index': 95.0, 'analyze': 12.2}
+        """
+
+        summary = {}
+        with self.lock:
+            for key, total in self.totals.items():
+                stage = dict(key)['stage']
+                summary[stage] = round(summary.get(stage, 0) + total['seconds'], 1)
+
+        return summary
+
+    def write_prometheus(self, path: str) -> None:
+        """Writes the totals of each stage to a Prometheus textfile, replacing it atomically
+
+        Args:
+            path (str): ex: /var/lib/node_exporter/textfile_collector/baseball_db.prom
+        """
+
+        lines = []
+        with self.lock:
+            totals = dict(self.totals)
+        for field in ['seconds', 'rows', 'bytes', 'retries', 'count']:
+            metric = f"{PROMETHEUS_PREFIX}_stage_{field}"
+            lines.append(f"# TYPE {metric} gauge")
+            for key, total in sorted(totals.items()):
+                labels = ','.join(f'{label}="{value}"' for label, value in key)
+                lines.append(f"{metric}{{{labels}}} {total[field]}")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_last_run_timestamp_seconds gauge")
+        lines.append(f"{PROMETHEUS_PREFIX}_last_run_timestamp_seconds {time.time():.0f}")
+
+        #storage imports this module
+        from storage import replace_file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        replace_file(tmp_path, path)
+        logging.info(f"Wrote the run metrics to {path}")
+
+        return None
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def get_metrics() -> Metrics:
+    """Gets the metrics shared by every stage in the process"""
+
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+
+    return _metrics
+
+def stage(name: str, **labels):
+    """Times a stage with the shared metrics, see Metrics.stage"""
+
+    return get_metrics().stage(name, **labels)
@@ -0,0 +1,128 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable
+
+from metrics import stage
+
+MAX_WORKERS = 16
+
+
+class Task():
+
+    def __init__(self, name: str, func: Callable, dependencies: list=None) -> None:
+        self.name = name
+        self.func = func
+        self.dependencies = list(dependencies or [])
+
+
+class Pipeline():
+    """Runs tasks as soon as the tasks they depend on have finished
+
+    Independent tasks run at the same time on a thread pool, so the total time is the
+    slowest chain of dependencies instead of the sum of every task. When a task fails,
+    the tasks that depend on it are skipped and every other task still runs.
+    """
+
+    def __init__(self, max_workers: int=MAX_WORKERS) -> None:
+        self.max_workers = max_workers
+        self.tasks = {}
+
+    def add(self, name: str, func: Callable, dependencies: list=None) -> Task:
+        """Adds a task to the pipeline
+
+        Args:
+            name (str): Unique name of the task, ex: pull:lahman.batting
+            func (func): Called with no arguments when the task runs
+            dependencies (list): Names of the tasks that must finish first. (default is None)
+
+        Returns:
+            task (Task)
+        """
+
+        if name in self.tasks:
+            raise ValueError(f"The pipeline already has a task named {name}")
+        self.tasks[name] = Task(name, func, dependencies)
+
+        return self.tasks[name]
+
+    def _validate(self) -> None:
+        """Raises a ValueError if a dependency does not exist or the dependencies have a cycle"""
+
+        for task in self.tasks.values():
+            missing = [d for d in task.dependencies if d not in self.tasks]
+            if missing:
+                raise ValueError(f"{task.name} depends on tasks that do not exist: {missing}")
+
+        visited, visiting = set(), set()
+        def visit(name):
+            if name in visiting:
+                raise ValueError(f"The pipeline has a dependency cycle through {name}")
+            if name not in visited:
+                visiting.add(name)
+                for dependency in self.tasks[name].dependencies:
+                    visit(dependency)
+                visiting.remove(name)
+                visited.add(name)
+
+        for name in self.tasks:
+            visit(name)
+
+        return None
+
+    def _run_task(self, task: Task) -> float:
+        """Runs a task and returns the seconds it took"""
+
+        logging.info(f"Starting {task.name}")
+        start = time.monotonic()
+        with stage('task', task=task.name):
+            task.func()
+        elapsed = time.monotonic() - start
+        logging.info(f"Finished {task.name} in {elapsed:.1f}s")
+
+        return elapsed
+
+    def run(self) -> dict:
+        """Runs every task in dependency order
+
+        Returns:
+            results (dict): {task name: finished, failed or skipped}
+
+        Raises:
+            RuntimeError: If any task failed, after every task that could run has run
+        """
+
+        self._validate()
+
+        results = {}
+        pending = dict(self.tasks)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name, task in list(pending.items()):
+                    if any(results.get(d) in ('failed', 'skipped') for d in task.dependencies):
+                        logging.warning(f"Skipping {name}, a task it depends on did not finish")
+                        results[name] = 'skipped'
+                        del pending[name]
+                    elif all(results.get(d) == 'finished' for d in task.dependencies):
+                        running[executor.submit(self._run_task, task)] = name
+                        del pending[name]
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                        results[name] = 'finished'
+                    except Exception:
+                        logging.exception(f"{name} failed")
+                        results[name] = 'failed'
+
+        failed = [name for name, result in results.items() if result == 'failed']
+        if failed:
+            raise RuntimeError(f"The pipeline finished with failed tasks: {failed}")
+
+        return results
@@ -1,31 +1,44 @@
+import functools
 import logging
 
 from data_pull_classes import MultiYearDataPull, pull_single_table
 from pybaseball import (batting_stats_bref, bwar_bat, bwar_pitch,
                         pitching_stats_bref, standings, schedule_and_record)
+from team_index import get_team_index
 from utils import configure_logging
 
 
-def main():
-
-    logging.info('Beginning to pull baseball reference data')
-    _standings = MultiYearDataPull(name='standings', schema ='baseball_reference', func=standings, min_year=1969, limit=50, add_year=True, current_year=True)
-    _standings.update_table()
-
-    logging.info('Beginning to pull Baseball Reference War')
+def pull_bwar_bat():
+    """Pulls bwar_bat and rebuilds the year -> teams index that schedule_and_record reads"""
 
     pull_single_table(bwar_bat, path_prefix='data/baseball_reference/', kwargs={'return_all': True})
+    get_team_index().build()
 
-    pull_single_table(bwar_pitch, path_prefix='data/baseball_reference/', kwargs={'return_all': True})
+def tasks() -> list:
+    """Gets the pulls of the baseball reference tables as (name, func, dependencies), see pipeline.py
 
-    _batting_stats = MultiYearDataPull(name='batting_stats_bref', schema ='baseball_reference', func=batting_stats_bref, min_year=2008, limit=15, current_year=True, add_year=True)
-    _batting_stats.update_table()
+    schedule_and_record finds the teams of each year in the index built from bwar_bat, so it waits for the bwar_bat pull
+    """
 
+    _standings = MultiYearDataPull(name='standings', schema ='baseball_reference', func=standings, min_year=1969, limit=50, add_year=True, current_year=True)
+    _batting_stats = MultiYearDataPull(name='batting_stats_bref', schema ='baseball_reference', func=batting_stats_bref, min_year=2008, limit=15, current_year=True, add_year=True)
     _pitching_stats = MultiYearDataPull(name='pitching_stats_bref', schema ='baseball_reference', func=pitching_stats_bref, min_year=2008, limit=15, current_year=True, add_year=True)
-    _pitching_stats.update_table()
-
     _schedule_and_record = MultiYearDataPull(name='schedule_and_record', schema ='baseball_reference', func=schedule_and_record, min_year=1871, limit=15, current_year=True, add_year=True)
-    _schedule_and_record.update_table()
+
+    return [('baseball_reference.standings', _standings.update_table, []),
+            ('baseball_reference.bwar_bat', pull_bwar_bat, []),
+            ('baseball_reference.bwar_pitch', functools.partial(pull_single_table, bwar_pitch, path_prefix='data/baseball_reference/', kwargs={'return_all': True}), []),
+            ('baseball_reference.batting_stats_bref', _batting_stats.update_table, []),
+            ('baseball_reference.pitching_stats_bref', _pitching_stats.update_table, []),
+            ('baseball_reference.schedule_and_record', _schedule_and_record.update_table, ['baseball_reference.bwar_bat'])]
+
+def main():
+
+    logging.info('Beginning to pull baseball reference data')
+
+    #tasks are listed in dependency order
+    for _, func, _ in tasks():
+        func()
 
 if __name__ == "__main__":
     configure_logging()
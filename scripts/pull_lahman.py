@@ -1,3 +1,4 @@
+import functools
 import logging
 
 from data_pull_classes import pull_single_table
@@ -9,12 +10,11 @@ from pybaseball import (all_star_full, appearances, awards_managers,
                         home_games, managers, managers_half, parks, people,
                         pitching, pitching_post, salaries, schools,
                         series_post, teams, teams_franchises, teams_half)
-from utils import configure_logging, sleep_random
+from utils import configure_logging
 
 
-def main():
-
-    logging.info('Begining to update lahman data')
+def tasks() -> list:
+    """Gets the pulls of the lahman tables as (name, func, dependencies), see pipeline.py"""
 
     funcs = [people, parks, all_star_full, appearances, awards_managers,
             awards_players, awards_share_managers, awards_share_players,
@@ -23,9 +23,15 @@ def main():
             home_games, managers, managers_half, pitching, pitching_post,
             salaries, schools, series_post, teams, teams_franchises,teams_half]
 
-    for func in funcs:
-        sleep_random()
-        pull_single_table(func, path_prefix='data/lahman/')
+    return [(f"lahman.{func.__name__}", functools.partial(pull_single_table, func, path_prefix='data/lahman/'), [])
+            for func in funcs]
+
+def main():
+
+    logging.info('Begining to update lahman data')
+
+    for _, func, _ in tasks():
+        func()
 
     logging.info('Finished updating lahman data')
 
@@ -11,36 +11,36 @@ from pybaseball.statcast_fielding import (statcast_catcher_framing,
 from utils import configure_logging
 
 
-def main():
-    cache.enable()
+def tasks() -> list:
+    """Gets the pulls of the statcast tables as (name, func, dependencies), see pipeline.py"""
 
-    logging.info('Beginning to update statcast data')
-    _statcast = StatcastDataPull(limit=10)
-    _statcast.update_table()
+    _statcast = StatcastDataPull(limit=10, incremental=True, lookback_days=3)
 
     _catcher_frame = MultiYearDataPull('statcast_catcher_framing', 'statcast', statcast_catcher_framing, 2008, limit=5, 
                                     current_year=True, kwargs={'min_called_p':0})
-    _catcher_frame.update_table()
-    
     _catcher_pop = MultiYearDataPull('statcast_catcher_poptime', 'statcast', statcast_catcher_poptime, 2008, limit=5, 
                                     current_year=True, kwargs={'min_2b_att':0, 'min_3b_att':0}, add_year=True)
-    _catcher_pop.update_table()
-
     _outs_above_average = MultiYearDataPull('statcast_outs_above_average', 'statcast', statcast_outs_above_average, 2008, limit=5, 
                                     current_year=True,add_year=True, kwargs={'min_att':0})
-    _outs_above_average.update_table()
-
     _outfield_catch_prob = MultiYearDataPull('statcast_outfield_catch_prob', 'statcast', statcast_outfield_catch_prob, 2008, limit=5, 
                                     current_year=True, kwargs={'min_opp':0}, add_year=True)
-    _outfield_catch_prob.update_table()
-
     _outfielder_jump = MultiYearDataPull('statcast_outfielder_jump', 'statcast', statcast_outfielder_jump, 2008, limit=5, 
                                     current_year=True, kwargs={'min_att':0}, add_year=True)
-    _outfielder_jump.update_table()
-
     _outfielder_directional = MultiYearDataPull('statcast_outfield_directional_oaa', 'statcast', statcast_outfield_directional_oaa, 2008, limit=5, 
                                     current_year=True, kwargs={'min_opp':0}, add_year=True)
-    _outfielder_directional.update_table()
+
+    pulls = [_statcast, _catcher_frame, _catcher_pop, _outs_above_average, _outfield_catch_prob,
+             _outfielder_jump, _outfielder_directional]
+
+    return [(f"statcast.{pull.name}", pull.update_table, []) for pull in pulls]
+
+def main():
+    cache.enable()
+
+    logging.info('Beginning to update statcast data')
+
+    for _, func, _ in tasks():
+        func()
 
     logging.info('Finished updating statcast data')
 
@@ -0,0 +1,212 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable
+
+import pandas as pd
+import requests
+from fetch_scheduler import fetch, get_scheduler
+from storage import replace_file, write_json
+
+CACHE_DIRECTORY = 'data/.cache/responses/'
+MAX_CACHE_BYTES = 2*1024**3 #Least recently used responses are evicted past this size
+
+# Seconds a response stays fresh, responses fetched after their data became final never expire
+HOUR = 60*60
+SOURCE_TTLS = {'fangraphs': 12*HOUR,
+               'baseball_reference': 12*HOUR,
+               'savant': 6*HOUR,
+               'retrosheet': 7*24*HOUR,
+               'lahman': 7*24*HOUR,
+               'chadwick': 24*HOUR}
+DEFAULT_TTL = 12*HOUR
+
+
+def season_end(year: int) -> datetime.datetime:
+    """Gets when the data of a season stops changing, the start of the next year"""
+
+    return datetime.datetime(int(year) + 1, 1, 1)
+
+
+class ResponseCache():
+
+    def __init__(self, directory: str=CACHE_DIRECTORY, max_bytes: int=MAX_CACHE_BYTES, ttls: dict=SOURCE_TTLS) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.lock = threading.Lock()
+
+    def _get_ttl(self, source: str) -> int:
+        """Gets the seconds a response stays fresh, unless it was fetched after its data became final"""
+
+        return self.ttls.get(source, DEFAULT_TTL)
+
+    @staticmethod
+    def _create_key(source: str, name: str, args: tuple, kwargs: dict) -> str:
+        """Creates the cache key of a request from the function name and its arguments"""
+
+        request = json.dumps([source, name, [str(a) for a in args], {k: str(v) for k, v in sorted(kwargs.items())}])
+
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    def _paths(self, key: str):
+        """Gets the data and metadata paths of a cache key"""
+
+        return f"{self.directory}{key}.pkl", f"{self.directory}{key}.json"
+
+    def _read(self, key: str):
+        """Reads a cached response
+
+        Returns:
+            df (pd.DataFrame), metadata (dict). Both are None if the key is not cached
+        """
+
+        data_path, metadata_path = self._paths(key)
+        if not (os.path.exists(data_path) and os.path.exists(metadata_path)):
+            return None, None
+
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+        df = pd.read_pickle(data_path)
+
+        #The mtime of the data file is the last access, used for lru eviction
+        os.utime(data_path)
+
+        return df, metadata
+
+    def _write(self, key: str, df: pd.DataFrame, metadata: dict) -> None:
+        """Writes a response to the cache and evicts the least recently used responses past max_bytes"""
+
+        os.makedirs(self.directory, exist_ok=True)
+        data_path, metadata_path = self._paths(key)
+
+        df.to_pickle(f"{data_path}.tmp")
+        replace_file(f"{data_path}.tmp", data_path)
+        write_json(metadata, metadata_path)
+
+        self._evict()
+
+        return None
+
+    def _evict(self) -> None:
+        """Removes the least recently used responses until the cache is under max_bytes"""
+
+        with self.lock:
+            entries = []
+            for f in os.listdir(self.directory):
+                if f.endswith('.pkl'):
+                    stat = os.stat(f"{self.directory}{f}")
+                    entries.append((stat.st_mtime, stat.st_size, f[:-len('.pkl')]))
+
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, key in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                for path in self._paths(key):
+                    if os.path.exists(path):
+                        os.remove(path)
+                total_bytes -= size
+                logging.info(f"Evicted {key} from the response cache")
+
+        return None
+
+    @staticmethod
+    def _is_fresh(metadata: dict, ttl: int, final_at: datetime.datetime=None) -> bool:
+        """Checks if a cached response was fetched after its data became final, or is younger than its ttl
+
+        A response fetched during the season is the last snapshot of it, so it still expires
+        once the season is over, and the response fetched after that never expires
+        """
+
+        if final_at is not None and metadata['fetched_at'] >= final_at.timestamp():
+            return True
+
+        return time.time() - metadata['fetched_at'] < ttl
+
+    def fetch(self, source: str, func: Callable, args: tuple=(), kwargs: dict=None,
+              final_at: datetime.datetime=None) -> pd.DataFrame:
+        """Calls func(*args, **kwargs) through the fetch scheduler, unless a fresh response is cached
+
+        Args:
+            source (str): The host that func requests, ex: fangraphs
+            func (func): The function that is pulling the data
+            args (tuple): Positional arguments of func
+            kwargs (dict): Keyword arguments of func
+            final_at (datetime.datetime): When the data stops changing, ex: season_end(2020). (default is None, it always can)
+
+        Returns:
+            df (pd.DataFrame)
+        """
+
+        kwargs = kwargs or {}
+        key = self._create_key(source, func.__name__, args, kwargs)
+        df, metadata = self._read(key)
+        if df is not None and self._is_fresh(metadata, self._get_ttl(source), final_at):
+            logging.info(f"Using the cached response of {func.__name__}{args} from {source}")
+            return df
+
+        df = fetch(source, func, *args, **kwargs)
+        if isinstance(df, pd.DataFrame):
+            self._write(key, df, {'source': source, 'func': func.__name__, 'fetched_at': time.time()})
+
+        return df
+
+    def fetch_url(self, source: str, url: str, parse: Callable[[str], pd.DataFrame],
+                  final_at: datetime.datetime=None) -> pd.DataFrame:
+        """Requests a url and parses it, revalidating an expired cached response with its ETag or Last-Modified
+
+        Args:
+            source (str): The host of the url, ex: fangraphs
+            url (str): The url to request
+            parse (func): Function that parses the response text into a DataFrame
+            final_at (datetime.datetime): When the data stops changing, ex: season_end(2020). (default is None, it always can)
+
+        Returns:
+            df (pd.DataFrame)
+        """
+
+        key = self._create_key(source, url, (), {})
+        df, metadata = self._read(key)
+        if df is not None and self._is_fresh(metadata, self._get_ttl(source), final_at):
+            logging.info(f"Using the cached response of {url}")
+            return df
+
+        headers = {}
+        if df is not None and metadata.get('etag'):
+            headers['If-None-Match'] = metadata['etag']
+        if df is not None and metadata.get('last_modified'):
+            headers['If-Modified-Since'] = metadata['last_modified']
+
+        get_scheduler().throttle(source)
+        response = requests.get(url, headers=headers, timeout=60)
+        if response.status_code == 304:
+            logging.info(f"{url} has not changed, using the cached response")
+            metadata['fetched_at'] = time.time()
+            self._write(key, df, metadata)
+            return df
+        response.raise_for_status()
+
+        df = parse(response.text)
+        self._write(key, df, {'source': source, 'url': url, 'fetched_at': time.time(),
+                              'etag': response.headers.get('ETag'),
+                              'last_modified': response.headers.get('Last-Modified')})
+
+        return df
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> ResponseCache:
+    """Gets the response cache shared by every pull in the process"""
+
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+
+    return _cache
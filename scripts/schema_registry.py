@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+import threading
+from typing import Callable
+
+from storage import write_json
+from type_inference import merge_schemas
+from utils import file_fingerprint
+
+REGISTRY_PATH = 'data/schema_registry.json'
+REGISTRY_VERSION = 2 #Registries written by older versions are re-inferred
+
+
+class SchemaRegistry():
+
+    def __init__(self, path: str=REGISTRY_PATH) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.tables = self._load()
+
+    def _load(self) -> dict:
+        """Loads the registry from self.path, an empty registry if it does not exist yet"""
+
+        if not os.path.exists(self.path):
+            return {}
+
+        with open(self.path) as f:
+            registry = json.load(f)
+
+        if registry.get('version') != REGISTRY_VERSION:
+            return {}
+
+        return registry['tables']
+
+    def _save(self) -> None:
+        """Writes the registry atomically, see storage.write_json"""
+
+        write_json({'version': REGISTRY_VERSION, 'tables': self.tables}, self.path, indent=2)
+
+        return None
+
+    @staticmethod
+    def _report_drift(table_name: str, old_columns: dict, new_columns: dict) -> None:
+        """Logs the columns of a table that were added, removed or changed type"""
+
+        added = [c for c in new_columns if c not in old_columns]
+        removed = [c for c in old_columns if c not in new_columns]
+        if added:
+            logging.warning(f"Schema drift in {table_name}, added columns: {added}")
+        if removed:
+            logging.warning(f"Schema drift in {table_name}, removed columns: {removed}")
+
+        for c, dtype in new_columns.items():
+            if c in old_columns and old_columns[c] != dtype:
+                logging.warning(f"Schema drift in {table_name}, {c} was {old_columns[c]} and is now {dtype}")
+
+        return None
+
+    def get_schema(self, table_name: str, paths: list, infer: Callable[[str], dict]) -> dict:
+        """Gets the column types of a table, only inferring the types of files that changed
+
+        The types of each file are stored with the file's size and mtime, and the
+        types of the table are the union of all files with merge_schemas
+
+        Args:
+            table_name (str): Name of the table, ex: lahman.batting
+            paths (list): Every file of the table, newest first
+            infer (func): Function that infers {column: type} from a path
+
+        Returns:
+            columns (dict): {column: type}
+        """
+
+        with self.lock:
+            entry = self.tables.get(table_name, {'files': {}, 'columns': []})
+
+        files = {}
+        for path in paths:
+            fingerprint = file_fingerprint(path, with_hash=False)
+            fingerprint = {'size': fingerprint['size'], 'mtime': fingerprint['mtime']}
+            cached = entry['files'].get(os.path.abspath(path))
+
+            if cached is not None and cached['fingerprint'] == fingerprint:
+                files[os.path.abspath(path)] = cached
+            else:
+                logging.info(f"Inferring the schema of {table_name} from {path}")
+                #Columns are stored as pairs to keep their order
+                files[os.path.abspath(path)] = {'fingerprint': fingerprint, 'columns': list(infer(path).items())}
+
+        columns = merge_schemas([dict(files[os.path.abspath(path)]['columns']) for path in paths])
+        if entry['columns'] and dict(entry['columns']) != columns:
+            self._report_drift(table_name, dict(entry['columns']), columns)
+
+        if files != entry['files']:
+            with self.lock:
+                self.tables[table_name] = {'files': files, 'columns': list(columns.items())}
+                self._save()
+
+        return columns
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry() -> SchemaRegistry:
+    """Gets the schema registry shared by every table in the process"""
+
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = SchemaRegistry()
+
+    return _registry
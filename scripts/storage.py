@@ -0,0 +1,338 @@
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+
+import pandas as pd
+from metrics import stage
+from write_manifest import frame_hash, get_write_manifest
+
+# File extension of each storage format, the format of a table is set with format: in tables_config.yaml
+EXTENSIONS = {'tsv': '.tsv.gz',
+              'parquet': '.parquet'}
+DEFAULT_FORMAT = 'tsv'
+PARQUET_BATCH_SIZE = 65536 #Rows converted at a time when streaming a parquet file as csv
+CHUNKSIZE = 100000 #Rows held in memory at a time while concatenating files
+
+
+def _import_pyarrow():
+    """Imports pyarrow, which is only needed for tables stored as parquet"""
+
+    try:
+        import pyarrow
+        import pyarrow.csv
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError('pyarrow is required to read and write parquet files') from e
+
+    return pyarrow
+
+def get_table_format(config: dict, schema: str, name: str) -> str:
+    """Gets the storage format of a table from tables_config.yaml
+
+    Pulls are named after their directory or file, so a table is matched on its key,
+    its directory ({name}_dir) or its path ({name}.tsv.gz)
+
+    Args:
+        config (dict): The loaded tables_config.yaml
+        schema (str): Schema of the table, ex: statcast
+        name (str): Name of the pull, ex: statcast
+
+    Returns:
+        file_format (str): tsv or parquet
+    """
+
+    for table, table_config in config.get(schema, {}).items():
+        if table == name or table_config.get('directory') == f"{name}_dir" or \
+                str(table_config.get('path', '')).split('.')[0] == name:
+            return table_config.get('format', get_format(table_config.get('path', '')))
+
+    return DEFAULT_FORMAT
+
+def get_format(path: str) -> str:
+    """Gets the storage format of a file from its extension, ex: 2021-04.parquet -> parquet"""
+
+    for file_format, extension in EXTENSIONS.items():
+        if path.endswith(extension):
+            return file_format
+
+    return DEFAULT_FORMAT
+
+def get_extension(file_format: str) -> str:
+    """Gets the file extension of a storage format, ex: tsv -> .tsv.gz"""
+
+    return EXTENSIONS[file_format]
+
+def is_data_file(path: str) -> bool:
+    """Checks if a file is a data file in any storage format"""
+
+    return any(path.endswith(extension) for extension in EXTENSIONS.values())
+
+def file_key(path: str) -> str:
+    """Gets the partition key of a data file, ex: data/statcast/statcast_dir/2021-04.parquet -> 2021-04"""
+
+    return os.path.basename(path).split('.')[0]
+
+def replace_file(tmp_path: str, path: str) -> None:
+    """Flushes a completely written temporary file to disk and renames it over path
+
+    The rename is atomic, so path is either the old file or the complete new one, never a truncated file
+
+    Args:
+        tmp_path (str): The written file, ex: data/statcast/statcast_dir/2021-04.parquet.tmp
+        path (str): The file to replace, ex: data/statcast/statcast_dir/2021-04.parquet
+    """
+
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    #The rename is only durable once the directory is flushed
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+    return None
+
+def write_json(data, path: str, indent: int=None) -> None:
+    """Writes data as json to a temporary file and renames it over path with replace_file
+
+    Every manifest, journal and index is saved with it, so they are as durable as the data files
+
+    Args:
+        data: Anything json serializable, ex: {'version': 2, 'tables': {...}}
+        path (str): ex: data/.write_manifest.json
+        indent (int): Indent of the json. (default is None, a single line)
+    """
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=indent)
+    replace_file(tmp_path, path)
+
+    return None
+
+def write_frame(df: pd.DataFrame, path: str) -> bool:
+    """Writes a DataFrame in the storage format of the path's extension, unless the file already holds the same data
+
+    Parquet files are written with an explicit schema, object columns holding mixed
+    python types are stored as strings so every file of a table has consistent types.
+    The hash of the data is kept in the write manifest, when it matches the hash of the
+    last write the file is left untouched, so it is not reloaded. The file is written to a
+    temporary file first and renamed over path with replace_file, so it is never left truncated.
+
+    Args:
+        df (pd.DataFrame): The data to write
+        path (str): Path of the file, ex: data/fangraphs/batting_stats_dir/2021.parquet
+
+    Returns:
+        written (bool): False if the write was skipped
+    """
+
+    content_hash = frame_hash(df)
+    if get_write_manifest().is_unchanged(path, content_hash):
+        logging.info(f"{path} is unchanged, skipping the write")
+        return False
+
+    tmp_path = f"{path}.tmp"
+    with stage('write', path=path) as s:
+        try:
+            if get_format(path) == 'parquet':
+                pa = _import_pyarrow()
+                df = df.copy()
+                for col in df.columns[df.dtypes == 'object']:
+                    df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                pa.parquet.write_table(table, tmp_path)
+            else:
+                df.to_csv(tmp_path, index=False, sep='\t', compression='gzip')
+            replace_file(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        s.rows, s.bytes = len(df), os.path.getsize(path)
+    get_write_manifest().record(path, content_hash)
+
+    return True
+
+def read_frame(path: str, columns: list=None, nrows: int=None, sep: str='\t', compression: str='gzip', **kwargs) -> pd.DataFrame:
+    """Reads a data file in the storage format of the path's extension
+
+    Args:
+        path (str): Path of the file
+        columns (list): Only read these columns. (default is all columns)
+        nrows (int): Only read the first nrows. (default is all rows)
+        sep (str): Delimiter of tsv files. (default is tab)
+        compression (str): Compression of tsv files. (default is gzip)
+        **kwargs: Passed to pd.read_csv for tsv files
+
+    Returns:
+        df (pd.DataFrame)
+    """
+
+    if get_format(path) == 'parquet':
+        pa = _import_pyarrow()
+        if nrows is None:
+            return pa.parquet.read_table(path, columns=columns, memory_map=True).to_pandas()
+        batches = pa.parquet.ParquetFile(path, memory_map=True).iter_batches(batch_size=nrows, columns=columns)
+        batch = next(batches, None)
+        if batch is None:
+            return pa.parquet.read_table(path, columns=columns, memory_map=True).to_pandas()
+        return batch.to_pandas()
+
+    return pd.read_csv(path, sep=sep, compression=compression, usecols=columns, nrows=nrows, low_memory=False, **kwargs)
+
+def read_columns(path: str, sep: str='\t', compression: str='gzip') -> list:
+    """Reads the column names of a data file without reading its rows"""
+
+    if get_format(path) == 'parquet':
+        pa = _import_pyarrow()
+        return pa.parquet.read_schema(path).names
+
+    return list(pd.read_csv(path, sep=sep, compression=compression, nrows=0).columns)
+
+def iter_chunks(path: str, columns: list=None, chunksize: int=CHUNKSIZE, as_text: bool=False, sep: str='\t', compression: str='gzip',
+                dtype: dict=None):
+    """Iterates over a data file chunksize rows at a time
+
+    Args:
+        path (str): Path of the file
+        columns (list): Only read these columns. (default is all columns)
+        chunksize (int): Rows per chunk. (default is CHUNKSIZE)
+        as_text (bool): Read tsv columns as strings, only empty fields are null. (default is False)
+        sep (str): Delimiter of tsv files. (default is tab)
+        compression (str): Compression of tsv files. (default is gzip)
+        dtype (dict): Types of columns, ex: {'release_speed': 'float64'}. With as_text, the tsv columns
+                      parsed as another type than str, and floats are parsed with correct rounding. (default is None)
+
+    Yields:
+        chunk (pd.DataFrame)
+    """
+
+    if get_format(path) == 'parquet':
+        pa = _import_pyarrow()
+        #Memory mapped, so the column chunks are read from the page cache instead of copied into buffers
+        for batch in pa.parquet.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunksize, columns=columns):
+            df = batch.to_pandas()
+            yield df.astype({c: t for c, t in dtype.items() if c in df.columns}) if dtype and not as_text else df
+        return
+
+    kwargs = {'dtype': str, 'keep_default_na': False, 'na_values': ['']} if as_text else {'low_memory': False}
+    if as_text and dtype:
+        kwargs.update({'dtype': {c: dtype.get(c, str) for c in read_columns(path, sep, compression)},
+                       'float_precision': 'round_trip'})
+    elif dtype:
+        kwargs['dtype'] = dtype
+    yield from pd.read_csv(path, sep=sep, compression=compression, usecols=columns, chunksize=chunksize, **kwargs)
+
+def concat_files(paths: list, output_path: str, drop_columns: list=['index'], chunksize: int=CHUNKSIZE) -> bool:
+    """Concatenates data files into a single gzip tsv, one chunk at a time
+
+    Only one chunk is held in memory, so the memory used does not grow with the number of files.
+    The output has the union of the columns of every file (files missing a column get nulls),
+    and is written to a temporary file that replaces output_path once it is complete,
+    unless its text hashes the same as the last write of output_path.
+
+    Args:
+        paths (list): The files to concatenate
+        output_path (str): Path of the gzip tsv to write
+        drop_columns (list): Columns to leave out of the output. (default is ['index'])
+        chunksize (int): Rows per chunk. (default is CHUNKSIZE)
+
+    Returns:
+        written (bool): False if output_path already held the same data
+    """
+
+    columns = []
+    for path in paths:
+        columns += [c for c in read_columns(path) if c not in columns and c not in drop_columns]
+
+    tmp_path = f"{output_path}.tmp"
+    md5 = hashlib.md5()
+    with gzip.open(tmp_path, 'wt', newline='') as f:
+        header = pd.DataFrame(columns=columns).to_csv(sep='\t', index=False)
+        md5.update(header.encode())
+        f.write(header)
+        for path in paths:
+            for chunk in iter_chunks(path, chunksize=chunksize, as_text=True):
+                text = chunk.reindex(columns=columns).to_csv(sep='\t', index=False, header=False)
+                md5.update(text.encode())
+                f.write(text)
+
+    if get_write_manifest().is_unchanged(output_path, md5.hexdigest()):
+        logging.info(f"{output_path} is unchanged, skipping the write")
+        os.remove(tmp_path)
+        return False
+
+    replace_file(tmp_path, output_path)
+    get_write_manifest().record(output_path, md5.hexdigest())
+
+    return True
+
+
+class ParquetCsvStream(io.RawIOBase):
+    """File like object that reads a parquet file as tab delimited csv with a header
+
+    The file is converted PARQUET_BATCH_SIZE rows at a time, so it can be streamed to
+    COPY ... FROM STDIN without holding the whole file in memory
+    """
+
+    def __init__(self, path: str) -> None:
+        pa = _import_pyarrow()
+        self._pa = pa
+        self._batches = pa.parquet.ParquetFile(path).iter_batches(batch_size=PARQUET_BATCH_SIZE)
+        self._buffer = b''
+        self._header = True
+
+    def readable(self) -> bool:
+        return True
+
+    def _next_chunk(self) -> bytes:
+        batch = next(self._batches, None)
+        if batch is None:
+            return b''
+
+        sink = io.BytesIO()
+        write_options = self._pa.csv.WriteOptions(include_header=self._header, delimiter='\t')
+        self._pa.csv.write_csv(self._pa.Table.from_batches([batch]), sink, write_options)
+        self._header = False
+
+        return sink.getvalue()
+
+    def read(self, size: int=-1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = self._next_chunk()
+            if chunk == b'':
+                break
+            self._buffer += chunk
+
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+
+        return data
+
+def open_csv_stream(path: str, compression: str='gzip'):
+    """Opens a data file as a binary stream of tab delimited csv with a header
+
+    Args:
+        path (str): Path of the file
+        compression (str): Compression of tsv files, gzip or None. (default is gzip)
+
+    Returns:
+        A binary file like object
+    """
+
+    if get_format(path) == 'parquet':
+        return ParquetCsvStream(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+
+    return open(path, 'rb')
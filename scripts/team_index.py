@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+import threading
+
+from storage import get_extension, get_table_format, iter_chunks, write_json
+from utils import file_fingerprint, load_config
+
+INDEX_PATH = 'data/baseball_reference/bwar_bat_teams.json'
+
+
+def get_bwar_bat_path() -> str:
+    """Gets the path of the bwar_bat file in its configured storage format"""
+
+    file_format = get_table_format(load_config(), 'baseball_reference', 'bwar_bat')
+
+    return f"data/baseball_reference/bwar_bat{get_extension(file_format)}"
+
+
+class TeamIndex():
+    """Persisted index of the teams that played each year, built from bwar_bat
+
+    The index stores the size and mtime of the bwar_bat file it was built from,
+    and is rebuilt when it is missing or bwar_bat has been pulled again since
+    """
+
+    def __init__(self, source_path: str=None, path: str=INDEX_PATH) -> None:
+        self.source_path = source_path or get_bwar_bat_path()
+        self.path = path
+        self.lock = threading.Lock()
+        self.teams = None
+
+    def _source_fingerprint(self) -> dict:
+        fingerprint = file_fingerprint(self.source_path, with_hash=False)
+
+        return {'size': fingerprint['size'], 'mtime': fingerprint['mtime']}
+
+    def _load(self):
+        """Loads the index from self.path, None if it does not exist or is stale"""
+
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path) as f:
+            index = json.load(f)
+
+        if index.get('source') != self._source_fingerprint():
+            return None
+
+        return {int(year): teams for year, teams in index['teams'].items()}
+
+    def build(self) -> dict:
+        """Builds the index by reading only the year_ID and team_ID columns of bwar_bat
+
+        Returns:
+            teams (dict): {year: [team_ID]}
+        """
+
+        logging.info(f"Building the team index from {self.source_path}")
+        year_teams = {}
+        for chunk in iter_chunks(self.source_path, columns=['year_ID', 'team_ID']):
+            for year, team in chunk.dropna().drop_duplicates().itertuples(index=False):
+                year_teams.setdefault(int(year), set()).add(team)
+        teams = {year: sorted(year_teams[year]) for year in sorted(year_teams)}
+
+        write_json({'source': self._source_fingerprint(), 'teams': teams}, self.path)
+
+        with self.lock:
+            self.teams = teams
+
+        return teams
+
+    def get_teams(self, year: int) -> list:
+        """Gets the team_IDs of a year, building the index first if it is missing or stale
+
+        Args:
+            year (int): The season, ex: 2021
+
+        Returns:
+            teams (list): ex: ['ARI', 'ATL', ...], empty if bwar_bat has no teams that year
+        """
+
+        with self.lock:
+            teams = self.teams
+        if teams is None:
+            teams = self._load()
+            if teams is None:
+                teams = self.build()
+            with self.lock:
+                self.teams = teams
+
+        return teams.get(year, [])
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_team_index() -> TeamIndex:
+    """Gets the team index shared by every pull in the process"""
+
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = TeamIndex()
+
+    return _index
@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+from storage import iter_chunks
+
+CHUNKSIZE = 100000 #Rows held in memory at a time while scanning a file
+
+# Postgres types from narrowest to widest, null is a column with no values yet
+NUMERIC_TYPES = ['smallint', 'integer', 'bigint', 'real', 'double precision']
+TEMPORAL_TYPES = ['date', 'timestamp']
+
+BOOLEAN_VALUES = {'True', 'False', 'true', 'false'}
+INTEGER_PATTERN = r'-?\d+'
+LEADING_ZERO_PATTERN = r'-?0\d'
+FLOAT_PATTERN = r'-?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?'
+DATE_PATTERN = r'\d{4}-\d{2}-\d{2}'
+TIMESTAMP_PATTERN = r'\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(\.\d+)?'
+
+
+def merge_types(a: str, b: str) -> str:
+    """Widens two postgres types to the narrowest type that can hold both
+
+    Ex:
+        merge_types('smallint', 'integer') -> 'integer'
+        merge_types('integer', 'real') -> 'double precision'
+        merge_types('date', 'real') -> 'varchar'
+    """
+
+    if a == b or b == 'null':
+        return a
+    if a == 'null':
+        return b
+
+    if a in NUMERIC_TYPES and b in NUMERIC_TYPES:
+        a_index, b_index = NUMERIC_TYPES.index(a), NUMERIC_TYPES.index(b)
+        widest = NUMERIC_TYPES[max(a_index, b_index)]
+        #real only holds integers exactly up to 2^24
+        if widest == 'real' and {a, b} & {'integer', 'bigint'}:
+            return 'double precision'
+        return widest
+
+    if a in TEMPORAL_TYPES and b in TEMPORAL_TYPES:
+        return 'timestamp'
+
+    return 'varchar'
+
+def merge_schemas(schemas: list) -> dict:
+    """Unions the columns of several files, widening the types of shared columns
+
+    Args:
+        schemas (list): [{column: type}], newest file first
+
+    Returns:
+        schema_dict (dict): {column: type}, columns in the order they are first seen
+    """
+
+    schema_dict = {}
+    for schema in schemas:
+        for column, dtype in schema.items():
+            schema_dict[column] = merge_types(schema_dict.get(column, 'null'), dtype)
+
+    return schema_dict
+
+def _integer_type(values: pd.Series) -> str:
+    """Gets the narrowest integer type that holds the values"""
+
+    min_value, max_value = values.min(), values.max()
+    for dtype, np_dtype in [('smallint', np.int16), ('integer', np.int32), ('bigint', np.int64)]:
+        info = np.iinfo(np_dtype)
+        if info.min <= min_value and max_value <= info.max:
+            return dtype
+
+    return 'varchar'
+
+def _float_type(values: pd.Series) -> str:
+    """Gets real if every value survives a round trip through 6 significant digits, otherwise double precision"""
+
+    values = values.to_numpy(dtype='float64')
+    if not np.isfinite(values).all():
+        return 'double precision'
+
+    values = values[values != 0]
+    if len(values) == 0:
+        return 'real'
+
+    magnitude = np.abs(values)
+    if magnitude.max() > np.finfo(np.float32).max or magnitude.min() < np.finfo(np.float32).tiny:
+        return 'double precision'
+
+    scale = 10.0**(5 - np.floor(np.log10(magnitude)))
+    if np.allclose(np.round(values*scale)/scale, values, rtol=1e-12, atol=0):
+        return 'real'
+
+    return 'double precision'
+
+def _classify_strings(values: pd.Series) -> str:
+    """Gets the narrowest postgres type that every string value can be copied into"""
+
+    if values.isin(BOOLEAN_VALUES).all():
+        return 'boolean'
+
+    if values.str.fullmatch(INTEGER_PATTERN).all():
+        #Leading zeros are identifiers, ex: zip codes, and values past 18 digits may not fit in a bigint
+        if values.str.match(LEADING_ZERO_PATTERN).any() or values.str.len().max() > 18:
+            return 'varchar'
+        return _integer_type(values.astype('int64'))
+
+    if values.str.fullmatch(FLOAT_PATTERN).all():
+        return _float_type(values.astype('float64'))
+
+    if values.str.fullmatch(DATE_PATTERN).all() and \
+            pd.to_datetime(values, format='%Y-%m-%d', errors='coerce').notna().all():
+        return 'date'
+
+    if values.str.fullmatch(TIMESTAMP_PATTERN).all() and \
+            pd.to_datetime(values, errors='coerce').notna().all():
+        return 'timestamp'
+
+    return 'varchar'
+
+def classify_series(series: pd.Series) -> str:
+    """Gets the narrowest postgres type that holds every non null value of a column
+
+    Args:
+        series (pd.Series): A column read as strings from a tsv, or typed from a parquet file
+
+    Returns:
+        dtype (str): ex: smallint, real, date, varchar. null if the column has no values
+    """
+
+    values = series.dropna()
+    if len(values) == 0:
+        return 'null'
+
+    if pd.api.types.is_bool_dtype(values):
+        return 'boolean'
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return 'date' if (values == values.dt.normalize()).all() else 'timestamp'
+    if pd.api.types.is_integer_dtype(values):
+        return _integer_type(values)
+    if pd.api.types.is_float_dtype(values):
+        return _float_type(values)
+
+    return _classify_strings(pd.Series(values.astype(str).unique()))
+
+def infer_file_types(path: str, sep: str='\t', compression: str='gzip', chunksize: int=CHUNKSIZE) -> dict:
+    """Infers the postgres type of each column by scanning a whole file in chunks
+
+    Only one chunk is held in memory at a time, and the types of each chunk are
+    widened with merge_types, so every row of the file fits the inferred types
+
+    Args:
+        path (str): Path of the file
+        sep (str): Delimiter of tsv files. (default is tab)
+        compression (str): Compression of tsv files. (default is gzip)
+        chunksize (int): Rows read at a time. (default is CHUNKSIZE)
+
+    Returns:
+        schema_dict (dict): {column: type}
+
+    Ex Output:
+        {'playerID': 'varchar', 'yearID': 'smallint', 'G': 'smallint', 'AVG': 'real'}
+    """
+
+    schema_dict = {}
+    #tsv columns are read as strings and only empty fields are null, the same as COPY ... CSV
+    for chunk in iter_chunks(path, chunksize=chunksize, as_text=True, sep=sep, compression=compression):
+        chunk_types = {c: classify_series(chunk[c]) for c in chunk.columns}
+        schema_dict = merge_schemas([schema_dict, chunk_types])
+
+    return schema_dict
@@ -1,9 +1,121 @@
+import functools
+import hashlib
+import json
 import logging
 import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import pandas as pd
-import yaml
-from utils import configure_logging, create_db_connection
+from binary_copy import BinaryCopyStream
+from crosswalk import CROSSWALK_TABLE, NUMERIC_KEYS, crosswalk_version
+from metrics import stage
+from schema_registry import get_registry
+from storage import (file_key, get_format, is_data_file, open_csv_stream,
+                     read_columns)
+from type_inference import infer_file_types
+from utils import (configure_logging, create_db_connection, create_db_pool,
+                   file_fingerprint, load_config)
+from write_manifest import get_write_manifest
+
+MANIFEST_TABLE = 'meta.partition_manifest'
+MAX_WORKERS = 4
+COPY_BUFFER_SIZE = 4*1024*1024 #Bytes read from a file per COPY ... FROM STDIN message
+SHADOW_SUFFIX = '__shadow' #Tables are loaded into {name}__shadow and renamed over {name} when complete
+STAGING_SUFFIX = '__staging' #Files of tables with player_keys are copied into a temporary {name}__staging first
+MAINTENANCE_WORK_MEM = '512MB' #Memory of each index build, set per table with maintenance_work_mem: in tables_config.yaml
+ROLLUP_PARTITION_COLUMN = 'partition_name' #Column of a rollup holding the partition each row was computed from
+INTEGER_TYPES = ['smallint', 'integer', 'bigint']
+# The name of the index an index_statement: creates, ex: create unique index if not exists people_name_idx on ...
+CUSTOM_INDEX_NAME = re.compile(r'\s*create\s+(unique\s+)?index\s+(concurrently\s+)?(if\s+not\s+exists\s+)?(?!(on|concurrently)\s)(?P<name>\w+)\s+on\s',
+                               re.IGNORECASE)
+
+
+def normalize_column(column: str) -> str:
+    """Normalizes a column name for postgres, ex: G.x -> "g_x" """
+
+    return f'''"{column.lower().replace('.','_')}"'''
+
+def create_column_list(columns: list) -> str:
+    """Creates the column list of a copy statement, ex: ("playerid", "yearid", "g_x")"""
+
+    return f"({', '.join(normalize_column(c) for c in columns)})"
+
+def postgres_type(dtype: str) -> str:
+    """Gets the type of a column in the create statement, columns without any values are varchar"""
+
+    return 'varchar' if dtype == 'null' else dtype
+
+def player_key_column(column: str) -> str:
+    """Gets the column holding the crosswalk player_id of a source ID column, ex: batter -> batter_player_id"""
+
+    return f"{column}_player_id"
+
+def create_staging_name(table_name: str) -> str:
+    """Gets the temporary table a file is copied into before its player_id columns are joined on, ex: statcast_2021_04__staging"""
+
+    return f"{table_name.split('.')[-1]}{STAGING_SUFFIX}"
+
+def create_player_key_statement(table_name: str, staging_name: str, columns: list, player_keys: dict, column_types: dict) -> str:
+    """Creates the statement that inserts the rows of a staging table with their player_id columns from the crosswalk
+
+    Each source ID column is left joined to the crosswalk on its key, which is unique, so every row is
+    inserted once. Source IDs stored as text are only compared to numeric keys when they are digits,
+    so every join uses the index of the key in the crosswalk
+
+    Args:
+        table_name (str): ex: statcast.statcast_2021_04
+        staging_name (str): The table the file was copied into, see create_staging_name
+        columns (list): Columns of the file
+        player_keys (dict): {source ID column: crosswalk key}, ex: {'batter': 'key_mlbam'}
+        column_types (dict): {column: postgres type} of the table
+
+    Ex Output:
+        insert into statcast.statcast_2021_04 ("pitch_type", ..., "batter_player_id")
+        select s."pitch_type", ..., k0.player_id from statcast_2021_04__staging s
+        left join chadwick.player_crosswalk k0 on k0.key_mlbam = s."batter"
+    """
+
+    selects = [f"s.{normalize_column(c)}" for c in columns]
+    joins = []
+    for i, (column, key) in enumerate(player_keys.items()):
+        source = f"s.{normalize_column(column)}"
+        if key in NUMERIC_KEYS and column_types.get(column) not in INTEGER_TYPES:
+            source = f"case when {source}::varchar ~ '^[0-9]+$' then {source}::varchar::bigint end"
+        elif key not in NUMERIC_KEYS and column_types.get(column) != 'varchar':
+            source = f"{source}::varchar"
+        selects.append(f"k{i}.player_id")
+        joins.append(f"left join {CROSSWALK_TABLE} k{i} on k{i}.{key} = {source}")
+
+    column_list = create_column_list(list(columns) + [player_key_column(c) for c in player_keys])
+
+    return f"insert into {table_name} {column_list} select {', '.join(selects)} from {staging_name} s {' '.join(joins)}"
+
+def copy_keyed_file(cur, create_copy_statement, table_name: str, columns: list, player_keys: dict, column_types: dict,
+                    copy_args: dict) -> None:
+    """Copies a file into a temporary staging table and inserts its rows into table_name with their player_id columns, without committing
+
+    The staging table is not logged and is dropped at the commit, so every row of table_name is written once
+
+    Args:
+        cur: database cursor
+        create_copy_statement: Function creating the copy statement of the file into a table
+        table_name (str): ex: statcast.statcast_2021_04
+        columns (list): Columns of the file
+        player_keys (dict): {source ID column: crosswalk key}, ex: {'batter': 'key_mlbam'}
+        column_types (dict): {column: postgres type} of the table
+        copy_args (dict): Arguments of copy_file after the copy statement, ex: {'path': ..., 'compression': 'gzip'}
+    """
+
+    staging_name = create_staging_name(table_name)
+    cur.execute(f"create temp table {staging_name} (like {table_name}) on commit drop")
+    copy_file(cur, create_copy_statement(staging_name), table=table_name, **copy_args)
+    with stage('player_keys', table=table_name) as s:
+        cur.execute(create_player_key_statement(table_name, staging_name, columns, player_keys, column_types))
+        s.rows = cur.rowcount
+
+    return None
 
 
 class Table():
@@ -16,8 +128,23 @@ class Table():
         self.relative_path = self.config.get('path')
         self.compression = self.config.get('compression', 'gzip')
         self.sep = self.config.get('sep', '\t')
+        self.copy_from = self.config.get('copy_from', 'program') #Either program (server side) or stdin (client side)
+        self.load_mode = self.config.get('load_mode', 'swap') #Either swap (load a shadow table) or replace (drop and load in place)
+        self.shadow_name = f"{self.table_name}{SHADOW_SUFFIX}"
+        self.file_format = get_format(self.relative_path)
+        self.copy_format = self.config.get('copy_format', 'csv') #Either csv or binary (encoded on this machine)
+        if self.file_format == 'parquet' or self.copy_format == 'binary':
+            self.copy_from = 'stdin' #The server can only read text files
         self.path = self._get_file_path()
         self.index_statement = self.config.get('index_statement', None)
+        self.indexes = self.config.get('indexes', []) #Lists of columns, ex: [[playerid], [yearid, teamid]]
+        self.unique_indexes = self.config.get('unique_indexes', []) #Lists of columns that must be unique, ex: [[key_mlbam]]
+        self.maintenance_work_mem = self.config.get('maintenance_work_mem', MAINTENANCE_WORK_MEM)
+        self.incremental = self.config.get('incremental', True) #Default is to skip the load when the file was not rewritten
+        self.player_keys = self.config.get('player_keys', {}) #{source ID column: crosswalk key}, ex: {'playerID': 'key_bbref'}
+        self.crosswalk_version = crosswalk_version() if self.player_keys else None
+        self.skipped = False #Whether the file is unchanged and the load is skipped, set by self.prepare_load
+        self.column_types = self._get_column_types()
         self.schema_string = self._create_schema()
         self.create_statement = self._create_create_statement()
         self.drop_statement = self._create_drop_statement()
@@ -32,35 +159,48 @@ class Table():
 
         return path
 
+    def _get_column_types(self) -> dict:
+        """Gets the postgres type of each column of the file from the schema registry
+
+        Ex Output:
+            {'playerID': 'varchar', 'yearID': 'smallint', 'GP': 'smallint'}
+        """
+
+        infer = functools.partial(infer_file_types, sep=self.sep, compression=self.compression)
+        schema_dict = get_registry().get_schema(self.table_name, [self.path], infer)
+        column_types = {column: postgres_type(dtype) for column, dtype in schema_dict.items()}
+        #The player_id columns are not in the file, they are joined on from the crosswalk during the load
+        for column in self.player_keys:
+            column_types[player_key_column(column)] = 'bigint'
+
+        return column_types
+
     def _create_schema(self) -> str:
-        """Creates the schema string statement from self.schema_config
+        """Creates the schema string statement from self.column_types
 
         Returns:
             schema_string (str)
 
         Ex Output:
-            (playerID varchar, yearID float, gameNum float, gameID varchar,
-             lgID varchar, teamID varchar, GP float, startingPos float)
+            (playerID varchar, yearID smallint, gameNum smallint, gameID varchar,
+             lgID varchar, teamID varchar, GP smallint, startingPos smallint)
         """
-        conversion_dict =  {'float64': 'float',
-                            'int64': 'float',
-                            'object': 'varchar'}
-
-        df = pd.read_csv(self.path, sep=self.sep, compression = self.compression, low_memory=False, nrows=40000)
-        schema_dict = {c: conversion_dict[str(df[c].dtype)] for c in df.columns}
 
         col_strings = []
-        for col_name, col_dtype in schema_dict.items():
-            col_string = f'''"{col_name.lower().replace('.','_')}" {col_dtype}'''
+        for col_name, col_dtype in self.column_types.items():
+            col_string = f'''{normalize_column(col_name)} {col_dtype}'''
             col_strings.append(col_string)
 
         schema_string = f"({', '.join(col_strings)})"
 
         return schema_string
 
-    def _create_create_statement(self) -> str:
+    def _create_create_statement(self, table_name: str=None) -> str:
         """Creates the create table string command
 
+        Args:
+            table_name (str): The table to create. (default is self.table_name)
+
         Returns:
             create_statement (str)
 
@@ -70,7 +210,7 @@ class Table():
              gameID varchar, lgID varchar, teamID varchar, GP float, startingPos float)
         """
 
-        create_statement = f"create table if not exists {self.table_name} {self.schema_string}"
+        create_statement = f"create table if not exists {table_name or self.table_name} {self.schema_string}"
 
         return create_statement
 
@@ -87,9 +227,12 @@ class Table():
         drop_statement = f"drop table if exists {self.table_name}"
         return drop_statement
 
-    def _create_copy_statement(self) -> str:
+    def _create_copy_statement(self, table_name: str=None) -> str:
         """Creates the copy statement
 
+        Args:
+            table_name (str): The table to copy into. (default is self.table_name)
+
         Returns:
             copy_statement (str)
 
@@ -101,6 +244,12 @@ class Table():
         the from portion of the statment becomes
             from program 'gzip -dc path'
 
+        If self.copy_from is stdin, the file is streamed from this machine instead
+            from stdin
+
+        If self.copy_format is binary, the file is encoded on this machine and streamed
+            from stdin (format binary)
+
         Ex Output:
             copy lahman.all_star_full
             from program 'gzip -dc
@@ -108,78 +257,308 @@ class Table():
             CSV Header DELIMITER E'     ';
         """
 
+        table_name = table_name or self.table_name
+        #The player_id columns are not in the file, so the columns of the file are listed
+        columns = read_columns(self.path, sep=self.sep, compression=self.compression) if self.player_keys else None
+        if self.copy_from == 'stdin':
+            return create_stdin_copy_statement(table_name, columns, copy_format=self.copy_format)
+
         if self.compression=='gzip':
             from_statement = f"gzip -dc {self.path}"
         else:
             from_statement = self.path
 
-        copy_statement = f'''copy {self.table_name}
+        column_list = create_column_list(columns) if columns is not None else ''
+        copy_statement = f'''copy {table_name} {column_list}
                             from program '{from_statement}' 
                             CSV Header DELIMITER E'\t';'''
 
         return copy_statement
 
     def update_table(self, conn, cur) -> None:
+        """Loads the table, builds its indexes and swaps it in, one step after another
+
+        Args:
+            conn: database connection
+            cur: database cursor
+        """
+
+        for job in self.prepare_load(conn, cur) + self.post_load_jobs(conn, cur):
+            job(conn, cur)
+        self.finish_load(conn, cur)
+
+        return None
+
+    def _load_table(self, conn, cur) -> None:
         """Drops, creates, and copies data into database
 
+        In swap mode the data is copied into the shadow table instead, and the table
+        is left untouched until self.finish_load
+
         Args:
             conn: database connection
             cur: database cursor
         """
 
-        logging.info(f"Begining to update {self.table_name}")
+        target = self.shadow_name if self.load_mode == 'swap' else self.table_name
+        logging.info(f"Begining to load {target}")
+
         #Drop Table
-        cur.execute(self.drop_statement)
+        cur.execute(f"drop table if exists {target}")
         conn.commit()
 
         #Create Table
-        cur.execute(self.create_statement)
+        cur.execute(self._create_create_statement(target))
         conn.commit()
 
         #Copy Table
-        cur.execute(self.copy_statement)
+        copy_args = dict(path=self.path, compression=self.compression, copy_from=self.copy_from,
+                         column_types=self._binary_column_types(), sep=self.sep)
+        if self.player_keys:
+            columns = read_columns(self.path, sep=self.sep, compression=self.compression)
+            copy_keyed_file(cur, self._create_copy_statement, target, columns, self.player_keys, self.column_types, copy_args)
+            #The crosswalk the table was keyed from, see self._keys_current
+            cur.execute(f"comment on table {target} is %s", (self.crosswalk_version,))
+        else:
+            copy_file(cur, self._create_copy_statement(target), **copy_args)
         conn.commit()
 
+        return None
+
+    def _binary_column_types(self):
+        """Gets the column types the file is encoded with in the binary copy format, None for csv copies"""
+
+        return self.column_types if self.copy_format == 'binary' else None
+
+    def _table_exists(self, cur) -> bool:
+        """Checks if the table already exists in the database with the columns of self.column_types"""
+
+        cur.execute("""select column_name from information_schema.columns
+                       where table_schema = %s and table_name = %s order by ordinal_position""", (self.schema, self.name))
+        columns = [row[0] for row in cur.fetchall()]
+
+        return len(columns) > 0 and columns == [normalize_column(c).strip('"') for c in self.column_types]
+
+    def _keys_current(self, cur) -> bool:
+        """Checks if the player_id columns were filled from the current crosswalk, stored as the comment of the table"""
+
+        if not self.player_keys:
+            return True
+        cur.execute("select obj_description(to_regclass(%s), 'pg_class')", (self.table_name,))
+
+        return cur.fetchone()[0] == self.crosswalk_version
+
+    def prepare_load(self, conn, cur) -> list:
+        """Returns the load jobs for the table, a single job that runs self._load_table
+
+        If the table is incremental and already exists with the same columns, and its file is not dirty
+        in the write manifest, the file has not changed since it was loaded and there are no jobs.
+        A table with player_keys is also reloaded when the crosswalk changed since it was loaded.
+
+        Args:
+            conn: database connection
+            cur: database cursor
+
+        Returns:
+            jobs (list): callables taking (conn, cur)
+        """
+
+        if (self.incremental and not get_write_manifest().is_dirty(self.path) and self._table_exists(cur)
+                and self._keys_current(cur)):
+            logging.info(f"{self.path} has not changed since {self.table_name} was loaded, skipping it")
+            self.skipped = True
+            return []
+
+        return [self._load_table]
+
+    def post_load_jobs(self, conn, cur) -> list:
+        """Returns the jobs that run once the table is loaded, one per index and an ANALYZE
+
+        In swap mode they run on the shadow table, so the indexes and statistics are ready when it is swapped in
+
+        Args:
+            conn: database connection
+            cur: database cursor
+
+        Returns:
+            jobs (list): callables taking (conn, cur) that can run concurrently
+        """
+
+        if self.skipped:
+            return []
+
+        target = self.shadow_name if self.load_mode == 'swap' else self.table_name
+        index_statements = [create_index_statement(target, columns) for columns in self.indexes]
+        index_statements += [create_index_statement(target, columns, unique=True) for columns in self.unique_indexes]
         if self.index_statement is not None:
-            logging.info(self.index_statement)
-            cur.execute(self.index_statement)
+            index_statements.append(self._create_custom_index_statement(target))
+
+        jobs = [functools.partial(build_index, index_statement=statement, maintenance_work_mem=self.maintenance_work_mem)
+                for statement in index_statements]
+        jobs.append(functools.partial(analyze_table, table_name=target))
+
+        return jobs
+
+    def _custom_index_name(self) -> str:
+        """Gets the name of the index that index_statement names, None if postgres names it"""
+
+        match = CUSTOM_INDEX_NAME.match(self.index_statement or '')
+
+        return match.group('name') if match else None
+
+    def _create_custom_index_statement(self, target: str) -> str:
+        """Points index_statement at the table being loaded
+
+        Postgres names an unnamed index after its table, so swap_shadow renames the index of the shadow table.
+        A named index is built on the shadow table as {index}__shadow, since the index of the live table
+        still has its name, and it is renamed in self.finish_load.
+
+        Ex Output:
+            create index people_name_idx on lahman.people (name)
+            -> create index people_name_idx__shadow on lahman.people__shadow (name)
+        """
+
+        statement = self.index_statement.replace(self.table_name, target)
+        index_name = self._custom_index_name()
+        if index_name is None or target == self.table_name:
+            return statement
+
+        match = CUSTOM_INDEX_NAME.match(statement)
+
+        return f"{statement[:match.start('name')]}{index_name}{SHADOW_SUFFIX}{statement[match.end('name'):]}"
+
+    def finish_load(self, conn, cur) -> None:
+        """Swaps the shadow table in for the table in a single transaction, once it is loaded and indexed
+
+        The table keeps its old data until the commit, so readers never see it missing or empty,
+        and a failed copy never touches it
+
+        Args:
+            conn: database connection
+            cur: database cursor
+        """
+
+        if self.skipped:
+            return None
+
+        if self.load_mode == 'swap':
+            swap_shadow(cur, self.schema, self.name)
+            index_name = self._custom_index_name()
+            if index_name is not None:
+                cur.execute(f"alter index {self.schema}.{index_name}{SHADOW_SUFFIX} rename to {index_name}")
             conn.commit()
+        get_write_manifest().mark_clean([self.path])
         logging.info(f"Finished updating {self.table_name}")
 
         return None
 
-def load_config(path: str='scripts/tables_config.yaml') -> dict:
-    """Loads a yaml config from the specified path
+def run_job(pool, job):
+    """Runs a load job on a connection borrowed from the pool
 
     Args:
-        path (str): Path of the config
+        pool: psycopg2 connection pool
+        job: callable taking (conn, cur)
 
     Returns:
-        config (Mapping): The dictionary from the loaded yaml
+        The return value of job
     """
 
-    with open(path) as f:
-        config = yaml.safe_load(f)
+    conn = pool.getconn()
+    cur = conn.cursor()
+    try:
+        return job(conn, cur)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        pool.putconn(conn)
 
-    return config
+def create_table(schema: str, table: str, table_config: dict, copy_from: str='program'):
+    """Creates the Table or PartitionedTable of a table in the config
 
-def main():
+    Args:
+        schema (str): Schema of the table, ex: lahman
+        table (str): Name of the table, ex: batting
+        table_config (dict): The table's entry in tables_config.yaml
+        copy_from (str): Copy mode used when the table does not set copy_from. (default is program)
+    """
 
-    logging.info('Begining to update the database')
+    table_config = {'copy_from': copy_from, **table_config}
 
-    conn, cur = create_db_connection()
-    config = load_config()
+    if table_config.get('table_type') == 'partitioned':
+        return PartitionedTable(name=table, schema=schema, config=table_config)
 
-    for schema, schema_config in config.items():
-        for table, table_config in schema_config.items():
+    return Table(name=table, schema=schema, config=table_config)
 
-            if table_config.get('table_type') == 'partitioned':
-                t = PartitionedTable(name=table, schema=schema, config=table_config)
-            else:
-                t = Table(name=table, schema=schema, config=table_config)
+def load_table(schema: str, table: str, table_config: dict, pool, executor, copy_from: str='program') -> None:
+    """Prepares a single table on a pooled connection and waits for its load jobs
+
+    Used by the pipeline to load each table as soon as its files are pulled,
+    the schema is inferred here so it sees the newly pulled files
+
+    Args:
+        schema (str): Schema of the table, ex: lahman
+        table (str): Name of the table, ex: batting
+        table_config (dict): The table's entry in tables_config.yaml
+        pool: psycopg2 connection pool
+        executor (ThreadPoolExecutor): Runs the table's load jobs, shared by every table
+        copy_from (str): Copy mode used when the table does not set copy_from. (default is program)
+    """
+
+    t = create_table(schema, table, table_config, copy_from)
+    for prepare in [t.prepare_load, t.post_load_jobs]:
+        jobs = run_job(pool, prepare)
+        futures = [executor.submit(run_job, pool, job) for job in jobs]
+        for future in as_completed(futures):
+            future.result()
+    run_job(pool, t.finish_load)
 
-            t.update_table(conn,cur)
+    return None
 
+def main(max_workers: int=MAX_WORKERS, copy_from: str='program'):
+    """Updates every table in the config
+
+    Tables are prepared (dropped, created and partitioned) one at a time on a single connection,
+    then the table loads and partition copies run on up to max_workers pooled connections.
+    Once a table's own jobs are done, its indexes are built and its loaded tables analyzed on
+    the pooled connections, then it is finished (swapped in) on the single connection.
+
+    Args:
+        max_workers (int): Maximum number of concurrent loads. (default is MAX_WORKERS)
+        copy_from (str): Default copy mode for tables without copy_from in the config.
+                         program has the server read the files, stdin streams them from this machine,
+                         which is needed when the database is remote. (default is program)
+    """
+
+    logging.info('Begining to update the database')
+
+    conn, cur = create_db_connection()
+    pool = create_db_pool(max_workers)
+    config = load_config()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        #Tables with player_keys are loaded once the crosswalk they are keyed from is loaded
+        for keyed in [False, True]:
+            loads = []
+            for schema, schema_config in config.items():
+                for table, table_config in schema_config.items():
+                    if bool(table_config.get('player_keys')) != keyed:
+                        continue
+                    t = create_table(schema, table, table_config, copy_from)
+                    futures = [executor.submit(run_job, pool, job) for job in t.prepare_load(conn, cur)]
+                    loads.append((t, futures))
+
+            #The indexes and statistics of a table are built once all of its own jobs are done, then it is swapped in
+            for t, futures in loads:
+                for future in as_completed(futures):
+                    future.result()
+                futures = [executor.submit(run_job, pool, job) for job in t.post_load_jobs(conn, cur)]
+                for future in as_completed(futures):
+                    future.result()
+                t.finish_load(conn, cur)
+
+    pool.closeall()
     cur.close()
     conn.close()
 
@@ -197,50 +576,87 @@ class PartitionedTable():
         self.directory = f"data/{schema}/{self.config.get('directory')}/"
         self.compression = self.config.get('compression', 'gzip') #Default is gzip
         self.sep = self.config.get('sep', '\t') #Default is tab
+        self.copy_from = self.config.get('copy_from', 'program') #Either program (server side) or stdin (client side)
+        self.copy_format = self.config.get('copy_format', 'csv') #Either csv or binary (encoded on this machine)
         self.schema_override = self.config.get('schema_override', None)
+        self.incremental = self.config.get('incremental', True) #Default is to only reload changed partitions
+        self.load_mode = self.config.get('load_mode', 'swap') #Either swap (load shadow tables) or replace (load in place)
+        self.shadow_name = f"{self.table_name}{SHADOW_SUFFIX}"
+        self.indexes = self.config.get('indexes', []) #Lists of columns, built on every partition and the parent
+        self.maintenance_work_mem = self.config.get('maintenance_work_mem', MAINTENANCE_WORK_MEM)
+        self.player_keys = self.config.get('player_keys', {}) #{source ID column: crosswalk key}, ex: {'batter': 'key_mlbam'}
+        self.rollups = self.config.get('rollups', {}) #{name: {'group_by': [columns], 'aggregates': {column: expression}}}
+        self.stale_rollups = [] #Rollups whose definition changed since they were built, set by self.prepare_load
+        self.shadow_fingerprints = {} #Fingerprints of the partitions loaded into the shadow table
+        self.full_load = False #Whether every partition is being loaded, set by self.prepare_load
+        self.loaded_partitions = [] #The partitions loaded by this run, ex: ['2021-05', '2021-04']
+        self.lock = threading.Lock()
         self.files = self.gather_files()
+        self.column_types = self._get_column_types()
         self.schema_string = self._create_schema()
+        #A new crosswalk changes the player_id columns of every partition, so they are all reloaded
+        keys_version = crosswalk_version() if self.player_keys else ''
+        self.schema_hash = hashlib.md5(f"{self.schema_string} {self.partitioned_by} {keys_version}".encode()).hexdigest()
         self.main_create_statement = self._main_create_create_statement()
         self.drop_statement = self._create_drop_statement()
 
     def gather_files(self):
 
-        files = [self.directory+f for f in os.listdir(self.directory) if 'tsv.gz' in f]
+        files = [self.directory+f for f in os.listdir(self.directory) if is_data_file(f)]
 
         return files
 
-    def _create_schema(self):
-        """Creates the schema string statement from self.schema_config
+    @staticmethod
+    def _get_partition(file: str) -> str:
+        """Gets the partition from a file path, data/statcast/statcast_dir/2021-04.tsv.gz -> 2021-04"""
 
-        Returns:
-            schema_string (str)
+        return file_key(file)
+
+    def _get_column_types(self) -> dict:
+        """Gets the postgres type of each column across every partition file, with schema_override applied
 
         Ex Output:
-            (playerID varchar, yearID float, gameNum float, gameID varchar,
-             lgID varchar, teamID varchar, GP float, startingPos float)
+            {'pitch_type': 'varchar', 'game_date': 'date', 'release_speed': 'real'}
         """
-        conversion_dict =  {'float64': 'float',
-                            'int64': 'float',
-                            'object': 'varchar'}
 
-        df = pd.read_csv(sorted(self.files)[-1], sep=self.sep, compression=self.compression, low_memory=False, nrows=40000)
-        schema_dict = {c: conversion_dict[str(df[c].dtype)] for c in df.columns}
+        #Every partition is scanned and the types are widened across all of them
+        infer = functools.partial(infer_file_types, sep=self.sep, compression=self.compression)
+        schema_dict = get_registry().get_schema(self.table_name, sorted(self.files, reverse=True), infer)
+        column_types = {column: postgres_type(dtype) for column, dtype in schema_dict.items()}
 
         if self.schema_override is not None:
             for column, dtype in self.schema_override.items():
-                schema_dict[column] = dtype
+                column_types[column] = dtype
+        #The player_id columns are not in the files, they are joined on from the crosswalk during each load
+        for column in self.player_keys:
+            column_types[player_key_column(column)] = 'bigint'
+
+        return column_types
+
+    def _create_schema(self):
+        """Creates the schema string statement from self.column_types
+
+        Returns:
+            schema_string (str)
+
+        Ex Output:
+            (pitch_type varchar null, game_date date null, release_speed real null)
+        """
 
         col_strings = []
-        for col_name, col_dtype in schema_dict.items():
-            col_string = f'''"{col_name.lower().replace('.','_')}" {col_dtype} null'''
+        for col_name, col_dtype in self.column_types.items():
+            col_string = f'''{normalize_column(col_name)} {col_dtype} null'''
             col_strings.append(col_string)
         schema_string = f"({', '.join(col_strings)})"
 
         return schema_string
 
-    def _main_create_create_statement(self) -> str:
+    def _main_create_create_statement(self, table_name: str=None) -> str:
         """Creates the create table string command
 
+        Args:
+            table_name (str): The table to create. (default is self.table_name)
+
         Returns:
             create_statement (str)
 
@@ -250,82 +666,154 @@ class PartitionedTable():
              gameID varchar, lgID varchar, teamID varchar, GP float, startingPos float)
         """
 
-        create_statement = f"create table if not exists {self.table_name} {self.schema_string} partition by range ({self.partitioned_by})"
+        create_statement = f"create table if not exists {table_name or self.table_name} {self.schema_string} partition by range ({self.partitioned_by})"
 
         return create_statement
 
-    def _partition_create_statement(self, partition):
+    def _partition_range(self, partition) -> tuple:
+        """Gets the lowest value of a partition and the lowest value of the next one, as sql literals
+
+        Ex Output:
+            ("'2021-04-01'", "'2021-05-01'")
+        """
 
         if self.iterator == 'month':
             # Iterator comes in as '2020-04'
-            min_range = f"{partition}-01"  #First day of the month
-            max_range = pd.date_range(min_range, periods=2, freq='MS')[-1].strftime('%Y-%m-%d') #First day of the next month (range is exclusive)
-            partition_name = self._create_partition_name(partition)
-            create_statement = f'''
-                                create table if not exists {partition_name} 
-                                partition of {self.table_name} 
-                                for values from ('{min_range}') to ('{max_range}')
-                            '''
+            min_range = f"'{partition}-01'"  #First day of the month
+            max_range = f"'{pd.date_range(f'{partition}-01', periods=2, freq='MS')[-1].strftime('%Y-%m-%d')}'" #First day of the next month (range is exclusive)
         elif self.iterator == 'year':
             # Iterator comes as '2008' NOTE We need to convert to integer, since the datatype will be an integer
             min_range = int(partition)
             max_range = int(partition)+1
-            partition_name = self._create_partition_name(partition)
-
-            create_statement = f'''
-                                create table if not exists {partition_name} 
-                                partition of {self.table_name} 
-                                for values from ({min_range}) to ({max_range})
-                            '''
-
         elif self.iterator == 'year_date':
             # Iterator comes as '2008', but the partitioned_by is a string of dates YYYY-MM-DD
-            min_range = f"{partition}-01-01"
-            max_range = f"{int(partition)+1}-01-01"
-            partition_name = self._create_partition_name(partition)
-
-            create_statement = f'''
-                                create table if not exists {partition_name} 
-                                partition of {self.table_name} 
-                                for values from ('{min_range}') to ('{max_range}')
-                            '''
-
+            min_range = f"'{partition}-01-01'"
+            max_range = f"'{int(partition)+1}-01-01'"
         elif self.iterator == 'year_date_int':
             # Iterator comes as '2008', but the partitioned_by is a date as an int YYYYMMDD
-            min_range = int(f"{partition}0101")
-            max_range = int(f"{int(partition)+1}0101")
-            partition_name = self._create_partition_name(partition)
+            min_range = f"'{partition}0101'"
+            max_range = f"'{int(partition)+1}0101'"
+
+        return min_range, max_range
+
+    def _partition_bounds(self, partition) -> str:
+        """Creates the range of values of a partition
+
+        Ex Output:
+            for values from ('2021-04-01') to ('2021-05-01')
+        """
+
+        min_range, max_range = self._partition_range(partition)
+
+        return f"for values from ({min_range}) to ({max_range})"
+
+    def _partition_check(self, partition) -> str:
+        """Creates the check constraint matching the range of a partition, so attaching a table with it does not scan the table
+
+        Ex Output:
+            check (game_date is not null and game_date >= '2021-04-01' and game_date < '2021-05-01')
+        """
+
+        min_range, max_range = self._partition_range(partition)
+        column = self.partitioned_by
+
+        return f"check ({column} is not null and {column} >= {min_range} and {column} < {max_range})"
+
+    def _partition_create_statement(self, partition, parent: str=None):
+        """Creates the create statement of a partition
+
+        Args:
+            partition (str): The partition, ex: 2021-04
+            parent (str): The partitioned table, a partition of the shadow table is named after it. (default is self.table_name)
+
+        Ex Output:
+            create table if not exists statcast.statcast_2021_04
+            partition of statcast.statcast
+            for values from ('2021-04-01') to ('2021-05-01')
+        """
+
+        parent = parent or self.table_name
+        partition_name = self._create_partition_name(partition, parent)
+        create_statement = f'''
+                            create table if not exists {partition_name} 
+                            partition of {parent} 
+                            {self._partition_bounds(partition)}
+                        '''
 
-            create_statement = f'''
-                                create table if not exists {partition_name} 
-                                partition of {self.table_name} 
-                                for values from ('{min_range}') to ('{max_range}')
-                            '''
         return create_statement
 
-    def _partition_copy_statement(self, path, partition):
+    def _partition_copy_statement(self, path, partition_name):
+        """Creates the copy statement of a partition file
 
-        partition_name = self._create_partition_name(partition)
+        The columns of the file are listed, since partitions may have a subset of the table's columns
+
+        Args:
+            path (str): Absolute path of the partition file
+            partition_name (str): The table to copy into, ex: statcast.statcast_2021_04
+
+        Ex Output:
+            copy statcast.statcast_2021_04 ("pitch_type", "game_date", ...)
+            from program 'gzip -dc /data/statcast/statcast_dir/2021-04.tsv.gz'
+            CSV Header DELIMITER E'     ';
+        """
+
+        columns = read_columns(path, sep=self.sep, compression=self.compression)
+
+        if self._get_copy_from(path) == 'stdin':
+            return create_stdin_copy_statement(partition_name, columns, self.copy_format)
 
         if self.compression=='gzip':
             from_statement = f"gzip -dc {path}"
         else:
             from_statement = path
 
-        copy_statement = f'''copy {partition_name}
+        copy_statement = f'''copy {partition_name} {create_column_list(columns)}
                             from program '{from_statement}' 
                             CSV Header DELIMITER E'\t';'''
 
         return copy_statement
 
-    def _create_partition_name(self, partition):
+    def _get_copy_from(self, path: str) -> str:
+        """Gets the copy mode of a partition file, parquet and binary copies are always streamed since the server can only read text files"""
 
+        if get_format(path) == 'parquet' or self.copy_format == 'binary':
+            return 'stdin'
+
+        return self.copy_from
+
+    def _copy_partition(self, cur, path: str, partition_name: str) -> None:
+        """Copies a partition file into partition_name, encoding it in the binary format if self.copy_format is binary
+
+        With self.player_keys, the file is copied into a staging table and inserted with its player_id columns, see copy_keyed_file
+        """
+
+        column_types = self.column_types if self.copy_format == 'binary' else None
+        copy_args = dict(path=path, compression=self.compression, copy_from=self._get_copy_from(path),
+                         column_types=column_types, sep=self.sep)
+        if self.player_keys:
+            columns = read_columns(path, sep=self.sep, compression=self.compression)
+            copy_keyed_file(cur, functools.partial(self._partition_copy_statement, path), partition_name, columns,
+                            self.player_keys, self.column_types, copy_args)
+        else:
+            copy_file(cur, self._partition_copy_statement(path, partition_name), **copy_args)
+
+        return None
+
+    def _create_partition_name(self, partition, parent: str=None):
+        """Creates the name of a partition, ex: 2021-04 -> statcast.statcast_2021_04
+
+        Args:
+            partition (str): The partition, ex: 2021-04
+            parent (str): The partitioned table. (default is self.table_name)
+        """
+
+        parent = parent or self.table_name
         if self.iterator == 'month':
             #Comes in 2021-04 format
-            partition_name = f"{self.schema}.{self.name}_{partition.split('-')[0]}_{partition.split('-')[1]}"
+            partition_name = f"{parent}_{partition.split('-')[0]}_{partition.split('-')[1]}"
         if self.iterator in ['year', 'year_date', 'year_date_int']:
             # Comes as '2008'
-            partition_name = f"{self.schema}.{self.name}_{partition}"
+            partition_name = f"{parent}_{partition}"
 
         return partition_name
 
@@ -343,38 +831,634 @@ class PartitionedTable():
 
         return drop_statement
 
+    def _table_exists(self, cur) -> bool:
+        """Checks if the parent table already exists in the database"""
+
+        cur.execute("select to_regclass(%s) is not null", (self.table_name,))
+
+        return cur.fetchone()[0]
+
+    def _read_manifest(self, cur) -> dict:
+        """Reads the stored fingerprints of the loaded partitions from the manifest table
+
+        Returns:
+            manifest (dict): {partition_name: {'size', 'mtime', 'md5', 'schema_hash'}}
+        """
+
+        cur.execute(f"""select partition_name, file_size, file_mtime, file_md5, schema_hash
+                        from {MANIFEST_TABLE} where table_name = %s""", (self.table_name,))
+        manifest = {row[0]: {'size': row[1], 'mtime': row[2], 'md5': row[3], 'schema_hash': row[4]}
+                    for row in cur.fetchall()}
+
+        return manifest
+
+    def _write_manifest(self, cur, partition_name: str, path: str, fingerprint: dict) -> None:
+        """Upserts the fingerprint of a loaded partition into the manifest table"""
+
+        cur.execute(f"""insert into {MANIFEST_TABLE}
+                            (table_name, partition_name, file_path, file_size, file_mtime, file_md5, schema_hash, loaded_at)
+                        values (%s, %s, %s, %s, %s, %s, %s, now())
+                        on conflict (table_name, partition_name) do update
+                        set file_path = excluded.file_path, file_size = excluded.file_size,
+                            file_mtime = excluded.file_mtime, file_md5 = excluded.file_md5,
+                            schema_hash = excluded.schema_hash, loaded_at = excluded.loaded_at""",
+                    (self.table_name, partition_name, path, fingerprint['size'], fingerprint['mtime'],
+                     fingerprint['md5'], self.schema_hash))
+
+        return None
+
+    @staticmethod
+    def _partition_changed(path: str, stored: dict):
+        """Compares a partition file against its stored fingerprint
+
+        The md5 is only computed when the size or mtime differ from the manifest,
+        so unchanged files are never read
+
+        Returns:
+            changed (bool), fingerprint (dict)
+        """
+
+        fingerprint = file_fingerprint(path, with_hash=False)
+        if stored is not None and fingerprint['size'] == stored['size'] and fingerprint['mtime'] == stored['mtime']:
+            fingerprint['md5'] = stored['md5']
+            return False, fingerprint
+
+        fingerprint = file_fingerprint(path)
+        changed = stored is None or fingerprint['md5'] != stored['md5']
+
+        return changed, fingerprint
+
+    def _rollup_name(self, rollup: str) -> str:
+        """Gets the table of a rollup, ex: statcast_pitcher_season -> statcast.statcast_pitcher_season"""
+
+        return f"{self.schema}.{rollup}"
+
+    def _rollup_hash(self, rollup: str) -> str:
+        """Hashes the definition of a rollup and the schema of the table, stored as the comment of the rollup table"""
+
+        definition = json.dumps(self.rollups[rollup], sort_keys=True)
+
+        return hashlib.md5(f"{definition} {self.schema_hash}".encode()).hexdigest()
+
+    def _rollup_select_statement(self, rollup: str, partition_name: str) -> str:
+        """Creates the statement that aggregates a partition into its slice of a rollup
+
+        Ex Output:
+            select 'statcast.statcast_2021_04'::varchar as partition_name, "pitcher", "game_year",
+            count(*) as "pitches", sum(release_speed) as "release_speed_total"
+            from statcast.statcast_2021_04 group by "pitcher", "game_year"
+        """
+
+        group_by = [normalize_column(c) for c in self.rollups[rollup].get('group_by', [])]
+        aggregates = [f"{expression} as {normalize_column(column)}"
+                      for column, expression in self.rollups[rollup]['aggregates'].items()]
+        select_statement = f"select '{partition_name}'::varchar as {ROLLUP_PARTITION_COLUMN}, {', '.join(group_by + aggregates)} from {partition_name}"
+        if group_by:
+            select_statement += f" group by {', '.join(group_by)}"
+
+        return select_statement
+
+    def _find_stale_rollups(self, cur) -> list:
+        """Finds the rollups that do not exist yet or were built from another definition or schema"""
+
+        stale = []
+        for rollup in self.rollups:
+            cur.execute("select obj_description(to_regclass(%s), 'pg_class')", (self._rollup_name(rollup),))
+            if cur.fetchone()[0] != self._rollup_hash(rollup):
+                stale.append(rollup)
+        if stale:
+            logging.info(f"Rebuilding the rollups {stale} of {self.table_name}, they are new or their definition changed")
+
+        return stale
+
+    def _refresh_rollups(self, cur, partition_name: str) -> None:
+        """Recomputes the slice of each rollup computed from a partition, without committing
+
+        The rows of the partition are deleted and aggregated again from the partition,
+        so the rest of the rollup is never read. Stale rollups are rebuilt in self.finish_load instead.
+
+        Args:
+            cur: database cursor
+            partition_name (str): The reloaded partition, ex: statcast.statcast_2021_04
+        """
+
+        for rollup in self.rollups:
+            if rollup in self.stale_rollups:
+                continue
+            rollup_name = self._rollup_name(rollup)
+            with stage('rollup', table=rollup_name, partition=partition_name) as s:
+                cur.execute(f"delete from {rollup_name} where {ROLLUP_PARTITION_COLUMN} = %s", (partition_name,))
+                cur.execute(f"insert into {rollup_name} {self._rollup_select_statement(rollup, partition_name)}")
+                s.rows = cur.rowcount
+
+        return None
+
+    def _rebuild_rollups(self, cur, rollups: list) -> None:
+        """Drops and creates rollups, aggregating every partition of the table into them, without committing
+
+        Args:
+            cur: database cursor
+            rollups (list): Names of the rollups in self.rollups
+        """
+
+        partition_names = [self._create_partition_name(self._get_partition(file)) for file in sorted(self.files, reverse=True)]
+        for rollup in rollups:
+            rollup_name = self._rollup_name(rollup)
+            logging.info(f"Rebuilding {rollup_name} from {len(partition_names)} partitions")
+            with stage('rollup', table=rollup_name) as s:
+                cur.execute(f"drop table if exists {rollup_name}")
+                #The column types come from the aggregates, the partition column is always varchar
+                cur.execute(f"create table {rollup_name} as {self._rollup_select_statement(rollup, self.table_name)} with no data")
+                cur.execute(f"comment on table {rollup_name} is '{self._rollup_hash(rollup)}'")
+                s.rows = 0
+                for partition_name in partition_names:
+                    cur.execute(f"insert into {rollup_name} {self._rollup_select_statement(rollup, partition_name)}")
+                    s.rows += cur.rowcount
+                cur.execute(f"create index if not exists {create_index_name(rollup_name, [ROLLUP_PARTITION_COLUMN])} on {rollup_name} ({ROLLUP_PARTITION_COLUMN})")
+
+        return None
+
     def update_table(self, conn, cur):
-        """Drops, creates, and copies data into database
+        """Updates the table in the database, copying the partitions one after another
+
+        Args:
+            conn: database connection
+            cur: database cursor
+        """
+
+        for job in self.prepare_load(conn, cur) + self.post_load_jobs(conn, cur):
+            job(conn, cur)
+        self.finish_load(conn, cur)
+        logging.info(f"Finished updating {self.table_name}")
+
+        return None
+
+    def prepare_load(self, conn, cur) -> list:
+        """Creates the table and every partition that will be copied into, and returns the copy jobs
+
+        If the table is incremental, already exists, and was loaded with the same schema,
+        only the partitions whose files changed are reloaded. Otherwise the full table is rebuilt.
+        All partitions exist once this returns, so the jobs can run concurrently on separate connections.
+
+        Args:
+            conn: database connection
+            cur: database cursor
+
+        Returns:
+            jobs (list): callables taking (conn, cur) that each load one partition
+        """
+
+        ensure_manifest_table(conn, cur)
+
+        if self.incremental and self._table_exists(cur):
+            manifest = self._read_manifest(cur)
+            if manifest and all(m['schema_hash'] == self.schema_hash for m in manifest.values()):
+                self.stale_rollups = self._find_stale_rollups(cur)
+                return self._prepare_incremental_load(conn, cur, manifest)
+            logging.info(f"The schema of {self.table_name} or the crosswalk it is keyed from changed, reloading all partitions")
+
+        return self._prepare_full_load(conn, cur)
+
+    def _prepare_full_load(self, conn, cur) -> list:
+        """Drops and creates the table and all of its partitions
+
+        In swap mode the shadow table and its partitions are created instead,
+        and the table is left untouched until self.finish_load
 
         Args:
             conn: database connection
             cur: database cursor
+
+        Returns:
+            jobs (list): One copy job per partition file
         """
 
         logging.info(f"Begining to update {self.table_name}")
-        #Drop Table
-        cur.execute(self.drop_statement)
+        self.full_load = True
+        self.loaded_partitions = [self._get_partition(file) for file in sorted(self.files, reverse=True)]
+        if self.load_mode == 'swap':
+            target = self.shadow_name
+            cur.execute(f"drop table if exists {self.shadow_name}")
+            self.shadow_fingerprints = {}
+        else:
+            target = self.table_name
+            #Drop Table
+            cur.execute(self.drop_statement)
+            cur.execute(f"delete from {MANIFEST_TABLE} where table_name = %s", (self.table_name,))
         conn.commit()
 
         #Create Table
-        cur.execute(self.main_create_statement)
+        cur.execute(self._main_create_create_statement(target))
         conn.commit()
 
+        jobs = []
         for file in sorted(self.files, reverse=True):
             #We want to create a partition
-            partition = file.split('.')[0].split('/')[-1]
-            partition_create_statement = self._partition_create_statement(partition)
+            partition = self._get_partition(file)
+            partition_create_statement = self._partition_create_statement(partition, target)
             cur.execute(partition_create_statement)
             conn.commit()
 
-            #copying
             path = os.path.abspath(file)
-            partition_copy_statement = self._partition_copy_statement(path, partition)
-            cur.execute(partition_copy_statement)
+            if self.load_mode == 'swap':
+                jobs.append(functools.partial(self._load_shadow_partition, path=path, partition=partition))
+            else:
+                jobs.append(functools.partial(self._load_partition, path=path, partition=partition,
+                                              fingerprint=None, delete=False))
+
+        return jobs
+
+    def _prepare_incremental_load(self, conn, cur, manifest: dict) -> list:
+        """Finds the partitions whose files changed since the last load
+
+        Missing partitions are created and partitions whose files were removed are dropped.
+
+        Args:
+            conn: database connection
+            cur: database cursor
+            manifest (dict): The stored fingerprints from self._read_manifest
+
+        Returns:
+            jobs (list): One reload job per changed partition file
+        """
+
+        logging.info(f"Begining to incrementally update {self.table_name}")
+        self.full_load = False
+        self.loaded_partitions = []
+
+        #Indexes added to the config since the last load are built on every partition,
+        #a shadow partition is indexed before it is attached, so its indexes are attached instead of built
+        for columns in self.indexes:
+            build_index(conn, cur, create_index_statement(self.table_name, columns), self.maintenance_work_mem)
+
+        jobs = []
+        loaded_partitions = set()
+        for file in sorted(self.files, reverse=True):
+            partition = self._get_partition(file)
+            partition_name = self._create_partition_name(partition)
+            loaded_partitions.add(partition_name)
+
+            path = os.path.abspath(file)
+            changed, fingerprint = self._partition_changed(path, manifest.get(partition_name))
+            if not changed:
+                if fingerprint['mtime'] != manifest[partition_name]['mtime']:
+                    self._write_manifest(cur, partition_name, path, fingerprint)
+                    conn.commit()
+                continue
+
+            self.loaded_partitions.append(partition)
+            if self.load_mode == 'swap':
+                jobs.append(functools.partial(self._swap_partition, path=path, partition=partition,
+                                              fingerprint=fingerprint))
+            else:
+                cur.execute(self._partition_create_statement(partition))
+                conn.commit()
+                jobs.append(functools.partial(self._load_partition, path=path, partition=partition,
+                                              fingerprint=fingerprint, delete=True))
+
+        for partition_name in set(manifest) - loaded_partitions:
+            logging.info(f"Dropping {partition_name}, its file no longer exists")
+            cur.execute(f"drop table if exists {partition_name}")
+            cur.execute(f"delete from {MANIFEST_TABLE} where table_name = %s and partition_name = %s",
+                        (self.table_name, partition_name))
+            for rollup in self.rollups:
+                if rollup not in self.stale_rollups:
+                    cur.execute(f"delete from {self._rollup_name(rollup)} where {ROLLUP_PARTITION_COLUMN} = %s", (partition_name,))
             conn.commit()
 
+        logging.info(f"There are {len(jobs)} changed partitions to reload in {self.table_name}")
+
+        return jobs
+
+    def _load_partition(self, conn, cur, path: str, partition: str, fingerprint: dict=None, delete: bool=False) -> None:
+        """Copies a file into its partition and records its fingerprint in a single transaction
+
+        When delete is set, the old rows are deleted first. A DELETE does not lock out readers the way
+        a TRUNCATE does, so they keep reading the old rows until the commit and then see the new ones,
+        never an empty partition. The deleted rows are left for autovacuum.
+        The partition's slice of each rollup is refreshed in the same transaction, unless every partition is being loaded.
+
+        Args:
+            conn: database connection
+            cur: database cursor
+            path (str): Absolute path of the partition file
+            partition (str): The partition, ex: 2021-04
+            fingerprint (dict): Fingerprint of the file, computed if not passed
+            delete (bool): Whether to delete the rows of the partition before copying
+        """
+
+        partition_name = self._create_partition_name(partition)
+        if fingerprint is None:
+            fingerprint = file_fingerprint(path)
+
+        if delete:
+            logging.info(f"Reloading {partition_name} from {path}")
+            cur.execute(f"delete from {partition_name}")
+        self._copy_partition(cur, path, partition_name)
+        self._write_manifest(cur, partition_name, path, fingerprint)
+        if not self.full_load:
+            self._refresh_rollups(cur, partition_name)
+        conn.commit()
+
+        return None
+
+    def _load_shadow_partition(self, conn, cur, path: str, partition: str) -> None:
+        """Copies a file into its partition of the shadow table
+
+        The fingerprint is written to the manifest when the shadow table is swapped in by self.finish_load
+
+        Args:
+            conn: database connection
+            cur: database cursor
+            path (str): Absolute path of the partition file
+            partition (str): The partition, ex: 2021-04
+        """
+
+        shadow_partition_name = self._create_partition_name(partition, self.shadow_name)
+        fingerprint = file_fingerprint(path)
+
+        self._copy_partition(cur, path, shadow_partition_name)
+        conn.commit()
+
+        with self.lock:
+            self.shadow_fingerprints[self._create_partition_name(partition)] = (path, fingerprint)
+
+        return None
+
+    def _swap_partition(self, conn, cur, path: str, partition: str, fingerprint: dict) -> None:
+        """Copies a file into a shadow partition and swaps it in for the partition in a single transaction
+
+        The shadow is a standalone table until the swap, where the old partition is dropped,
+        the shadow is renamed and attached in its place, and the fingerprint is recorded.
+        The shadow is indexed and analyzed first, so attaching it does not build any indexes, and it has
+        a check constraint matching the range of the partition, so attaching it does not scan it either.
+        The swap only holds the lock on the parent for the renames and catalog updates.
+        Readers see the old partition until the commit. The partition's slice of each rollup is
+        refreshed in a transaction after it, so the rollups briefly lag the partition.
+
+        Args:
+            conn: database connection
+            cur: database cursor
+            path (str): Absolute path of the partition file
+            partition (str): The partition, ex: 2021-04
+            fingerprint (dict): Fingerprint of the file
+        """
+
+        partition_name = self._create_partition_name(partition)
+        shadow_partition_name = f"{partition_name}{SHADOW_SUFFIX}"
+        #ex: statcast_2021_04_bounds, kept through the rename and dropped once the partition is attached
+        check_name = f"{partition_name.split('.')[1]}_bounds"[:63]
+        logging.info(f"Reloading {partition_name} from {path}")
+
+        cur.execute(f"drop table if exists {shadow_partition_name}")
+        cur.execute(f"create table {shadow_partition_name} (like {self.table_name})")
+        self._copy_partition(cur, path, shadow_partition_name)
+        cur.execute(f"alter table {shadow_partition_name} add constraint {check_name} {self._partition_check(partition)}")
+        conn.commit()
+        self._index_partition(conn, cur, shadow_partition_name)
+
+        swap_shadow(cur, self.schema, partition_name.split('.')[1])
+        cur.execute(f"alter table {self.table_name} attach partition {partition_name} {self._partition_bounds(partition)}")
+        cur.execute(f"alter table {partition_name} drop constraint {check_name}")
+        self._write_manifest(cur, partition_name, path, fingerprint)
+        conn.commit()
+
+        self._refresh_rollups(cur, partition_name)
+        conn.commit()
+
+        return None
+
+    def _index_partition(self, conn, cur, partition_name: str) -> None:
+        """Builds the configured indexes of a loaded partition and analyzes it
+
+        Args:
+            conn: database connection
+            cur: database cursor
+            partition_name (str): ex: statcast.statcast_2021_04
+        """
+
+        for columns in self.indexes:
+            build_index(conn, cur, create_index_statement(partition_name, columns), self.maintenance_work_mem)
+        analyze_table(conn, cur, partition_name)
+
+        return None
+
+    def post_load_jobs(self, conn, cur) -> list:
+        """Returns the jobs that run once every partition is loaded, one per loaded partition
+
+        After a full load each partition is indexed and analyzed, the indexes of the parent are
+        created in self.finish_load and attach the partition indexes instead of building them.
+        After an incremental load only the reloaded partitions are analyzed, in swap mode
+        that already happened before each partition was attached.
+
+        Args:
+            conn: database connection
+            cur: database cursor
+
+        Returns:
+            jobs (list): callables taking (conn, cur) that can run concurrently
+        """
+
+        if self.full_load:
+            target = self.shadow_name if self.load_mode == 'swap' else self.table_name
+            return [functools.partial(self._index_partition, partition_name=self._create_partition_name(partition, target))
+                    for partition in self.loaded_partitions]
+
+        if self.load_mode == 'replace':
+            return [functools.partial(analyze_table, table_name=self._create_partition_name(partition))
+                    for partition in self.loaded_partitions]
+
+        return []
+
+    def finish_load(self, conn, cur) -> None:
+        """Creates the indexes of the parent and swaps the shadow table in, recording the fingerprints of its partitions
+
+        Runs once every load job has finished. The table is dropped and the shadow table,
+        its partitions and their indexes are renamed in a single transaction, along with
+        rebuilding every rollup, so readers never see the rollups out of step with the table.
+        After an incremental load only the rollups whose definition changed are rebuilt.
+        The parent is not analyzed, since ANALYZE recurses into every partition and not only the changed ones.
+
+        Args:
+            conn: database connection
+            cur: database cursor
+        """
+
+        #Every partition is loaded once the jobs have finished, so none of the files are dirty
+        if not self.full_load:
+            if self.stale_rollups:
+                self._rebuild_rollups(cur, self.stale_rollups)
+                conn.commit()
+            get_write_manifest().mark_clean(self.files)
+            return None
+
+        target = self.shadow_name if self.load_mode == 'swap' else self.table_name
+        for columns in self.indexes:
+            build_index(conn, cur, create_index_statement(target, columns), self.maintenance_work_mem)
+
+        if self.load_mode == 'swap':
+            logging.info(f"Swapping {self.shadow_name} in for {self.table_name}")
+            swap_shadow(cur, self.schema, self.name)
+            cur.execute(f"delete from {MANIFEST_TABLE} where table_name = %s", (self.table_name,))
+            for partition_name, (path, fingerprint) in self.shadow_fingerprints.items():
+                self._write_manifest(cur, partition_name, path, fingerprint)
+        self._rebuild_rollups(cur, list(self.rollups))
+        conn.commit()
+        self.full_load = False
+        get_write_manifest().mark_clean(self.files)
+
         return None
 
+def create_stdin_copy_statement(table_name: str, columns: list=None, copy_format: str='csv') -> str:
+    """Creates the copy statement for a file streamed from the client
+
+    Ex Output:
+        copy lahman.all_star_full from stdin CSV Header DELIMITER E'     ';
+        copy statcast.statcast_2021_04 ("pitch_type", ...) from stdin (format binary);
+    """
+
+    column_list = create_column_list(columns) if columns is not None else ''
+    if copy_format == 'binary':
+        return f"copy {table_name} {column_list} from stdin (format binary);"
+
+    copy_statement = f'''copy {table_name} {column_list}
+                        from stdin
+                        CSV Header DELIMITER E'\t';'''
+
+    return copy_statement
+
+def copy_file(cur, copy_statement: str, path: str, compression: str='gzip', copy_from: str='program',
+              column_types: dict=None, sep: str='\t', table: str=None) -> None:
+    """Runs a copy statement
+
+    For server side copies the statement already references the file. For client side
+    copies the file is decompressed and streamed to the server in COPY_BUFFER_SIZE blocks,
+    so the whole file is never held in memory and the server does not need access to it.
+    Parquet files are converted to csv in batches on the way through.
+    When column_types is passed, the file is encoded in the binary copy format instead,
+    so the server does not parse any text.
+
+    Args:
+        cur: database cursor
+        copy_statement (str): The statement from _create_copy_statement or _partition_copy_statement
+        path (str): Path of the file being copied
+        compression (str): gzip or None. (default is gzip)
+        copy_from (str): program or stdin. (default is program)
+        column_types (dict): {column: postgres type} of the table, for binary copies. (default is None)
+        sep (str): Delimiter of tsv files, for binary copies. (default is tab)
+        table (str): The table the copy is recorded under in the metrics. (default is the table of copy_statement)
+    """
+
+    #ex: copy statcast.statcast_2021_04 ... -> statcast.statcast_2021_04
+    table = table or copy_statement.split()[1]
+    with stage('copy', table=table, path=path, copy_from=copy_from) as s:
+        if copy_from != 'stdin':
+            cur.execute(copy_statement)
+        else:
+            if column_types is not None:
+                stream = BinaryCopyStream(path, column_types, sep=sep, compression=compression)
+            else:
+                stream = open_csv_stream(path, compression)
+
+            with stream as f:
+                cur.copy_expert(copy_statement, f, size=COPY_BUFFER_SIZE)
+        s.rows, s.bytes = cur.rowcount, os.path.getsize(path)
+
+    return None
+
+def create_index_name(table_name: str, columns: list) -> str:
+    """Creates the name of an index, postgres names are at most 63 characters
+
+    Ex Output:
+        create_index_name('lahman.batting', ['playerID', 'yearID']) -> batting_playerid_yearid_idx
+    """
+
+    name = '_'.join([table_name.split('.')[-1]] + [c.lower().replace('.', '_') for c in columns] + ['idx'])
+
+    return name[:63]
+
+def create_index_statement(table_name: str, columns: list, unique: bool=False) -> str:
+    """Creates the create index statement of an entry of indexes: or unique_indexes: in tables_config.yaml
+
+    Ex Output:
+        create index if not exists batting_playerid_idx on lahman.batting ("playerid")
+    """
+
+    index_type = 'unique index' if unique else 'index'
+
+    return f"create {index_type} if not exists {create_index_name(table_name, columns)} on {table_name} {create_column_list(columns)}"
+
+def build_index(conn, cur, index_statement: str, maintenance_work_mem: str=MAINTENANCE_WORK_MEM) -> None:
+    """Runs a create index statement with its own maintenance_work_mem
+
+    Args:
+        conn: database connection
+        cur: database cursor
+        index_statement (str): ex: create index if not exists batting_playerid_idx on lahman.batting ("playerid")
+        maintenance_work_mem (str): Memory postgres can use to build the index. (default is MAINTENANCE_WORK_MEM)
+    """
+
+    logging.info(index_statement)
+    #ex: create index if not exists batting_playerid_idx on lahman.batting ("playerid") -> lahman.batting
+    with stage('index', table=re.search(r'\son\s+(\S+)', index_statement, re.IGNORECASE).group(1)):
+        cur.execute("set local maintenance_work_mem = %s", (maintenance_work_mem,))
+        cur.execute(index_statement)
+        conn.commit()
+
+    return None
+
+def analyze_table(conn, cur, table_name: str) -> None:
+    """Updates the planner statistics of a freshly loaded table or partition"""
+
+    with stage('analyze', table=table_name):
+        cur.execute(f"analyze {table_name}")
+        conn.commit()
+
+    return None
+
+def swap_shadow(cur, schema: str, name: str) -> None:
+    """Drops a table and renames its shadow table in its place, without committing
+
+    Every table and index in the schema whose name starts with {name}__shadow is renamed,
+    so the partitions and indexes of a shadow table keep the names they had before.
+    Run in the same transaction as the load, readers see the old table until the commit.
+
+    Args:
+        cur: database cursor
+        schema (str): Schema of the table, ex: statcast
+        name (str): Name of the table, ex: statcast
+
+    Ex:
+        statcast.statcast__shadow -> statcast.statcast
+        statcast.statcast__shadow_2021_04 -> statcast.statcast_2021_04
+    """
+
+    shadow = f"{name}{SHADOW_SUFFIX}"
+    cur.execute(f"drop table if exists {schema}.{name}")
+    cur.execute("""select c.relname, c.relkind from pg_class c
+                   join pg_namespace n on n.oid = c.relnamespace
+                   where n.nspname = %s and left(c.relname, %s) = %s and c.relkind in ('r', 'p', 'i', 'I')""",
+                (schema, len(shadow), shadow))
+
+    for relname, relkind in cur.fetchall():
+        new_name = f"{name}{relname[len(shadow):]}"
+        relation_type = 'index' if relkind in ('i', 'I') else 'table'
+        cur.execute(f'alter {relation_type} {schema}."{relname}" rename to "{new_name}"')
+
+    return None
+
+def ensure_manifest_table(conn, cur) -> None:
+    """Creates the manifest table that stores the fingerprint of each loaded partition file"""
+
+    cur.execute(f"""create schema if not exists {MANIFEST_TABLE.split('.')[0]};
+                    create table if not exists {MANIFEST_TABLE}
+                    (table_name varchar, partition_name varchar, file_path varchar, file_size bigint,
+                     file_mtime double precision, file_md5 varchar, schema_hash varchar, loaded_at timestamp,
+                     primary key (table_name, partition_name))""")
+    conn.commit()
+
+    return None
+
 if __name__ == "__main__":
     configure_logging()
     main()
@@ -1,11 +1,14 @@
+import hashlib
 import logging
 import os
 import random
+import threading
 import time
 
-import pandas as pd
 import psycopg2
+import psycopg2.pool
 import yaml
+from storage import is_data_file, read_columns, read_frame, write_frame
 
 
 def configure_logging():
@@ -29,6 +32,21 @@ def load_secrets(path: str='secrets.yaml') -> None:
     for k, v in secrets.items():
         os.environ[k] = v
 
+def load_config(path: str='scripts/tables_config.yaml') -> dict:
+    """Loads a yaml config from the specified path
+
+    Args:
+        path (str): Path of the config
+
+    Returns:
+        config (Mapping): The dictionary from the loaded yaml
+    """
+
+    with open(path) as f:
+        config = yaml.safe_load(f)
+
+    return config
+
 def sleep_random(min_seconds: float=1, max_seconds: float=5) -> None:
     """Function that waits at a random time based on a uniform distribution
 
@@ -43,6 +61,30 @@ def sleep_random(min_seconds: float=1, max_seconds: float=5) -> None:
     wait = random.uniform(min_seconds,max_seconds)
     time.sleep(wait)
 
+def file_fingerprint(path: str, with_hash: bool=True, chunk_size: int=1024*1024) -> dict:
+    """Creates a content fingerprint of a file
+
+    Args:
+        path (str): Path to the file
+        with_hash (bool): Whether to compute the md5 of the file contents. (default is True)
+        chunk_size (int): Number of bytes read at a time while hashing. (default is 1MB)
+
+    Returns:
+        fingerprint (dict): {'size': bytes, 'mtime': modified time, 'md5': hex digest or None}
+    """
+
+    stat = os.stat(path)
+    fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime, 'md5': None}
+
+    if with_hash:
+        md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                md5.update(chunk)
+        fingerprint['md5'] = md5.hexdigest()
+
+    return fingerprint
+
 def create_db_connection():
 
     load_secrets()
@@ -51,18 +93,54 @@ def create_db_connection():
 
     return conn, cur
 
+class BlockingConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """Thread safe pool that waits for a free connection instead of raising PoolError when exhausted"""
+
+    def __init__(self, minconn: int, maxconn: int, *args, **kwargs) -> None:
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self._semaphore = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self, key=None):
+        self._semaphore.acquire()
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._semaphore.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False) -> None:
+        super().putconn(conn, key, close)
+        self._semaphore.release()
+
+def create_db_pool(max_connections: int=4):
+    """Creates a thread safe pool of database connections
+
+    Borrowing a connection waits while all max_connections are in use, so any number of
+    threads can share the pool
+
+    Args:
+        max_connections (int): Maximum number of open connections. (default is 4)
+
+    Returns:
+        pool (BlockingConnectionPool)
+    """
+
+    load_secrets()
+    pool = BlockingConnectionPool(1, max_connections, os.getenv('db_access'))
+
+    return pool
+
 def check_statcast_schema(data_path='data/statcast/statcast_dir/'):
     
-    file_list = sorted([data_path+f for f in os.listdir(data_path) if 'tsv.gz' in f])
+    file_list = sorted([data_path+f for f in os.listdir(data_path) if is_data_file(f)])
     
     d = {}
     for f in file_list:
-        df = pd.read_csv(f, sep='\t')
-
-        if 'index' in df.columns:
+        #Only the header is read, the rows are only read for files that need to be rewritten
+        if 'index' in read_columns(f):
             print(f'{f} has the index column')
-            df = df.drop(columns='index')
-            df.to_csv(f, index=False, sep='\t', compression='gzip')
+            df = read_frame(f).drop(columns='index')
+            write_frame(df, f)
             print(f'Wrote the updated df to {f}')
         else:
             print(f'{f} does not have the index column, passing')
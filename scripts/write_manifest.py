@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import pandas as pd
+
+MANIFEST_PATH = 'data/write_manifest.json'
+
+
+def frame_hash(df: pd.DataFrame) -> str:
+    """Creates a canonical hash of the columns, types and values of a DataFrame, ignoring its index
+
+    Returns:
+        md5 (str): Hex digest, ex: 9e107d9d372bb6826bd81d3542a419d6
+    """
+
+    md5 = hashlib.md5()
+    md5.update(json.dumps([[str(c), str(t)] for c, t in df.dtypes.items()]).encode())
+    try:
+        md5.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    except TypeError:
+        #Columns holding unhashable values, ex: lists, are hashed as text
+        md5.update(df.to_csv(index=False).encode())
+
+    return md5.hexdigest()
+
+def _file_stat(path: str) -> dict:
+
+    stat = os.stat(path)
+
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+class WriteManifest():
+    """Persisted hash of the data last written to each file, and whether it has been loaded since
+
+    A write whose data hashes the same as the stored hash is skipped, so the file, its mtime and
+    everything downstream of it are left untouched. Written files are dirty until the loader marks
+    them clean. Files without an entry, or changed since their entry, are always dirty.
+    """
+
+    def __init__(self, path: str=MANIFEST_PATH) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.files = self._load()
+
+    def _load(self) -> dict:
+        """Loads the manifest from self.path, an empty manifest if it does not exist yet"""
+
+        if not os.path.exists(self.path):
+            return {}
+
+        with open(self.path) as f:
+            return json.load(f)
+
+    def _save(self) -> None:
+        """Writes the manifest atomically, see storage.write_json"""
+
+        #storage imports this module
+        from storage import write_json
+        write_json(self.files, self.path, indent=2)
+
+        return None
+
+    def _entry(self, path: str):
+        """Gets the entry of a file, None if it has none or the file was changed since it was written"""
+
+        with self.lock:
+            entry = self.files.get(os.path.abspath(path))
+        if entry is None or not os.path.exists(path) or entry['stat'] != _file_stat(path):
+            return None
+
+        return entry
+
+    def is_unchanged(self, path: str, content_hash: str) -> bool:
+        """Checks if a file already holds the data with content_hash"""
+
+        entry = self._entry(path)
+
+        return entry is not None and entry['hash'] == content_hash
+
+    def record(self, path: str, content_hash: str) -> None:
+        """Stores the hash of the data just written to a file, and marks it dirty"""
+
+        with self.lock:
+            self.files[os.path.abspath(path)] = {'hash': content_hash, 'stat': _file_stat(path), 'dirty': True}
+            self._save()
+
+        return None
+
+    def is_dirty(self, path: str) -> bool:
+        """Checks if a file was written since it was last loaded"""
+
+        entry = self._entry(path)
+
+        return entry is None or entry['dirty']
+
+    def dirty_paths(self) -> list:
+        """Gets every recorded file that was written since it was last loaded"""
+
+        with self.lock:
+            paths = list(self.files)
+
+        return sorted(p for p in paths if self.is_dirty(p))
+
+    def mark_clean(self, paths: list) -> None:
+        """Marks files as loaded
+
+        Files that were not written by write_frame, or were changed since, are recorded without a hash,
+        so they stay clean until they change again and their next write is never skipped
+
+        Args:
+            paths (list): The files that were loaded
+        """
+
+        with self.lock:
+            for path in paths:
+                if not os.path.exists(path):
+                    continue
+                stat = _file_stat(path)
+                entry = self.files.setdefault(os.path.abspath(path), {'hash': None, 'stat': stat})
+                if entry['stat'] != stat:
+                    entry['hash'] = None
+                entry.update({'stat': stat, 'dirty': False})
+            self._save()
+        logging.info(f"Marked {len(paths)} loaded files clean")
+
+        return None
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+def get_write_manifest() -> WriteManifest:
+    """Gets the write manifest shared by every writer and load in the process"""
+
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = WriteManifest()
+
+    return _manifest
@@ -0,0 +1,130 @@
+import datetime
+import io
+import struct
+
+import numpy as np
+import pandas as pd
+from binary_copy import HEADER, TRAILER, BinaryCopyStream, encode_frame
+
+PG_EPOCH = datetime.datetime(2000, 1, 1)
+COLUMN_TYPES = {'player': 'varchar',
+                'pitches': 'integer',
+                'mlbam': 'bigint',
+                'speed': 'double precision',
+                'spin': 'real',
+                'game_date': 'date',
+                'pitched_at': 'timestamp',
+                'is_strike': 'boolean'}
+
+
+def decode_value(data: bytes, dtype: str):
+    """Decodes a field of the postgres binary copy format"""
+
+    if dtype in ('varchar', 'text', 'null'):
+        return data.decode('utf-8')
+    if dtype == 'date':
+        return (PG_EPOCH + datetime.timedelta(days=struct.unpack('>i', data)[0])).date()
+    if dtype == 'timestamp':
+        return PG_EPOCH + datetime.timedelta(microseconds=struct.unpack('>q', data)[0])
+    formats = {'smallint': '>h', 'integer': '>i', 'bigint': '>q', 'real': '>f', 'double precision': '>d', 'boolean': '>?'}
+
+    return struct.unpack(formats[dtype], data)[0]
+
+def decode_rows(data: bytes, dtypes: list) -> list:
+    """Decodes the rows written by encode_frame, checking every byte belongs to a row"""
+
+    rows = []
+    f = io.BytesIO(data)
+    while f.tell() < len(data):
+        count = struct.unpack('>h', f.read(2))[0]
+        assert count == len(dtypes)
+        row = []
+        for dtype in dtypes:
+            length = struct.unpack('>i', f.read(4))[0]
+            row.append(None if length == -1 else decode_value(f.read(length), dtype))
+        rows.append(tuple(row))
+
+    return rows
+
+def encode_and_decode(df: pd.DataFrame, column_types: dict=COLUMN_TYPES) -> list:
+
+    return decode_rows(encode_frame(df, column_types), [column_types[c] for c in df.columns])
+
+def test_nulls_in_fixed_and_text_columns():
+
+    df = pd.DataFrame({'player': ['a', None, 'c'], 'pitches': [1.0, 2.0, np.nan], 'speed': [np.nan, 95.5, 90.25]})
+
+    assert encode_and_decode(df) == [('a', 1, None), (None, 2, 95.5), ('c', None, 90.25)]
+
+def test_empty_string_is_null():
+    """The same as COPY ... CSV, where an unquoted empty field is NULL"""
+
+    df = pd.DataFrame({'player': ['', 'b'], 'mlbam': ['', '1']})
+
+    assert encode_and_decode(df) == [(None, None), ('b', 1)]
+
+def test_integers_held_as_float64():
+    """Integer columns of tsv files are parsed as float64, so they can hold NaN"""
+
+    df = pd.DataFrame({'pitches': np.array([3.0, np.nan, -7.0, 2147483647.0])})
+
+    assert df['pitches'].dtype == np.float64
+    assert encode_and_decode(df) == [(3,), (None,), (-7,), (2147483647,)]
+
+def test_bigint_text_keeps_every_digit():
+    """Bigints are read as text, a float64 would round values past 2**53"""
+
+    df = pd.DataFrame({'mlbam': ['9007199254740993', None, '-9223372036854775808']})
+
+    assert encode_and_decode(df) == [(9007199254740993,), (None,), (-9223372036854775808,)]
+
+def test_real_is_rounded_to_float32():
+
+    df = pd.DataFrame({'spin': ['2400.5', '0.1']})
+
+    assert encode_and_decode(df) == [(2400.5,), (float(np.float32(0.1)),)]
+
+def test_date_timestamp_and_boolean():
+
+    df = pd.DataFrame({'game_date': ['2021-04-01', '1999-12-31', None],
+                       'pitched_at': ['2021-04-01 19:05:03.25', '2000-01-01 00:00:00', None],
+                       'is_strike': ['True', 'false', None]})
+
+    assert encode_and_decode(df) == [
+        (datetime.date(2021, 4, 1), datetime.datetime(2021, 4, 1, 19, 5, 3, 250000), True),
+        (datetime.date(1999, 12, 31), datetime.datetime(2000, 1, 1), False),
+        (None, None, None)]
+
+def test_multibyte_utf8():
+    """Lengths are in bytes, not characters"""
+
+    df = pd.DataFrame({'player': ['Acuña', '大谷翔平', 'Ohtani']})
+
+    assert encode_and_decode(df) == [('Acuña',), ('大谷翔平',), ('Ohtani',)]
+
+def test_padding_is_dropped_when_text_widths_differ():
+    """Shorter text values are padded to the widest in the record array, the padding must not be sent"""
+
+    df = pd.DataFrame({'player': ['a', 'abcdefghij', None, 'abc', ''],
+                       'pitches': [1.0, 2.0, 3.0, 4.0, 5.0],
+                       'game_date': ['2021-04-01', None, '2021-04-03', '2021-04-04', '2021-04-05']})
+    data = encode_frame(df, COLUMN_TYPES)
+
+    #count, then a length and the bytes of each non null field
+    expected_bytes = sum(2 + 3*4 + len(p or '') + 4 + (4 if d else 0)
+                         for p, d in zip(['a', 'abcdefghij', None, 'abc', None], df['game_date']))
+    assert len(data) == expected_bytes
+    assert decode_rows(data, ['varchar', 'integer', 'date']) == [
+        ('a', 1, datetime.date(2021, 4, 1)), ('abcdefghij', 2, None), (None, 3, datetime.date(2021, 4, 3)),
+        ('abc', 4, datetime.date(2021, 4, 4)), (None, 5, datetime.date(2021, 4, 5))]
+
+def test_stream_has_header_and_trailer(tmp_path):
+
+    path = str(tmp_path / '2021-04.tsv.gz')
+    pd.DataFrame({'player': ['a', 'b'], 'pitches': [1, None]}).to_csv(path, sep='\t', index=False, compression='gzip')
+
+    with BinaryCopyStream(path, {'player': 'varchar', 'pitches': 'integer'}) as stream:
+        data = stream.read()
+
+    assert data.startswith(HEADER) and data.endswith(TRAILER)
+    assert decode_rows(data[len(HEADER):-len(TRAILER)], ['varchar', 'integer']) == [('a', 1), ('b', None)]
@@ -0,0 +1,114 @@
+import csv
+import io
+
+import pandas as pd
+import pytest
+from update_db import COPY_BUFFER_SIZE, copy_file, create_stdin_copy_statement
+
+#NULL and the empty string are different values, quotes, tabs and newlines must survive the trip
+ROWS = pd.DataFrame({'playerID': ['aaronha01', 'o"neilpa01', 'tab\there', 'line\nbreak', '', None],
+                     'HR': pd.array([755, 0, 1, 2, 3, None], dtype='Int64')})
+
+
+class FakeCursor():
+    """Records what copy_file sends through copy_expert"""
+
+    def __init__(self) -> None:
+        self.statements = []
+        self.data = b''
+        self.reads = []
+        self.rowcount = -1
+
+    def execute(self, statement: str) -> None:
+        self.statements.append(statement)
+
+    def copy_expert(self, statement: str, file, size: int=8192) -> None:
+        self.statements.append(statement)
+        while True:
+            chunk = file.read(size)
+            if not chunk:
+                break
+            self.reads.append(len(chunk))
+            self.data += chunk
+        self.rowcount = self.data.count(b'\n')
+
+
+@pytest.fixture
+def data_files(tmp_path, monkeypatch):
+    #copy_file appends to the run log in data/metrics/
+    monkeypatch.chdir(tmp_path)
+    tsv_path = str(tmp_path / 'batting.tsv.gz')
+    ROWS.to_csv(tsv_path, sep='\t', index=False, compression='gzip')
+    parquet_path = str(tmp_path / 'batting.parquet')
+    ROWS.to_parquet(parquet_path, index=False)
+
+    return {'tsv': tsv_path, 'parquet': parquet_path}
+
+def parse_copy_data(data: bytes) -> list:
+    """Parses the data of a COPY ... CSV Header DELIMITER E'\t' statement into rows, without the header"""
+
+    reader = csv.reader(io.StringIO(data.decode()), delimiter='\t')
+    next(reader)
+
+    return list(reader)
+
+def test_stdin_copy_statement():
+
+    statement = create_stdin_copy_statement('lahman.batting', ['playerID', 'HR'])
+
+    assert statement.split()[:4] == ['copy', 'lahman.batting', '("playerid",', '"hr")']
+    assert 'from stdin' in statement
+    assert "CSV Header DELIMITER E'\t'" in statement
+
+@pytest.mark.parametrize('file_format', ['tsv', 'parquet'])
+def test_copy_file_streams_rows(data_files, file_format):
+
+    cur = FakeCursor()
+    copy_file(cur, create_stdin_copy_statement('lahman.batting'), data_files[file_format], copy_from='stdin')
+
+    assert len(cur.statements) == 1 and 'from stdin' in cur.statements[0]
+    assert all(read <= COPY_BUFFER_SIZE for read in cur.reads)
+    rows = parse_copy_data(cur.data)
+    assert [row[0] for row in rows] == ['aaronha01', 'o"neilpa01', 'tab\there', 'line\nbreak', '', '']
+    assert [row[1] for row in rows] == ['755', '0', '1', '2', '3', '']
+
+@pytest.mark.parametrize('file_format', ['tsv', 'parquet'])
+def test_copy_file_null_and_empty_string(data_files, file_format):
+    """postgres reads an unquoted empty field as NULL and a quoted one as the empty string"""
+
+    cur = FakeCursor()
+    copy_file(cur, create_stdin_copy_statement('lahman.batting'), data_files[file_format], copy_from='stdin')
+
+    lines = cur.data.split(b'\n')
+    assert lines[-2] == b'\t'
+    if file_format == 'parquet':
+        assert lines[-3].startswith(b'""\t')
+    assert b'"o""neilpa01"' in cur.data
+
+def test_copy_file_into_postgres(data_files, tmp_path):
+    """Loads both files into a temporary database, the stand in for a remote server"""
+
+    pgserver = pytest.importorskip('pgserver')
+    psycopg2 = pytest.importorskip('psycopg2')
+
+    server = pgserver.get_server(str(tmp_path / 'pgdata'), cleanup_mode='stop')
+    conn = psycopg2.connect(server.get_uri())
+    try:
+        cur = conn.cursor()
+        for file_format, path in data_files.items():
+            table_name = f"batting_{file_format}"
+            cur.execute(f"create table {table_name} (playerid varchar, hr integer)")
+            copy_file(cur, create_stdin_copy_statement(table_name), path, copy_from='stdin')
+            assert cur.rowcount == len(ROWS)
+
+            cur.execute(f"select hr, playerid from {table_name}")
+            players = dict(cur.fetchall())
+            assert players[755] == 'aaronha01' and players[0] == 'o"neilpa01'
+            assert players[1] == 'tab\there' and players[2] == 'line\nbreak'
+            assert players[None] is None
+            #tsv files written by pandas do not quote empty strings, so they are read as NULL
+            assert players[3] == ('' if file_format == 'parquet' else None)
+        conn.rollback()
+    finally:
+        conn.close()
+        server.cleanup()